@@ -0,0 +1,120 @@
+# bench_batch_server.py
+# Local load generator: micro-batching server vs the one-shot bridge process per request
+#
+#   python bench_batch_server.py --requests 5000 --concurrency 200
+#
+# Reports throughput and p50/p99 latency for both paths. The one-shot path
+# spawns `python rpi_api_bridge.py` per request exactly like the API routes do,
+# so it is run with far fewer requests.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+
+from fence_batch_server import MicroBatchingFenceServer
+
+FEATURE_MEANS = [150.0, 0.7, 220.0, 0.85, 0.65, 4.4]
+FEATURE_STDS = [50.0, 0.2, 60.0, 0.05, 0.1, 1.0]
+FEATURE_NAMES = ['active_power', 'current_rms', 'impedance_magnitude',
+                 'power_factor', 'load_classification_score', 'impedance_ratio']
+
+
+def make_requests(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.normal(FEATURE_MEANS, FEATURE_STDS, (n, len(FEATURE_NAMES)))
+    return [dict(zip(FEATURE_NAMES, row)) for row in rows.tolist()]
+
+
+def summarize(name, latencies, elapsed, shed=0, errors=0):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'path': name,
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'shed': shed,
+        'errors': errors
+    }
+
+
+async def run_load(call, requests, concurrency):
+    """Closed-loop load: `concurrency` clients issue requests back to back"""
+    latencies = []
+    responses = []
+    cursor = iter(requests)
+
+    async def client():
+        for features in cursor:
+            start = time.perf_counter()
+            response = await call(features)
+            latencies.append(time.perf_counter() - start)
+            responses.append(response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, responses, time.perf_counter() - start
+
+
+async def bench_micro_batching(args, requests):
+    server = MicroBatchingFenceServer(
+        model_dir=args.model_dir,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue_depth=args.max_queue_depth,
+        workers=args.workers,
+        executor=args.executor
+    )
+    await server.start()
+    try:
+        latencies, responses, elapsed = await run_load(server.predict, requests, args.concurrency)
+    finally:
+        await server.stop()
+
+    report = summarize('micro_batching', latencies, elapsed,
+                       shed=sum(1 for r in responses if r.get('shed')),
+                       errors=sum(1 for r in responses if 'error' in r and not r.get('shed')))
+    report['mean_batch_size'] = server.stats['batched_requests'] / max(1, server.stats['batches'])
+    return report
+
+
+async def bench_one_shot(args, requests):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rpi_api_bridge.py')
+
+    command = [sys.executable, script] + (['--model-dir', args.model_dir] if args.model_dir else [])
+
+    async def call(features):
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate(json.dumps(features).encode('utf-8'))
+        return json.loads(stdout)
+
+    latencies, responses, elapsed = await run_load(call, requests, min(args.concurrency, os.cpu_count() or 1))
+    return summarize('one_shot_process', latencies, elapsed,
+                     errors=sum(1 for r in responses if 'error' in r))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test for the micro-batching fence server')
+    parser.add_argument('--model-dir', metavar='DIR')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--one-shot-requests', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--max-queue-depth', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--executor', choices=('thread', 'process'), default='thread')
+    args = parser.parse_args()
+
+    results = [asyncio.run(bench_micro_batching(args, make_requests(args.requests)))]
+    if args.one_shot_requests:
+        results.append(asyncio.run(bench_one_shot(args, make_requests(args.one_shot_requests, seed=1))))
+    print(json.dumps(results, indent=2))
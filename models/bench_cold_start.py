@@ -0,0 +1,112 @@
+# bench_cold_start.py
+# Cold-start benchmark for VoltageSpikePredictionModel: import + load + first prediction
+#
+# Each path runs in a fresh interpreter so module imports are really cold.
+#   full:  import predictive_model and TensorFlow, load RF + LSTM + IsolationForest
+#   light: load_inference_model (RF + IsolationForest only, TensorFlow never imported)
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+SAMPLE = {
+    'voltage': 245, 'current': 18, 'frequency': 49.8, 'impedance': 65,
+    'power_factor': 0.82, 'temperature': 30, 'humidity': 70,
+    'time_hour': 14, 'time_minute': 30, 'day_of_week': 2
+}
+
+CHILD = r'''
+import json, os, resource, sys, time
+sys.path.insert(0, {script_dir!r})
+mode, model_dir, sample = {mode!r}, {model_dir!r}, {sample!r}
+stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+
+start = time.perf_counter()
+import predictive_model
+if mode == 'full':
+    import tensorflow
+imported = time.perf_counter()
+
+if mode == 'full':
+    model = predictive_model.VoltageSpikePredictionModel()
+    model.load_models(model_dir)
+    model.lstm_model = predictive_model._keras().models.load_model(model.lstm_path)
+else:
+    model = predictive_model.load_inference_model(model_dir)
+loaded = time.perf_counter()
+
+result = model.predict_voltage_spike(sample)
+predicted = time.perf_counter()
+
+stdout.write(json.dumps({{
+    'import_s': imported - start,
+    'load_s': loaded - imported,
+    'first_prediction_s': predicted - loaded,
+    'total_s': predicted - start,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'tensorflow_imported': 'tensorflow' in sys.modules,
+    'ok': 'error' not in result
+}}))
+'''
+
+
+def prepare_models(model_dir, with_lstm):
+    """Train a small model set so the benchmark has something to load"""
+    from predictive_model import VoltageSpikePredictionModel
+
+    model = VoltageSpikePredictionModel()
+    df = model.generate_training_data(samples=2000)
+    model.train_random_forest_model(df)
+    model.train_anomaly_detector(df)
+    if with_lstm:
+        model.train_lstm_model(df)
+    model.save_models(model_dir)
+
+
+def run_path(mode, model_dir, repeats):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    code = CHILD.format(script_dir=script_dir, mode=mode, model_dir=model_dir, sample=SAMPLE)
+
+    runs = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        if completed.returncode != 0:
+            return {'error': completed.stderr.strip().splitlines()[-1]}
+        runs.append(json.loads(completed.stdout))
+
+    summary = {key: float(np.median([run[key] for run in runs]))
+               for key in ('import_s', 'load_s', 'first_prediction_s', 'total_s', 'peak_rss_mb')}
+    summary['tensorflow_imported'] = runs[0]['tensorflow_imported']
+    summary['ok'] = all(run['ok'] for run in runs)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cold-start benchmark for the voltage spike models')
+    parser.add_argument('--model-dir', help='directory written by save_models (trained on the fly if omitted)')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        import tensorflow  # noqa: F401
+        has_tensorflow = True
+    except ImportError:
+        has_tensorflow = False
+
+    model_dir = args.model_dir
+    if model_dir is None:
+        model_dir = tempfile.mkdtemp(prefix='spike_models_')
+        print(f"Training benchmark models into {model_dir}...")
+        prepare_models(model_dir, with_lstm=has_tensorflow)
+
+    report = {
+        'model_dir': model_dir,
+        'light': run_path('light', model_dir, args.repeats),
+        'full': run_path('full', model_dir, args.repeats) if has_tensorflow
+                else {'error': 'TensorFlow is not installed'}
+    }
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,122 @@
+# bench_forecast.py
+# LSTM (autoregressive) vs direct multi-horizon forecaster: latency, memory and accuracy
+#
+# Both engines are trained on the same generated data and evaluated on windows
+# from a second, independently seeded dataset. Each engine is loaded and timed
+# in a fresh process so peak RSS includes its framework imports.
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+import numpy as np
+
+CHILD = r'''
+import json, os, resource, sys, time
+import numpy as np
+sys.path.insert(0, {script_dir!r})
+engine, model_dir, windows_path, fleet = {engine!r}, {model_dir!r}, {windows_path!r}, {fleet!r}
+stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+
+start = time.perf_counter()
+import predictive_model
+model = predictive_model.VoltageSpikePredictionModel()
+model.load_models(model_dir, components=('lstm', 'direct'))
+model.forecast_engine = engine
+loaded = time.perf_counter()
+
+data = np.load(windows_path)
+histories, targets = data['histories'], data['targets']
+
+first = time.perf_counter()
+model.forecast_voltage_batch(histories[:1])
+first_s = time.perf_counter() - first
+
+single = []
+for i in range(20):
+    t = time.perf_counter()
+    model.forecast_voltage_batch(histories[i:i + 1])
+    single.append(time.perf_counter() - t)
+
+t = time.perf_counter()
+model.forecast_voltage_batch(histories[:fleet])
+fleet_s = time.perf_counter() - t
+
+predicted = model.forecast_voltage_batch(histories)
+errors = np.abs(predicted - targets)
+
+stdout.write(json.dumps({{
+    'load_s': loaded - start,
+    'first_forecast_s': first_s,
+    'single_feeder_ms': float(np.median(single) * 1000),
+    'fleet_ms': fleet_s * 1000,
+    'fleet_size': int(min(fleet, len(histories))),
+    'mae_v': float(errors.mean()),
+    'mae_by_step_v': errors.mean(axis=0).round(3).tolist(),
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'tensorflow_imported': 'tensorflow' in sys.modules
+}}))
+'''
+
+
+def evaluation_windows(df, window=24, horizon=24, stride=24):
+    """(history, next `horizon` voltages) pairs from a held-out DataFrame"""
+    from sequence_windows import window_views
+
+    histories, targets = window_views(df['voltage'].values.astype(np.float64), window, horizon)
+    return np.ascontiguousarray(histories[::stride]), np.ascontiguousarray(targets[::stride])
+
+
+def run_engine(engine, model_dir, windows_path, fleet):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    code = CHILD.format(script_dir=script_dir, engine=engine, model_dir=model_dir,
+                        windows_path=windows_path, fleet=fleet)
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'error': completed.stderr.strip().splitlines()[-1]}
+    return json.loads(completed.stdout)
+
+
+if __name__ == "__main__":
+    from predictive_model import VoltageSpikePredictionModel
+
+    parser = argparse.ArgumentParser(description='Compare the LSTM and direct voltage forecasters')
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--fleet', type=int, default=500, help='feeders forecast in one batch')
+    parser.add_argument('--epochs', type=int, default=10, help='LSTM training epochs')
+    args = parser.parse_args()
+
+    try:
+        import tensorflow  # noqa: F401
+        has_tensorflow = True
+    except ImportError:
+        has_tensorflow = False
+
+    base_date = datetime(2024, 1, 1)
+    model = VoltageSpikePredictionModel()
+    train_df = model.generate_training_data(args.samples, seed=42, base_date=base_date)
+    test_df = model.generate_training_data(args.samples // 2, seed=7, base_date=base_date)
+
+    model.train_forecast_model(train_df, engine='direct')
+    if has_tensorflow:
+        model.train_forecast_model(train_df, engine='lstm', epochs=args.epochs)
+
+    model_dir = tempfile.mkdtemp(prefix='forecast_models_')
+    model.save_models(model_dir)
+
+    histories, targets = evaluation_windows(test_df)
+    windows_path = os.path.join(model_dir, 'eval_windows.npz')
+    np.savez(windows_path, histories=histories, targets=targets)
+
+    report = {
+        'samples': args.samples,
+        'evaluation_windows': len(histories),
+        'persistence_mae_v': float(np.abs(targets - histories[:, -1:]).mean()),
+        'direct': run_engine('direct', model_dir, windows_path, args.fleet),
+        'lstm': run_engine('lstm', model_dir, windows_path, args.fleet) if has_tensorflow
+                else {'error': 'TensorFlow is not installed'}
+    }
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,121 @@
+# bench_tdr_anomalies.py
+# Per-sweep detect_anomalies loop vs detect_anomalies_batch over sweep stacks
+#
+# The reference is the previous detect_anomalies: one savgol pass per array,
+# unused gradients, a find_peaks call and a Python classification loop per
+# sweep. Both paths must report the same anomalies (timestamps aside; the 2-D
+# savgol pass may differ from the 1-D one in the last bit).
+#
+#   python bench_tdr_anomalies.py --lengths 2000,20000,200000 --counts 1,16,256
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import scipy.signal as signal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tdr_analysis import AdvancedTDRAnalyzer, TDRConfiguration
+
+
+def reference_detect_anomalies(analyzer, distance, impedance, reflection_response):
+    """The previous per-sweep implementation, as (distance, reflection, impedance, confidence, type) tuples"""
+    anomalies = []
+    smoothed_impedance = signal.savgol_filter(impedance, window_length=21, polyorder=3)
+    smoothed_response = signal.savgol_filter(reflection_response, window_length=21, polyorder=3)
+    impedance_gradient = np.gradient(smoothed_impedance)
+    response_gradient = np.gradient(smoothed_response)  # noqa: F841
+    impedance_threshold = 2 * np.std(impedance_gradient)  # noqa: F841
+    response_threshold = 0.1 * np.max(smoothed_response)
+    peaks, properties = signal.find_peaks(
+        np.abs(smoothed_response), height=response_threshold, distance=int(0.1 * len(smoothed_response)))
+    for peak_idx in peaks:
+        if peak_idx < len(distance):
+            peak_impedance = smoothed_impedance[peak_idx]
+            prominence = properties['peak_heights'][np.where(peaks == peak_idx)[0][0]]
+            confidence = min(0.99, prominence / np.max(smoothed_response) * 2)
+            impedance_change = peak_impedance - analyzer.baseline_impedance
+            if impedance_change < -20:
+                anomaly_type = "ILLEGAL_FENCE_CONNECTION"
+            elif impedance_change > 50:
+                anomaly_type = "OPEN_CIRCUIT"
+            elif abs(impedance_change) > 30:
+                anomaly_type = "IMPEDANCE_MISMATCH"
+            else:
+                anomaly_type = "MINOR_REFLECTION"
+            if confidence > 0.7 and abs(impedance_change) > 15:
+                anomalies.append((float(distance[peak_idx]), float(smoothed_response[peak_idx]),
+                                  float(peak_impedance), float(confidence), anomaly_type))
+    return anomalies
+
+
+def make_sweeps(analyzer, n_sweeps, n_samples, seed=0):
+    """Noisy sweeps with 0-3 fence taps each, plus their impedance profiles"""
+    rng = np.random.default_rng(seed)
+    dt = 1 / analyzer.config.sampling_rate
+    time_base = np.arange(n_samples) * dt
+    span = n_samples * dt * 3e8 * analyzer.config.cable_velocity_factor / 2
+
+    pulse = np.zeros(n_samples)
+    pulse[:20] = analyzer.config.pulse_amplitude * np.hanning(20)
+    responses = np.tile(pulse, (n_sweeps, 1)) + rng.normal(0, 0.05, (n_sweeps, n_samples))
+    for row in range(n_sweeps):
+        for tap in rng.uniform(0.05, 0.95, rng.integers(0, 4)) * span:
+            start = int(2 * tap / (3e8 * analyzer.config.cable_velocity_factor) / dt)
+            stop = min(start + 20, n_samples)
+            responses[row, start:stop] += rng.uniform(-3, 3) * pulse[:stop - start]
+
+    profiles = [analyzer.calculate_impedance_profile(response, time_base) for response in responses]
+    return profiles[0][0], np.array([z for _, z in profiles]), responses
+
+
+def bench(analyzer, n_sweeps, n_samples, repeats):
+    distance, impedance, responses = make_sweeps(analyzer, n_sweeps, n_samples)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        expected = [reference_detect_anomalies(analyzer, distance, z, r) for z, r in zip(impedance, responses)]
+    loop_s = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        batched = analyzer.detect_anomalies_batch(distance, impedance, responses)
+    batch_s = (time.perf_counter() - start) / repeats
+
+    got = [[(a.distance, a.reflection_coefficient, a.impedance, a.confidence, a.anomaly_type) for a in sweep]
+           for sweep in batched]
+    return {
+        'sweeps': n_sweeps,
+        'samples': n_samples,
+        'anomalies': sum(len(sweep) for sweep in expected),
+        'loop_ms': loop_s * 1000,
+        'batch_ms': batch_s * 1000,
+        'speedup': loop_s / batch_s,
+        'matches': _same(got, expected)
+    }
+
+
+def _same(got, expected):
+    return len(got) == len(expected) and all(
+        len(a) == len(b) and all(x[4] == y[4] and np.allclose(x[:4], y[:4], rtol=1e-12, atol=0)
+                                 for x, y in zip(a, b))
+        for a, b in zip(got, expected))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark batched TDR anomaly detection')
+    parser.add_argument('--lengths', default='2000,20000,200000', help='samples per sweep')
+    parser.add_argument('--counts', default='1,16,256', help='sweeps per stack')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    analyzer = AdvancedTDRAnalyzer(TDRConfiguration(sampling_rate=1e9))
+    print(f"{'sweeps':>7} {'samples':>8} {'anomalies':>9} {'loop ms':>10} {'batch ms':>10} {'speedup':>8}  matches")
+    for n_samples in map(int, args.lengths.split(',')):
+        for n_sweeps in map(int, args.counts.split(',')):
+            if n_sweeps * n_samples > 2e7:
+                continue  # keep the stacks in memory
+            r = bench(analyzer, n_sweeps, n_samples, args.repeats)
+            print(f"{r['sweeps']:>7} {r['samples']:>8} {r['anomalies']:>9} {r['loop_ms']:>10.2f} "
+                  f"{r['batch_ms']:>10.2f} {r['speedup']:>7.1f}x  {r['matches']}")
@@ -0,0 +1,340 @@
+# feature_store.py
+# Per-feeder streaming state for the voltage spike RF features
+#
+# prepare_features computes lag and rolling features with pandas over the whole
+# history. FeederFeatureStore keeps just enough state per feeder to produce the
+# same 20 columns one reading at a time:
+#   *_lag1 / *_lag5     ring buffer of the last 5 voltage/current/frequency values
+#   impedance_change    sample std over the last 5 impedances, updated with a
+#                       sliding-window Welford step
+# Missing lags at the start of a feeder's history are filled with the feeder's
+# running mean (prepare_features fills them with the mean of the whole frame).
+# Every update is O(1) in time and memory per feeder; a polling cycle of many
+# feeders is updated with vectorized array operations, and a long run of one
+# feeder's readings (a training shard) with extend().
+
+import os
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+BASE_COLUMNS = [
+    'voltage', 'current', 'frequency', 'impedance',
+    'power_factor', 'temperature', 'humidity',
+    'time_hour', 'time_minute', 'day_of_week'
+]
+ENGINEERED_COLUMNS = [
+    'voltage_current_ratio', 'impedance_change', 'frequency_deviation',
+    'power_quality_index', 'voltage_lag1', 'current_lag1', 'frequency_lag1',
+    'voltage_lag5', 'current_lag5', 'frequency_lag5'
+]
+# Column order of the RF input matrix (train_random_forest_model)
+RF_FEATURE_COLUMNS = BASE_COLUMNS + ENGINEERED_COLUMNS
+
+# Values for fields missing from a reading: the nominal operating point for the
+# electrical fields (so ratios and lags stay finite), 0 otherwise
+FIELD_DEFAULTS = {'voltage': 230.0, 'current': 15.0, 'frequency': 50.0, 'power_factor': 0.85}
+
+LAG_COLUMNS = ('voltage', 'current', 'frequency')
+LAG_DEPTH = 5         # ring length; covers lag1 and lag5
+ROLLING_WINDOW = 5    # impedance_change window
+
+_LAG_INDEX = [BASE_COLUMNS.index(col) for col in LAG_COLUMNS]
+_IMPEDANCE = BASE_COLUMNS.index('impedance')
+_VOLTAGE = BASE_COLUMNS.index('voltage')
+_CURRENT = BASE_COLUMNS.index('current')
+_FREQUENCY = BASE_COLUMNS.index('frequency')
+_POWER_FACTOR = BASE_COLUMNS.index('power_factor')
+
+
+def slot_key(key):
+    """numpy scalars (e.g. IDs taken from a DataFrame) as Python values, so snapshots can JSON them"""
+    if isinstance(key, np.generic):
+        return key.item()
+    if isinstance(key, tuple):
+        return tuple(part.item() if isinstance(part, np.generic) else part for part in key)
+    return key
+
+
+def dump_slot_keys(slots):
+    """JSON list of the keys of an ID -> slot index dict, in slot order"""
+    return json.dumps(sorted(slots, key=slots.get))
+
+
+def load_slot_keys(text):
+    """ID -> slot index dict from dump_slot_keys output"""
+    # JSON turns tuple keys into lists
+    return {tuple(key) if isinstance(key, list) else key: i for i, key in enumerate(json.loads(text))}
+
+
+def _fill_engineered(features, base, impedance_std, lag1, lag5):
+    """Write the engineered columns of RF_FEATURE_COLUMNS into features"""
+    voltage = base[:, _VOLTAGE]
+    current = base[:, _CURRENT]
+    frequency_deviation = np.abs(base[:, _FREQUENCY] - 50)
+    offset = len(BASE_COLUMNS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features[:, offset] = voltage / current
+    features[:, offset + 1] = impedance_std
+    features[:, offset + 2] = frequency_deviation
+    features[:, offset + 3] = base[:, _POWER_FACTOR] * (1 - frequency_deviation / 50)
+    features[:, offset + 4:offset + 7] = lag1
+    features[:, offset + 7:offset + 10] = lag5
+    return features
+
+
+class FeederFeatureStore:
+    """
+    Streaming lag/rolling feature state keyed by feeder ID
+
+    State lives in per-slot NumPy arrays (one slot per feeder) that grow by
+    doubling, so memory is a fixed ~200 bytes per feeder regardless of history.
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, capacity=64):
+        self.slots = {}  # feeder ID -> slot index
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.lag_ring = np.zeros((capacity, len(LAG_COLUMNS), LAG_DEPTH))
+        self.lag_mean = np.zeros((capacity, len(LAG_COLUMNS)))
+        self.impedance_ring = np.zeros((capacity, ROLLING_WINDOW))
+        self.impedance_mean = np.zeros(capacity)
+        self.impedance_m2 = np.zeros(capacity)
+
+    def _grow(self, needed):
+        capacity = len(self.count)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        old = (self.count, self.lag_ring, self.lag_mean, self.impedance_ring,
+               self.impedance_mean, self.impedance_m2)
+        self._allocate(new_capacity)
+        for new, previous in zip((self.count, self.lag_ring, self.lag_mean, self.impedance_ring,
+                                  self.impedance_mean, self.impedance_m2), old):
+            new[:capacity] = previous
+
+    def _slots_for(self, feeder_ids):
+        slots = np.empty(len(feeder_ids), dtype=np.intp)
+        for i, feeder in enumerate(feeder_ids):
+            slot = self.slots.get(feeder)
+            if slot is None:
+                slot = self.slots[slot_key(feeder)] = len(self.slots)
+            slots[i] = slot
+        self._grow(len(self.slots))
+        return slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, feeder_id):
+        return feeder_id in self.slots
+
+    @staticmethod
+    def base_matrix(readings):
+        """(N, 10) float64 BASE_COLUMNS matrix from a list of dicts, DataFrame, structured array or dict of arrays"""
+        if isinstance(readings, (list, tuple)):
+            return np.array([[reading.get(col, FIELD_DEFAULTS.get(col, 0)) for col in BASE_COLUMNS]
+                             for reading in readings],
+                            dtype=np.float64).reshape(-1, len(BASE_COLUMNS))
+        names = (readings.dtype.names or ()) if isinstance(readings, np.ndarray) else readings.keys()
+        if isinstance(readings, dict):
+            n = len(next(iter(readings.values()))) if readings else 0
+        else:
+            n = len(readings)
+        return np.column_stack([
+            np.asarray(readings[col], dtype=np.float64) if col in names
+            else np.full(n, FIELD_DEFAULTS.get(col, 0.0))
+            for col in BASE_COLUMNS
+        ]) if n else np.empty((0, len(BASE_COLUMNS)))
+
+    def update(self, feeder_id, reading):
+        """
+        Push one reading and return its 20 RF features
+
+        Args:
+            feeder_id: hashable feeder key
+            reading: dict with BASE_COLUMNS keys (missing ones take FIELD_DEFAULTS)
+
+        Returns:
+            (20,) float64 array in RF_FEATURE_COLUMNS order
+        """
+        base = np.array([[reading.get(col, FIELD_DEFAULTS.get(col, 0)) for col in BASE_COLUMNS]],
+                        dtype=np.float64)
+        return self.update_many([feeder_id], base)[0]
+
+    def update_many(self, feeder_ids, readings):
+        """
+        Push a batch of readings (oldest first) and return their RF features
+
+        Readings of different feeders are processed together; repeated
+        readings of one feeder are applied in order.
+
+        Args:
+            feeder_ids: sequence of N feeder keys
+            readings: (N, 10) BASE_COLUMNS matrix, or anything base_matrix accepts
+
+        Returns:
+            (N, 20) float64 array in RF_FEATURE_COLUMNS order
+        """
+        if not (isinstance(readings, np.ndarray) and readings.dtype.names is None):
+            readings = self.base_matrix(readings)
+        readings = np.asarray(readings, dtype=np.float64)
+        slots = self._slots_for(feeder_ids)
+        features = np.empty((len(slots), len(RF_FEATURE_COLUMNS)))
+
+        # A feeder can appear several times per batch; each round takes at most
+        # one reading per feeder, in arrival order
+        order = np.argsort(slots, kind='stable')
+        sorted_slots = slots[order]
+        first = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+        occurrence = np.empty(len(slots), dtype=np.intp)
+        occurrence[order] = np.arange(len(slots)) - np.repeat(first, np.diff(np.r_[first, len(slots)]))
+
+        for rank in range(int(occurrence.max()) + 1 if len(slots) else 0):
+            rows = np.flatnonzero(occurrence == rank)
+            features[rows] = self._step(slots[rows], readings[rows])
+        return features
+
+    def _step(self, slots, base):
+        n = len(slots)
+        count = self.count[slots]
+        features = np.empty((n, len(RF_FEATURE_COLUMNS)))
+        features[:, :len(BASE_COLUMNS)] = base
+
+        # Running means (fill values for lags not yet available), including this reading
+        lag_values = base[:, _LAG_INDEX]
+        lag_mean = self.lag_mean[slots] + (lag_values - self.lag_mean[slots]) / (count + 1)[:, np.newaxis]
+        self.lag_mean[slots] = lag_mean
+
+        # Lags read before this reading enters the ring
+        ring = self.lag_ring[slots]
+        position = count % LAG_DEPTH
+        lag1 = np.where((count >= 1)[:, np.newaxis],
+                        ring[np.arange(n), :, (count - 1) % LAG_DEPTH], lag_mean)
+        lag5 = np.where((count >= LAG_DEPTH)[:, np.newaxis],
+                        ring[np.arange(n), :, position], lag_mean)
+        ring[np.arange(n), :, position] = lag_values
+        self.lag_ring[slots] = ring
+
+        # Sliding-window Welford update of the impedance mean and M2
+        impedance = base[:, _IMPEDANCE]
+        window_ring = self.impedance_ring[slots]
+        mean = self.impedance_mean[slots]
+        m2 = self.impedance_m2[slots]
+        filling = count < ROLLING_WINDOW
+        window_position = count % ROLLING_WINDOW
+
+        # Growing window: standard Welford add
+        size = np.minimum(count + 1, ROLLING_WINDOW)
+        delta = impedance - mean
+        grow_mean = mean + delta / size
+        grow_m2 = m2 + delta * (impedance - grow_mean)
+
+        # Full window: replace the oldest value
+        oldest = window_ring[np.arange(n), window_position]
+        slide_mean = mean + (impedance - oldest) / ROLLING_WINDOW
+        slide_m2 = m2 + (impedance - oldest) * (impedance - slide_mean + oldest - mean)
+
+        mean = np.where(filling, grow_mean, slide_mean)
+        m2 = np.maximum(np.where(filling, grow_m2, slide_m2), 0.0)
+        window_ring[np.arange(n), window_position] = impedance
+        self.impedance_ring[slots] = window_ring
+        self.impedance_mean[slots] = mean
+        self.impedance_m2[slots] = m2
+        self.count[slots] = count + 1
+
+        impedance_std = np.where(count + 1 >= ROLLING_WINDOW, np.sqrt(m2 / (ROLLING_WINDOW - 1)), 0.0)
+        return _fill_engineered(features, base, impedance_std, lag1, lag5)
+
+    def extend(self, feeder_id, readings):
+        """
+        Push a run of consecutive readings of one feeder (oldest first)
+
+        Same result as calling update() for every reading, computed with
+        whole-array shifts and a strided rolling std; used to stream long
+        histories (e.g. training shards) through the store chunk by chunk.
+
+        Returns:
+            (N, 20) float64 array in RF_FEATURE_COLUMNS order
+        """
+        if not (isinstance(readings, np.ndarray) and readings.dtype.names is None):
+            readings = self.base_matrix(readings)
+        base = np.asarray(readings, dtype=np.float64)
+        n = len(base)
+        features = np.empty((n, len(RF_FEATURE_COLUMNS)))
+        if n == 0:
+            return features
+
+        slot = self._slots_for([feeder_id])[0]
+        start = int(self.count[slot])
+        index = start + np.arange(n)  # position of each reading in the feeder's history
+
+        # Carried state as chronological tails, followed by the new readings
+        tail = min(start, LAG_DEPTH)
+        tail_positions = np.arange(start - tail, start) % LAG_DEPTH
+        lag_values = base[:, _LAG_INDEX]
+        lag_history = np.vstack([self.lag_ring[slot][:, tail_positions].T, lag_values])
+        impedance_history = np.concatenate([self.impedance_ring[slot][tail_positions], base[:, _IMPEDANCE]])
+        row = tail + np.arange(n)
+
+        # Running means, including each reading
+        lag_mean = (self.lag_mean[slot] * start + np.cumsum(lag_values, axis=0)) / (index + 1)[:, np.newaxis]
+        lag1 = np.where((index >= 1)[:, np.newaxis], lag_history[np.maximum(row - 1, 0)], lag_mean)
+        lag5 = np.where((index >= LAG_DEPTH)[:, np.newaxis], lag_history[np.maximum(row - LAG_DEPTH, 0)], lag_mean)
+
+        impedance_std = np.zeros(n)
+        if len(impedance_history) >= ROLLING_WINDOW:
+            rolling_std = sliding_window_view(impedance_history, ROLLING_WINDOW).std(axis=1, ddof=1)
+            full = index + 1 >= ROLLING_WINDOW
+            impedance_std[full] = rolling_std[row[full] - (ROLLING_WINDOW - 1)]
+
+        # Leave the state exactly as n update() calls would
+        end = start + n
+        kept = min(end, LAG_DEPTH)
+        kept_positions = np.arange(end - kept, end) % LAG_DEPTH
+        self.lag_ring[slot][:, kept_positions] = lag_history[-kept:].T
+        self.lag_mean[slot] = lag_mean[-1]
+        window = impedance_history[-min(end, ROLLING_WINDOW):]
+        self.impedance_ring[slot][kept_positions] = window
+        self.impedance_mean[slot] = window.mean()
+        self.impedance_m2[slot] = ((window - window.mean()) ** 2).sum()
+        self.count[slot] = end
+
+        features[:, :len(BASE_COLUMNS)] = base
+        return _fill_engineered(features, base, impedance_std, lag1, lag5)
+
+    def snapshot(self, path):
+        """Write the store to path (.npz) atomically"""
+        used = len(self.slots)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=self.SNAPSHOT_VERSION,
+                feeders=dump_slot_keys(self.slots),
+                count=self.count[:used],
+                lag_ring=self.lag_ring[:used],
+                lag_mean=self.lag_mean[:used],
+                impedance_ring=self.impedance_ring[:used],
+                impedance_mean=self.impedance_mean[:used],
+                impedance_m2=self.impedance_m2[:used]
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(cls, path):
+        """Load a store written by snapshot"""
+        with np.load(path) as data:
+            if int(data['version']) > cls.SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported feature store snapshot version: {int(data['version'])}")
+            slots = load_slot_keys(str(data['feeders']))
+            store = cls(capacity=max(len(slots), 1))
+            used = len(slots)
+            for name in ('count', 'lag_ring', 'lag_mean', 'impedance_ring', 'impedance_mean', 'impedance_m2'):
+                getattr(store, name)[:used] = data[name]
+        store.slots = slots
+        return store
@@ -0,0 +1,383 @@
+# fence_batch_server.py
+# Micro-batching asyncio front end for FenceDetectionBridge
+#
+# Concurrent predict requests are collected into micro-batches that are flushed
+# when max_batch_size requests are waiting or max_wait_ms has passed since the
+# first one arrived. Each batch is scored with one predict_fence_batch call on a
+# thread or process pool and the per-row results are fanned back out to the
+# waiting callers. When max_queue_depth requests are in flight (queued, being
+# collected into a batch, waiting for a worker or being scored), new requests
+# are shed immediately with an 'overloaded' response. Requests whose features
+# cannot be converted are rejected on their own before they join a batch.
+#
+# Run as a server speaking the rpi_api_bridge.py daemon protocol (NDJSON with
+# request ids) on a Unix domain socket:
+#   python fence_batch_server.py --socket /tmp/fence.sock
+
+import os
+import json
+import time
+import signal
+import asyncio
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from rpi_api_bridge import FenceDetectionBridge
+from fence_features import build_feature_matrix
+from prediction_cache import PredictionCache
+from inference_metrics import InferenceMetrics, resolve as resolve_metrics
+
+# Per-process bridge for the process pool executor
+_worker_bridge = None
+
+
+def _make_bridge(model_dir, cache_options, metrics=None):
+    cache = PredictionCache(**cache_options) if cache_options else None
+    return FenceDetectionBridge(model_dir, cache=cache, metrics=metrics)
+
+
+def _init_worker(model_dir, cache_options):
+    global _worker_bridge
+    _worker_bridge = _make_bridge(model_dir, cache_options)
+
+
+def _score_in_worker(rows):
+    return _worker_bridge.predict_fence_batch(rows)
+
+
+class MicroBatchingFenceServer:
+    def __init__(self, model_dir=None, max_batch_size=64, max_wait_ms=5.0,
+                 max_queue_depth=1024, workers=1, executor='thread', cache_options=None,
+                 metrics=None):
+        self.model_dir = model_dir
+        # Queue wait and batch stages; with the thread executor the bridge records
+        # into the same registry (process workers keep their own, unexported)
+        self.metrics = resolve_metrics(metrics)
+        self.cache_options = cache_options  # PredictionCache kwargs, one cache per bridge
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_depth = max_queue_depth
+        self.workers = workers
+        self.executor_kind = executor
+
+        self.bridge = None
+        self.executor = None
+        self._queue = None
+        self._batcher = None
+        self._slots = None
+        self._running_batches = set()
+        self.in_flight = 0  # accepted requests not yet answered
+        self.stats = {'requests': 0, 'shed': 0, 'rejected': 0, 'batches': 0, 'batched_requests': 0,
+                      'errors': 0}
+
+    async def start(self):
+        """Load the models and start collecting batches"""
+        loop = asyncio.get_running_loop()
+
+        if self.executor_kind == 'process':
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                initargs=(self.model_dir, self.cache_options))
+            self.bridge = FenceDetectionBridge(self.model_dir)  # health/metadata only
+        elif self.executor_kind == 'thread':
+            self.executor = ThreadPoolExecutor(self.workers)
+            self.bridge = await loop.run_in_executor(self.executor, _make_bridge,
+                                                     self.model_dir, self.cache_options, self.metrics)
+        else:
+            raise ValueError(f"Unknown executor: {self.executor_kind}")
+
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def stop(self):
+        """Finish queued and running batches, then release the pool"""
+        if self._batcher is not None:
+            await self._queue.put(None)
+            await self._batcher
+            self._batcher = None
+        if self._running_batches:
+            await asyncio.gather(*self._running_batches)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def predict(self, tdr_features):
+        """
+        Score one measurement as part of the next micro-batch
+
+        Args:
+            tdr_features: dict with keys matching essential_features
+
+        Returns:
+            dict with prediction results, an 'overloaded' response when
+            max_queue_depth requests are in flight, or an error response when
+            tdr_features cannot be converted to a feature row
+        """
+        self.stats['requests'] += 1
+
+        # One malformed request would otherwise fail the whole micro-batch
+        error = self._invalid(tdr_features)
+        if error is not None:
+            self.stats['rejected'] += 1
+            self.metrics.increment('errors', stage='batch_server.request')
+            return {
+                'error': error,
+                'is_fence': None,
+                'confidence': None,
+                'timestamp': datetime.now().isoformat()
+            }
+
+        if self.in_flight >= self.max_queue_depth:
+            self.stats['shed'] += 1
+            self.metrics.increment('shed')
+            # No verdict: a client that ignores 'error' must not read this as "no fence"
+            return {
+                'error': 'overloaded',
+                'shed': True,
+                'is_fence': None,
+                'confidence': None,
+                'queue_depth': self.in_flight,
+                'timestamp': datetime.now().isoformat()
+            }
+
+        self.in_flight += 1  # released when _run_batch fans the result out
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((tdr_features, future, time.perf_counter()))
+        return await future
+
+    def _invalid(self, tdr_features):
+        """Why tdr_features cannot be scored, or None (checked as predict_fence_batch converts it)"""
+        if not isinstance(tdr_features, dict):
+            return 'Features must be a JSON object'
+        essential_features = self.bridge.essential_features if self.bridge is not None else None
+        if essential_features is None:
+            return None  # no model yet; the batch reports 'Models not loaded'
+        try:
+            build_feature_matrix(tdr_features, essential_features, default=0)
+        except (TypeError, ValueError) as e:
+            return f'Invalid features: {e}'
+        return None
+
+    def health(self):
+        health = self.bridge.health() if self.bridge is not None else {'status': 'starting'}
+        health.update({
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'in_flight': self.in_flight,
+            'max_queue_depth': self.max_queue_depth,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'stats': dict(self.stats)
+        })
+        return health
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    if self._queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # Wait for a free worker so batches keep growing while the pool is busy
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+
+            if stopping:
+                return
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        rows = [features for features, _, _ in batch]
+        dispatched = time.perf_counter()
+        raised = False
+
+        try:
+            if self.executor_kind == 'process':
+                result = await loop.run_in_executor(self.executor, _score_in_worker, rows)
+            else:
+                result = await loop.run_in_executor(self.executor, self.bridge.predict_fence_batch, rows)
+        except Exception as e:
+            raised = True
+            result = {'error': str(e), 'results': []}
+        finally:
+            self._slots.release()
+
+        self.stats['batches'] += 1
+        self.stats['batched_requests'] += len(batch)
+
+        if 'error' in result:
+            self.stats['errors'] += 1
+            # A returned error was already counted by the bridge when it shares our registry
+            if raised or self.executor_kind == 'process':
+                self.metrics.increment('errors', stage='batch_server.batch')
+        
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.observe('batch_server.batch', (time.perf_counter() - dispatched) * 1000)
+            metrics.increment('batches')
+
+        shared = {
+            'batch_size': len(batch),
+            'batch_inference_time_ms': result.get('timing_ms', {}).get('total', 0),
+            'timestamp': result.get('timestamp', datetime.now().isoformat()),
+            'model_version': result.get('model_version')
+        }
+        results = result.get('results', [])
+
+        self.in_flight -= len(batch)
+        for i, (_, future, enqueued) in enumerate(batch):
+            if future.cancelled():
+                continue
+            if i < len(results):
+                response = dict(results[i], **shared)
+            else:
+                response = dict(shared, error=result.get('error', 'Batch failed'),
+                                is_fence=None, confidence=None)
+            response['queue_wait_ms'] = (dispatched - enqueued) * 1000
+            metrics.observe('batch_server.queue_wait', response['queue_wait_ms'])
+            future.set_result(response)
+
+
+async def _handle_connection(server, stop_event, reader, writer):
+    """Daemon protocol over one connection; requests are batched across connections"""
+    lock = asyncio.Lock()
+    pending = set()
+
+    async def send(response):
+        async with lock:
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+            await writer.drain()
+
+    async def answer(request):
+        request_id = request.get('id')
+        features = request.get('features')
+        if features is None:
+            features = {k: v for k, v in request.items() if k not in ('id', 'op')}
+        response = await server.predict(features)
+        await send(dict(response, id=request_id))
+
+    await send(dict(server.health(), event='ready'))
+
+    while not reader.at_eof():
+        line = await reader.readline()
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            await send({'id': None, 'error': f'Invalid JSON: {e}'})
+            continue
+        if not isinstance(request, dict):
+            await send({'id': None, 'error': 'Request must be a JSON object'})
+            continue
+
+        op = request.get('op', 'predict')
+        if op == 'predict':
+            # Pipelined requests are answered as their batches complete
+            task = asyncio.create_task(answer(request))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        elif op == 'health':
+            await send(dict(server.health(), id=request.get('id')))
+        elif op == 'metrics':
+            if request.get('format') == 'prometheus':
+                await send({'id': request.get('id'), 'content_type': 'text/plain; version=0.0.4',
+                            'text': server.metrics.to_prometheus()})
+            else:
+                await send(dict(server.metrics.snapshot(), id=request.get('id')))
+        elif op == 'shutdown':
+            if pending:
+                await asyncio.gather(*pending)
+            await send({'id': request.get('id'), 'status': 'shutting_down'})
+            stop_event.set()
+            break
+        else:
+            await send({'id': request.get('id'), 'error': f'Unknown op: {op}'})
+
+    if pending:
+        await asyncio.gather(*pending)
+    writer.close()
+
+
+async def serve_unix(server, socket_path):
+    """Serve the daemon protocol on a Unix domain socket until shutdown or SIGTERM/SIGINT"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    await server.start()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    listener = await asyncio.start_unix_server(
+        lambda reader, writer: _handle_connection(server, stop_event, reader, writer),
+        path=socket_path
+    )
+    print(json.dumps(dict(server.health(), event='ready', socket=socket_path)), flush=True)
+
+    try:
+        await stop_event.wait()
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        await server.stop()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print(json.dumps({'event': 'stopped', 'stats': server.stats}), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Micro-batching fence detection server')
+    parser.add_argument('--socket', required=True, metavar='PATH')
+    parser.add_argument('--model-dir', metavar='DIR')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--max-queue-depth', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--executor', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--cache-size', type=int, default=10000,
+                        help='result cache entries per bridge (0 disables the cache)')
+    parser.add_argument('--cache-ttl', type=float, default=60.0)
+    parser.add_argument('--cache-quantization', type=int, metavar='LEVELS')
+    parser.add_argument('--metrics', action='store_true',
+                        help="record per-stage latencies and counters ('metrics' op)")
+    args = parser.parse_args()
+
+    batch_server = MicroBatchingFenceServer(
+        model_dir=args.model_dir,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue_depth=args.max_queue_depth,
+        workers=args.workers,
+        executor=args.executor,
+        cache_options={
+            'max_entries': args.cache_size,
+            'ttl_seconds': args.cache_ttl,
+            'quantization_levels': args.cache_quantization
+        } if args.cache_size > 0 else None,
+        metrics=InferenceMetrics() if args.metrics else None
+    )
+    asyncio.run(serve_unix(batch_server, args.socket))
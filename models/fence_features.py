@@ -0,0 +1,79 @@
+# fence_features.py
+# Feature matrix assembly shared by the fence detection bridge and the RPi detector
+
+import json
+import numpy as np
+
+DEFAULT_FENCE_THRESHOLD = 0.5  # when the config has no detection_thresholds
+
+
+def _iter_ndjson(stream):
+    """Yield one dict per non-empty line of an NDJSON string, bytes or file-like object"""
+    if isinstance(stream, bytes):
+        stream = stream.decode('utf-8')
+    lines = stream.splitlines() if isinstance(stream, str) else stream
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def build_feature_matrix(inputs, feature_names, default=None):
+    """
+    Build one contiguous float32 matrix from a batch of measurements
+
+    Args:
+        inputs: list of feature dicts, (N, len(feature_names)) array, or an NDJSON
+                string/bytes/file-like object with one feature dict per line
+        feature_names: column order expected by the scaler and model
+        default: value for missing features; None raises KeyError instead
+
+    Returns:
+        np.ndarray of shape (N, len(feature_names)), dtype float32, C-contiguous
+    """
+    n_features = len(feature_names)
+
+    if isinstance(inputs, np.ndarray):
+        matrix = np.ascontiguousarray(inputs, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.ndim != 2 or matrix.shape[1] != n_features:
+            raise ValueError(f"Expected array of shape (N, {n_features}), got {inputs.shape}")
+        return matrix
+
+    if isinstance(inputs, (str, bytes)) or hasattr(inputs, 'read'):
+        rows = list(_iter_ndjson(inputs))
+    elif isinstance(inputs, dict):
+        rows = [inputs]
+    else:
+        rows = list(inputs)
+        if rows and not isinstance(rows[0], dict):
+            return build_feature_matrix(np.asarray(rows), feature_names, default)
+
+    matrix = np.empty((len(rows), n_features), dtype=np.float32)
+    for j, feat in enumerate(feature_names):
+        if default is None:
+            matrix[:, j] = [row[feat] for row in rows]
+        else:
+            matrix[:, j] = [row.get(feat, default) for row in rows]
+
+    return matrix
+
+
+def fence_threshold(config):
+    """detection_thresholds.fence_confidence_threshold of an rpi_config.json dict"""
+    return (config or {}).get('detection_thresholds', {}).get('fence_confidence_threshold',
+                                                               DEFAULT_FENCE_THRESHOLD)
+
+
+def fence_labels(probabilities, threshold):
+    """
+    is_fence for fence-class probabilities (scalar or array)
+
+    The one labeling rule for single and batch predictions, so the same
+    measurement gets the same verdict whichever path scores it.
+    """
+    return np.asarray(probabilities) >= threshold
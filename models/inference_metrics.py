@@ -0,0 +1,223 @@
+# inference_metrics.py
+# Per-stage latency histograms, counters and memory high-water marks for the detection path
+#
+# Components time their stages with a monotonic clock:
+#   with metrics.stage('fence.predict'):
+#       probabilities = model.predict_proba(features)
+# and count events with metrics.increment('cache_hits'). Stages only time: the
+# code that handles a failure counts it, once, with increment('errors', stage=...).
+# A snapshot can be exported as Prometheus text exposition format or as JSON. A disabled
+# InferenceMetrics hands out one shared no-op context, so instrumented code
+# costs a method call per stage when metrics are off.
+
+import json
+import time
+import bisect
+import threading
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Histogram bucket upper bounds in milliseconds
+DEFAULT_BUCKETS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 1000.0)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, (time.perf_counter_ns() - self.start) / 1e6)
+        return False
+
+
+class _Histogram:
+    __slots__ = ('bucket_counts', 'count', 'sum', 'max')
+
+    def __init__(self, n_buckets):
+        self.bucket_counts = [0] * (n_buckets + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class InferenceMetrics:
+    """
+    Thread-safe metrics registry shared by the bridge, the RPi detector and the spike model
+
+    Args:
+        enabled: when False, stage() returns a shared no-op context and
+                 observe()/increment() return immediately
+        buckets_ms: histogram bucket upper bounds in milliseconds
+        namespace: prefix of the exported Prometheus metric names
+    """
+
+    def __init__(self, enabled=True, buckets_ms=DEFAULT_BUCKETS_MS, namespace='tdr'):
+        self.enabled = enabled
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self.namespace = namespace
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._peak_rss_bytes = 0
+
+    def stage(self, name):
+        """Context manager timing one stage into the histogram called name"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def observe(self, name, duration_ms):
+        if not self.enabled:
+            return
+        index = bisect.bisect_left(self.buckets_ms, duration_ms)
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram(len(self.buckets_ms))
+            histogram.bucket_counts[index] += 1
+            histogram.count += 1
+            histogram.sum += duration_ms
+            if duration_ms > histogram.max:
+                histogram.max = duration_ms
+
+    def increment(self, name, amount=1, **labels):
+        """Add amount to the counter called name (one series per distinct label set)"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def sample_memory(self):
+        """Record the process peak resident set size; returns it in bytes"""
+        if not self.enabled or resource is None:
+            return self._peak_rss_bytes
+        # ru_maxrss is already a high-water mark (KiB on Linux)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        with self._lock:
+            self._peak_rss_bytes = max(self._peak_rss_bytes, peak)
+            return self._peak_rss_bytes
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._peak_rss_bytes = 0
+            self.started_at = time.monotonic()
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict"""
+        self.sample_memory()
+        with self._lock:
+            stages = {}
+            for name, histogram in sorted(self._histograms.items()):
+                stages[name] = {
+                    'count': histogram.count,
+                    'sum_ms': histogram.sum,
+                    'mean_ms': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'max_ms': histogram.max,
+                    'p50_ms': self._quantile(histogram, 0.5),
+                    'p99_ms': self._quantile(histogram, 0.99),
+                    'buckets': dict(zip([str(b) for b in self.buckets_ms] + ['+Inf'],
+                                        histogram.bucket_counts))
+                }
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            return {
+                'enabled': self.enabled,
+                'uptime_s': time.monotonic() - self.started_at,
+                'stages': stages,
+                'counters': counters,
+                'memory': {'peak_rss_bytes': self._peak_rss_bytes}
+            }
+
+    def _quantile(self, histogram, q):
+        """Bucket upper bound holding the q-quantile (max for the +Inf bucket)"""
+        if not histogram.count:
+            return 0.0
+        rank = q * histogram.count
+        seen = 0
+        for bound, count in zip(self.buckets_ms, histogram.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, histogram.max)
+        return histogram.max
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self):
+        """Snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        ns = self.namespace
+        lines = [
+            f'# HELP {ns}_stage_duration_ms Time spent per detection stage in milliseconds',
+            f'# TYPE {ns}_stage_duration_ms histogram'
+        ]
+        for name, stage in snapshot['stages'].items():
+            cumulative = 0
+            for bound, count in stage['buckets'].items():
+                cumulative += count
+                lines.append(f'{ns}_stage_duration_ms_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{ns}_stage_duration_ms_sum{{stage="{name}"}} {stage["sum_ms"]}')
+            lines.append(f'{ns}_stage_duration_ms_count{{stage="{name}"}} {stage["count"]}')
+
+        declared = set()
+        for counter in snapshot['counters']:
+            metric = f'{ns}_{counter["name"]}_total'
+            if metric not in declared:
+                lines.append(f'# TYPE {metric} counter')
+                declared.add(metric)
+            labels = ','.join(f'{k}="{v}"' for k, v in counter['labels'].items())
+            lines.append(f'{metric}{{{labels}}} {counter["value"]}' if labels else f'{metric} {counter["value"]}')
+
+        lines.append(f'# TYPE {ns}_peak_rss_bytes gauge')
+        lines.append(f'{ns}_peak_rss_bytes {snapshot["memory"]["peak_rss_bytes"]}')
+        lines.append(f'# TYPE {ns}_uptime_seconds gauge')
+        lines.append(f'{ns}_uptime_seconds {snapshot["uptime_s"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def resolve(metrics):
+    """The metrics object to use for an optional metrics argument (disabled when None)"""
+    return metrics if metrics is not None else InferenceMetrics(enabled=False)
+
+
+if __name__ == "__main__":
+    # Overhead of one instrumented stage, enabled vs disabled
+    n = 200000
+    for enabled in (False, True):
+        metrics = InferenceMetrics(enabled=enabled)
+        start = time.perf_counter()
+        for _ in range(n):
+            with metrics.stage('noop'):
+                pass
+        per_call = (time.perf_counter() - start) / n * 1e9
+        print(f"{'enabled' if enabled else 'disabled'}: {per_call:.0f} ns per stage")
+    print(metrics.to_prometheus())
@@ -0,0 +1,125 @@
+# model_registry.py
+# Versioned model directories with an atomically switched "current" pointer
+#
+# Layout:
+#   <root>/registry.json     versions, current version, activation history
+#   <root>/v0001/            save_models output of version 1
+#   <root>/v0002/            ...
+#
+# publish() saves a model as a new version and activates it; rollback() makes
+# the previously active version current again in one call. Nothing is deleted
+# unless prune() is called.
+
+import os
+import json
+from datetime import datetime
+
+
+class ModelRegistry:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._path = os.path.join(root, 'registry.json')
+        if os.path.exists(self._path):
+            with open(self._path, 'r') as f:
+                self.state = json.load(f)
+        else:
+            self.state = {'versions': [], 'current': None, 'history': []}
+
+    def _write(self):
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self._path)
+
+    @property
+    def current(self):
+        return self.state['current']
+
+    def versions(self):
+        return list(self.state['versions'])
+
+    def path(self, version=None):
+        """Model directory of a version (the current one by default)"""
+        version = version or self.current
+        if version is None:
+            raise ValueError("Registry has no published versions")
+        return os.path.join(self.root, version)
+
+    def publish(self, model, metadata=None, format='pickle'):
+        """
+        Save a VoltageSpikePredictionModel as a new version and make it current
+
+        Args:
+            model: trained or incrementally updated model
+            metadata: JSON-serializable dict stored with the version (e.g. the
+                      update_models report)
+            format: save_models format
+
+        Returns:
+            the new version name
+        """
+        number = max((int(v['version'][1:]) for v in self.state['versions']), default=0) + 1
+        version = f'v{number:04d}'
+        model.save_models(self.path(version), format=format)
+
+        self.state['versions'].append({
+            'version': version,
+            'parent': self.current,
+            'created_at': datetime.now().isoformat(),
+            'format': format,
+            'metadata': metadata or {}
+        })
+        self.activate(version)
+        return version
+
+    def activate(self, version):
+        if version not in {v['version'] for v in self.state['versions']}:
+            raise ValueError(f"Unknown model version: {version}")
+        self.state['current'] = version
+        self.state['history'].append(version)
+        self._write()
+
+    def rollback(self, version=None):
+        """
+        Make the previously active version current (or the given version)
+
+        Returns:
+            the version that is now current
+        """
+        if version is None:
+            # Pop activations of the current version off the history stack
+            history = list(self.state['history'])
+            while history and history[-1] == self.current:
+                history.pop()
+            if not history:
+                raise ValueError("No earlier version to roll back to")
+            self.state['history'] = history
+            self.state['current'] = history[-1]
+            self._write()
+        else:
+            self.activate(version)
+        return self.current
+
+    def load(self, version=None, components=None, metrics=None):
+        """Load a version (the current one by default) into a new VoltageSpikePredictionModel"""
+        from predictive_model import VoltageSpikePredictionModel, MODEL_COMPONENTS
+
+        model = VoltageSpikePredictionModel(metrics=metrics)
+        model.load_models(self.path(version), components=components or MODEL_COMPONENTS)
+        return model
+
+    def prune(self, keep=5):
+        """Delete all but the newest `keep` versions (the current version is always kept)"""
+        import shutil
+
+        if keep < 0:
+            raise ValueError(f"keep must be >= 0, got {keep}")
+        names = [v['version'] for v in self.state['versions']]
+        drop = [name for name in names[:max(len(names) - keep, 0)] if name != self.current]
+        for name in drop:
+            shutil.rmtree(self.path(name), ignore_errors=True)
+        self.state['versions'] = [v for v in self.state['versions'] if v['version'] not in drop]
+        self.state['history'] = [v for v in self.state['history'] if v not in drop]
+        self._write()
+        return drop
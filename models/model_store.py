@@ -0,0 +1,129 @@
+# model_store.py
+# Memory-mapped on-disk format for compiled tree ensembles
+#
+# A model directory holds one .npy file per node array of a CompiledForest plus
+# forest.json with the format version, the scalar attributes and free-form
+# metadata (the rpi_config.json fields for the fence detector). Arrays are
+# opened with mmap, so every worker process on a box shares one page-cache copy
+# and loading takes milliseconds instead of a joblib unpickle.
+#
+# Convert the shipped fence detector pickles:
+#   python model_store.py --model-dir models/
+# which writes models/rpi_fence_detector_v<model_info.version>/
+
+import os
+import json
+import numpy as np
+
+from tree_compiler import CompiledForest, compile_forest
+
+FORMAT_NAME = 'flat-forest'
+FORMAT_VERSION = 1
+NODE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+
+class FoldedScaler:
+    """Stands in for a StandardScaler that has been folded into compiled thresholds"""
+
+    def transform(self, X):
+        return X
+
+
+def is_forest_dir(path):
+    return os.path.isfile(os.path.join(path, 'forest.json'))
+
+
+def save_forest(compiled, directory, metadata=None):
+    """Write a CompiledForest as .npy node arrays plus forest.json"""
+    os.makedirs(directory, exist_ok=True)
+
+    for name in NODE_ARRAYS:
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(getattr(compiled, name)))
+
+    header = {
+        'format': FORMAT_NAME,
+        'format_version': FORMAT_VERSION,
+        'kind': compiled.kind,
+        'input_dtype': np.dtype(compiled.input_dtype).name,
+        'n_features': compiled.n_features,
+        'n_trees': compiled.n_trees,
+        'max_depth': compiled.max_depth,
+        'classes': compiled.classes_.tolist() if compiled.classes_ is not None else None,
+        'offset': float(compiled.offset_) if compiled.offset_ is not None else None,
+        'denominator': float(np.ravel(compiled.denominator)[0]) if compiled.denominator is not None else None,
+        'metadata': metadata or {}
+    }
+    # forest.json goes last so a directory is only recognized once it is complete
+    with open(os.path.join(directory, 'forest.json'), 'w') as f:
+        json.dump(header, f, indent=2)
+
+
+def load_forest(directory, mmap=True):
+    """
+    Open a model directory written by save_forest
+
+    Returns:
+        (CompiledForest, metadata dict)
+    """
+    with open(os.path.join(directory, 'forest.json'), 'r') as f:
+        header = json.load(f)
+
+    if header.get('format') != FORMAT_NAME or header.get('format_version', 0) > FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format in {directory}: "
+                         f"{header.get('format')} v{header.get('format_version')}")
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+              for name in NODE_ARRAYS}
+
+    compiled = CompiledForest(
+        kind=header['kind'],
+        max_depth=header['max_depth'],
+        n_features=header['n_features'],
+        classes=np.array(header['classes']) if header['classes'] is not None else None,
+        offset=header['offset'],
+        denominator=header['denominator'],
+        **arrays
+    )
+    return compiled, header['metadata']
+
+
+def convert_fence_detector(model_dir, out_dir=None):
+    """
+    Convert rpi_fence_detector.pkl + rpi_scaler.pkl + rpi_config.json to a model directory
+
+    The scaler is folded into the thresholds for float32 raw features, the
+    input the bridge and RPiFenceDetector build.
+    """
+    import joblib
+
+    model = joblib.load(os.path.join(model_dir, 'rpi_fence_detector.pkl'))
+    scaler = joblib.load(os.path.join(model_dir, 'rpi_scaler.pkl'))
+    with open(os.path.join(model_dir, 'rpi_config.json'), 'r') as f:
+        config = json.load(f)
+
+    if out_dir is None:
+        version = config.get('model_info', {}).get('version', '1.0.0')
+        out_dir = os.path.join(model_dir, f'rpi_fence_detector_v{version}')
+
+    compiled = compile_forest(model, scaler=scaler, input_dtype=np.float32)
+    save_forest(compiled, out_dir, metadata={'scaler_folded': True, 'config': config})
+    return out_dir
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert the fence detector pickles to the mmap model format')
+    parser.add_argument('--model-dir', default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--out', help='output directory (default: rpi_fence_detector_v<version> in --model-dir)')
+    args = parser.parse_args()
+
+    out_dir = convert_fence_detector(args.model_dir, args.out)
+    print(f"Model directory written to {out_dir}")
+
+    start = time.perf_counter()
+    compiled, metadata = load_forest(out_dir)
+    print(f"mmap load: {(time.perf_counter() - start) * 1000:.2f} ms "
+          f"({compiled.n_trees} trees, {len(compiled.feature)} nodes)")
@@ -0,0 +1,340 @@
+# out_of_core.py
+# Train the voltage spike Random Forest and IsolationForest from shards larger than memory
+#
+# Reads the shards written by synthetic_data.write_shards (memory-mapped .npy or
+# Parquet) in blocks sized from a memory budget, in one pass:
+#   - the 20 RF features are computed per block with a FeederFeatureStore, which
+#     carries the lag and rolling state across block and shard boundaries
+#   - the StandardScaler is fitted incrementally with partial_fit
+#   - the forests are fitted with one of two strategies:
+#       'reservoir'  stratified reservoir samples (one reservoir per
+#                    voltage_spike_risk class, so rare spikes are all kept),
+#                    fitted once with weights that restore the class shares
+#       'subforest'  a small forest per block, fitted on the unscaled features
+#                    and merged at the end after remapping its split thresholds
+#                    to the final scaler
+# Reservoirs and blocks share the budget, so peak memory does not grow with the
+# dataset. A random 20% of rows is held out (in its own reservoir) for the
+# evaluation printed at the end and for the IsolationForest threshold.
+#
+#   python out_of_core.py --shards data/spike_train --out models/ --memory-mb 512
+
+import os
+import json
+import time
+import resource
+import argparse
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+from feature_store import FeederFeatureStore, RF_FEATURE_COLUMNS
+
+STRATEGIES = ('reservoir', 'subforest')
+STRATA = (0, 1)          # voltage_spike_risk classes
+HOLDOUT_FRACTION = 0.2
+
+# Approximate working set per row: a block holds the raw record, the base and
+# feature matrices and the feature store temporaries; a sampled row is stored
+# once as float64 and copied (scaled, then float32) while the forests are fitted
+BLOCK_ROW_BYTES = 512
+SAMPLE_ROW_BYTES = 512
+N_FEATURES = len(RF_FEATURE_COLUMNS)
+N_ANOMALY_FEATURES = 5   # ANOMALY_FEATURE_COLUMNS lead the RF feature columns
+
+
+def plan_memory(memory_budget_mb):
+    """Rows per block and reservoir rows (training + holdout) that fit in the budget"""
+    budget = memory_budget_mb * 2**20
+    block_rows = max(1000, int(budget * 0.25) // BLOCK_ROW_BYTES)
+    sample_rows = max(1000, int(budget * 0.75) // SAMPLE_ROW_BYTES)
+    return block_rows, sample_rows
+
+
+class StratifiedReservoir:
+    """
+    Uniform reservoir sample (Algorithm R) per stratum of rows streamed in blocks
+
+    Args:
+        capacity: total rows kept, split evenly across strata
+        strata: label values
+        seed: int or np.random.Generator
+    """
+
+    def __init__(self, capacity, strata=STRATA, seed=None):
+        self.rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+        self.capacity = max(1, capacity // len(strata))
+        self.rows = {s: np.empty((self.capacity, N_FEATURES)) for s in strata}
+        self.seen = {s: 0 for s in strata}
+
+    def add(self, X, y):
+        for stratum, rows in self.rows.items():
+            block = X[y == stratum]
+            seen = self.seen[stratum]
+            if not len(block):
+                continue
+
+            # Fill the free slots first
+            free = max(0, min(self.capacity - seen, len(block)))
+            rows[seen:seen + free] = block[:free]
+
+            # Row i of the rest replaces a random slot with probability capacity / (i + 1)
+            index = seen + free + np.arange(len(block) - free)
+            slot = (self.rng.random(len(index)) * (index + 1)).astype(np.int64)
+            keep = slot < self.capacity
+            slot, source = slot[keep], np.flatnonzero(keep) + free
+            # Later rows win when they land on the same slot
+            slot, last = np.unique(slot[::-1], return_index=True)
+            rows[slot] = block[source[::-1][last]]
+
+            self.seen[stratum] = seen + len(block)
+
+    def weighted(self):
+        """
+        All kept rows, weighted by the number of streamed rows each one stands for
+
+        Returns:
+            X: (n, 20) float64 rows, y: (n,) labels, weights: (n,) sample weights
+        """
+        X, y, weights = [], [], []
+        for stratum, rows in self.rows.items():
+            kept = min(self.seen[stratum], self.capacity)
+            X.append(rows[:kept])
+            y.append(np.full(kept, stratum))
+            weights.append(np.full(kept, self.seen[stratum] / kept if kept else 0.0))
+        return np.concatenate(X), np.concatenate(y), np.concatenate(weights)
+
+    def sample(self, size=None):
+        """
+        Rows drawn from each stratum in proportion to its share of the stream
+
+        Returns:
+            X: (n, 20) float64 rows, y: (n,) labels
+        """
+        total = sum(self.seen.values())
+        if not total:
+            return np.empty((0, N_FEATURES)), np.empty(0)
+        # Largest sample for which no stratum needs more rows than it kept
+        limit = min(min(self.seen[s], self.capacity) * total / self.seen[s] for s in self.seen if self.seen[s])
+        size = int(min(size or limit, limit))
+
+        X, y = [], []
+        for stratum, rows in self.rows.items():
+            kept = min(self.seen[stratum], self.capacity)
+            n = min(kept, int(round(size * self.seen[stratum] / total)))
+            pick = self.rng.choice(kept, n, replace=False)
+            X.append(rows[pick])
+            y.append(np.full(n, stratum))
+        X, y = np.concatenate(X), np.concatenate(y)
+        order = self.rng.permutation(len(y))
+        return X[order], y[order]
+
+
+def _manifest(shard_dir):
+    with open(os.path.join(shard_dir, 'manifest.json'), 'r') as f:
+        return json.load(f)
+
+
+def iter_blocks(shard_dir, block_rows):
+    """Yield consecutive blocks of all shards as dicts of column arrays"""
+    for shard in _manifest(shard_dir)['shards']:
+        path = os.path.join(shard_dir, shard['path'])
+        if path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=block_rows):
+                yield {name: batch.column(name).to_numpy() for name in batch.schema.names}
+        else:
+            records = np.load(path, mmap_mode='r')
+            for start in range(0, len(records), block_rows):
+                block = records[start:start + block_rows]
+                yield {name: block[name] for name in records.dtype.names}
+
+
+def block_features(store, block):
+    """(N, 20) RF features of one block, continuing each feeder's history in store"""
+    base = store.base_matrix(block)
+    if 'feeder_id' not in block:
+        return store.extend('default', base)
+
+    features = np.empty((len(base), N_FEATURES))
+    feeders, inverse = np.unique(block['feeder_id'], return_inverse=True)
+    for i, feeder in enumerate(feeders):
+        rows = inverse == i
+        features[rows] = store.extend(feeder.item(), base[rows])
+    return features
+
+
+def _merge_forests(forests):
+    """One forest with the trees (and per-tree bookkeeping) of all forests"""
+    merged = forests[0]
+    merged.estimators_ = [tree for forest in forests for tree in forest.estimators_]
+    for name in ('estimators_features_', '_decision_path_lengths', '_average_path_length_per_tree'):
+        if hasattr(merged, name):
+            setattr(merged, name, [item for forest in forests for item in getattr(forest, name)])
+    merged.set_params(n_estimators=len(merged.estimators_))
+    return merged
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def train_out_of_core(model, shard_dir, strategy='reservoir', memory_budget_mb=512,
+                      n_estimators=100, max_depth=10, contamination=0.1, seed=42):
+    """
+    Fit model.scaler, model.rf_model and model.anomaly_detector from shards
+
+    Args:
+        model: VoltageSpikePredictionModel
+        shard_dir: directory with manifest.json (synthetic_data.write_shards)
+        strategy: 'reservoir' or 'subforest'
+        memory_budget_mb: bound for blocks plus samples; the forests' own size
+                          (which grows with the training sample) is extra
+        n_estimators: trees per forest ('subforest' grows at least one per block)
+        max_depth: RF max_depth
+        contamination: IsolationForest contamination
+        seed: sampling and tree seed
+
+    Returns:
+        dict report
+    """
+    from sklearn.ensemble import RandomForestRegressor, IsolationForest
+    from sklearn.metrics import mean_squared_error, r2_score
+    from predictive_model import _remap_thresholds, _column_scaler
+
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown out-of-core strategy: {strategy}")
+
+    start = time.perf_counter()
+    baseline_rss_mb = _peak_rss_mb()
+    rng = np.random.default_rng(seed)
+    block_rows, sample_rows = plan_memory(memory_budget_mb)
+    manifest = _manifest(shard_dir)
+    total_rows = sum(shard['rows'] for shard in manifest['shards'])
+    n_blocks = sum(-(-shard['rows'] // block_rows) for shard in manifest['shards'])
+
+    print(f"Out-of-core training on {total_rows} rows in {n_blocks} blocks of {block_rows} "
+          f"({strategy}, {memory_budget_mb} MB budget)...")
+
+    store = FeederFeatureStore()
+    scaler = StandardScaler()
+    holdout_rows = int(sample_rows * HOLDOUT_FRACTION)
+    train_reservoir = StratifiedReservoir(sample_rows - holdout_rows, seed=rng)
+    holdout_reservoir = StratifiedReservoir(holdout_rows, seed=rng)
+
+    # Trees per block in proportion to the block's rows (subforest)
+    trees = np.diff(np.round(np.linspace(0, n_estimators, n_blocks + 1)).astype(int))
+    rf_parts, anomaly_parts = [], []
+    rows_seen = 0
+    class_counts = dict.fromkeys(STRATA, 0)
+
+    for index, block in enumerate(iter_blocks(shard_dir, block_rows)):
+        X = np.nan_to_num(block_features(store, block), nan=0.0)
+        y = np.asarray(block['voltage_spike_risk'])
+        scaler.partial_fit(X)
+        rows_seen += len(X)
+        for stratum in STRATA:
+            class_counts[stratum] += int(np.count_nonzero(y == stratum))
+
+        holdout = rng.random(len(X)) < HOLDOUT_FRACTION
+        holdout_reservoir.add(X[holdout], y[holdout])
+        X, y = X[~holdout], y[~holdout]
+
+        if strategy == 'reservoir':
+            train_reservoir.add(X, y)
+        elif len(X):
+            block_seed = int(rng.integers(2**31))
+            block_trees = max(1, int(trees[index]))
+            rf_parts.append(RandomForestRegressor(
+                n_estimators=block_trees, max_depth=max_depth,
+                random_state=block_seed, n_jobs=-1
+            ).fit(X, y))
+            anomaly_parts.append(IsolationForest(
+                n_estimators=block_trees, contamination=contamination,
+                random_state=block_seed, n_jobs=-1
+            ).fit(X[:, :N_ANOMALY_FEATURES]))
+
+        if (index + 1) % 10 == 0 or index + 1 == n_blocks:
+            print(f"  block {index + 1}/{n_blocks}: {rows_seen} rows, peak RSS {_peak_rss_mb():.0f} MB")
+
+    X_test, y_test = holdout_reservoir.sample()
+    X_test_scaled = scaler.transform(X_test)
+    report = {
+        'strategy': strategy,
+        'rows': rows_seen,
+        'blocks': n_blocks,
+        'block_rows': block_rows,
+        'sample_rows': sample_rows,
+        'class_counts': {str(s): n for s, n in class_counts.items()},
+        'holdout_samples': len(y_test)
+    }
+
+    if strategy == 'reservoir':
+        X_train, y_train, weights = train_reservoir.weighted()
+        X_train = scaler.transform(X_train)
+        report['train_samples'] = len(y_train)
+
+        rf_model = RandomForestRegressor(
+            n_estimators=n_estimators, max_depth=max_depth, random_state=seed, n_jobs=-1
+        ).fit(X_train, y_train, sample_weight=weights)
+        del X_train
+
+        # Isolation trees ignore sample weights: fit on a class-proportional draw
+        X_uniform, _ = train_reservoir.sample()
+        anomaly_detector = IsolationForest(
+            n_estimators=n_estimators, contamination=contamination, random_state=seed, n_jobs=-1
+        ).fit(scaler.transform(X_uniform)[:, :N_ANOMALY_FEATURES])
+        del X_uniform
+    else:
+        # Sub-forests split on unscaled features: remap from the identity scaling
+        identity_mean, identity_scale = np.zeros(N_FEATURES), np.ones(N_FEATURES)
+        for forest in rf_parts + anomaly_parts:
+            _remap_thresholds(forest, identity_mean, identity_scale, scaler.mean_, scaler.scale_)
+        rf_model = _merge_forests(rf_parts)
+        anomaly_detector = _merge_forests(anomaly_parts)
+        report['train_samples'] = rows_seen - sum(holdout_reservoir.seen.values())
+
+    # Contamination threshold of the whole ensemble, from held-out rows
+    if contamination != 'auto' and len(X_test):
+        anomaly_detector.offset_ = np.percentile(
+            anomaly_detector.score_samples(X_test_scaled[:, :N_ANOMALY_FEATURES]), 100.0 * contamination
+        )
+
+    model.scaler = scaler
+    model.anomaly_scaler = _column_scaler(scaler, np.arange(N_ANOMALY_FEATURES))
+    model.rf_model = rf_model
+    model.anomaly_detector = anomaly_detector
+
+    if len(X_test):
+        y_pred = rf_model.predict(X_test_scaled)
+        report['rf_mse'] = float(mean_squared_error(y_test, y_pred))
+        report['rf_r2'] = float(r2_score(y_test, y_pred))
+        report['anomaly_rate'] = float(np.mean(anomaly_detector.predict(X_test_scaled[:, :N_ANOMALY_FEATURES]) == -1))
+    report['rf_trees'] = len(rf_model.estimators_)
+    report['anomaly_trees'] = len(anomaly_detector.estimators_)
+    report['baseline_rss_mb'] = baseline_rss_mb
+    report['peak_rss_mb'] = _peak_rss_mb()
+    report['elapsed_s'] = time.perf_counter() - start
+
+    print(f"Random Forest - MSE: {report.get('rf_mse', float('nan')):.4f}, R2: {report.get('rf_r2', float('nan')):.4f}")
+    print(f"Out-of-core training finished in {report['elapsed_s']:.1f}s, peak RSS {report['peak_rss_mb']:.0f} MB")
+    return report
+
+
+if __name__ == "__main__":
+    from predictive_model import VoltageSpikePredictionModel
+
+    parser = argparse.ArgumentParser(description='Train the voltage spike forests from shards larger than memory')
+    parser.add_argument('--shards', required=True, metavar='DIR', help='synthetic_data.py output directory')
+    parser.add_argument('--out', default='models/', metavar='DIR', help='save_models directory')
+    parser.add_argument('--strategy', choices=STRATEGIES, default='reservoir')
+    parser.add_argument('--memory-mb', type=int, default=512)
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=('pickle', 'flat'), default='pickle')
+    args = parser.parse_args()
+
+    model = VoltageSpikePredictionModel()
+    report = model.train_out_of_core(args.shards, args.strategy, args.memory_mb, args.trees, seed=args.seed)
+    model.save_models(args.out, format=args.format)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,109 @@
+# prediction_cache.py
+# Bounded LRU + TTL cache for fence detection results keyed on the feature vector
+
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class PredictionCache:
+    """
+    Thread-safe result cache for the bridge's single and batch prediction paths
+
+    Keys are the float32 feature vector in essential_features order. With
+    quantization_levels set, each feature is first snapped to one of that many
+    steps across its feature_ranges entry in rpi_config.json, so near-identical
+    readings from a steady line share one entry. The cache is cleared whenever
+    it is bound to a different model_info.version.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=60.0, quantization_levels=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.quantization_levels = quantization_levels
+
+        self.model_version = None
+        self._minimum = None
+        self._step = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def bind(self, feature_names, feature_ranges, model_version):
+        """Attach to a loaded model; drops every entry if the model version changed"""
+        with self._lock:
+            if self.quantization_levels and feature_ranges:
+                ranges = [feature_ranges.get(feat, {}) for feat in feature_names]
+                minimum = np.array([r.get('min', 0.0) for r in ranges], dtype=np.float64)
+                maximum = np.array([r.get('max', 1.0) for r in ranges], dtype=np.float64)
+                self._minimum = minimum
+                self._step = np.where(maximum > minimum, maximum - minimum, 1.0) / self.quantization_levels
+            else:
+                self._minimum = None
+                self._step = None
+
+            if model_version != self.model_version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.model_version = model_version
+
+    def keys(self, feature_matrix):
+        """One hashable key per row of an (N, n_features) float32 matrix"""
+        if self._step is not None:
+            quantized = np.rint((feature_matrix - self._minimum) / self._step).astype(np.int64)
+            return [row.tobytes() for row in quantized]
+        matrix = np.ascontiguousarray(feature_matrix, dtype=np.float32)
+        return [row.tobytes() for row in matrix]
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, result = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'quantization_levels': self.quantization_levels,
+                'model_version': self.model_version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -1,101 +1,141 @@
 # predictive_model.py
 # Advanced AI Model for Electric Fence Voltage Spike Prediction
+#
+# Only the inference dependencies are imported at module level. pandas, the
+# sklearn training modules and TensorFlow are imported inside the methods that
+# need them, so predict_voltage_spike/tdr_analysis callers never load them.
 
+import os
+import shutil
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestRegressor, IsolationForest
 from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, r2_score
 import joblib
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
 import json
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
+
+from tree_compiler import CompiledForest, compile_forest
+from model_store import is_forest_dir, save_forest, load_forest
+from inference_metrics import resolve as resolve_metrics
+from feature_store import BASE_COLUMNS, RF_FEATURE_COLUMNS
+
+# Sub-models that load_models can restore; the inference path needs only the
+# forests (and the TensorFlow-free direct forecaster when one was saved)
+MODEL_COMPONENTS = ('rf', 'lstm', 'anomaly', 'direct')
+INFERENCE_COMPONENTS = ('rf', 'anomaly', 'direct')
+
+# Voltage forecasting engines: autoregressive LSTM or direct multi-horizon forest
+FORECAST_ENGINES = ('lstm', 'direct')
+
+# IsolationForest inputs: the leading RF feature columns, which every reading
+# carries (the first 5 columns of the inference feature rows)
+ANOMALY_FEATURE_COLUMNS = BASE_COLUMNS[:5]
+
+
+def _keras():
+    """Import Keras on first use (pulls in TensorFlow)"""
+    from tensorflow import keras
+    return keras
+
+
+def _remap_thresholds(forest, old_mean, old_scale, new_mean, new_scale):
+    """Rewrite split thresholds learned on old-scaled features for new-scaled ones"""
+    for tree in forest.estimators_:
+        nodes = tree.tree_
+        split = nodes.feature >= 0
+        feature = nodes.feature[split]
+        raw = nodes.threshold[split] * old_scale[feature] + old_mean[feature]
+        nodes.threshold[split] = (raw - new_mean[feature]) / new_scale[feature]
+
+
+def _rotate_trees(forest, X, y, new_trees, seed):
+    """Fit new_trees warm-start trees on (X, y) and drop the same number of oldest trees"""
+    n_trees = len(forest.estimators_)
+    forest.set_params(warm_start=True, n_estimators=n_trees + new_trees, random_state=seed)
+    # IsolationForest: refitting re-derives the subsample size from the (small) update
+    # window, which would also change how every old tree's path lengths are normalised
+    max_samples = getattr(forest, '_max_samples', None)
+    if max_samples is not None:
+        param = forest.max_samples
+        forest.set_params(max_samples=min(max_samples, len(X)))
+    # Bagging keeps only the new trees' seeds on a warm start; keep one per tree
+    seeds = getattr(forest, '_seeds', None)
+    if y is None:
+        forest.fit(X)
+    else:
+        forest.fit(X, y)
+    if max_samples is not None:
+        forest.set_params(max_samples=param)
+        forest._max_samples = forest.max_samples_ = max_samples
+    if seeds is not None and len(forest._seeds) < len(forest.estimators_):
+        forest._seeds = np.concatenate([seeds, forest._seeds])
+    
+    retire = min(new_trees, n_trees)
+    forest.estimators_ = forest.estimators_[retire:]
+    # Per-tree bookkeeping kept alongside estimators_ (bagging and isolation forests)
+    for name in ('estimators_features_', '_seeds', '_decision_path_lengths', '_average_path_length_per_tree'):
+        if hasattr(forest, name):
+            setattr(forest, name, getattr(forest, name)[retire:])
+    forest.set_params(warm_start=False, n_estimators=len(forest.estimators_))
+
+
+def _column_scaler(scaler, columns):
+    """StandardScaler for a subset of the columns of a fitted one (legacy model directories)"""
+    subset = StandardScaler()
+    for name in ('mean_', 'var_', 'scale_'):
+        setattr(subset, name, getattr(scaler, name)[columns])
+    subset.n_features_in_ = len(columns)
+    subset.n_samples_seen_ = scaler.n_samples_seen_
+    return subset
+
+
+def _history_matrix(histories, window):
+    """(F, n) float64 voltage matrix from an array or per-feeder lists of {'voltage': ...} dicts"""
+    if len(histories) and not isinstance(histories, np.ndarray) and isinstance(histories[0], (list, tuple)) \
+            and histories[0] and isinstance(histories[0][0], dict):
+        if min(len(history) for history in histories) < window:
+            raise ValueError(f"Need at least {window} historical data points")
+        histories = [[d['voltage'] for d in history[-window:]] for history in histories]
+    histories = np.asarray(histories, dtype=np.float64)
+    if histories.ndim != 2 or histories.shape[1] < window:
+        raise ValueError(f"Need at least {window} historical data points")
+    return histories
+
+
+def _direct_features(windows):
+    """Direct forecaster inputs: the voltage window plus its mean and std"""
+    return np.column_stack([windows, windows.mean(axis=1), windows.std(axis=1)])
+
 
 class VoltageSpikePredictionModel:
-    def __init__(self):
+    def __init__(self, metrics=None):
+        self.metrics = resolve_metrics(metrics)  # optional InferenceMetrics
         self.rf_model = None
         self.lstm_model = None
         self.anomaly_detector = None
-        self.scaler = StandardScaler()
-        self.feature_columns = [
-            'voltage', 'current', 'frequency', 'impedance', 
-            'power_factor', 'temperature', 'humidity', 
-            'time_hour', 'time_minute', 'day_of_week'
-        ]
-        
-    def generate_training_data(self, samples=10000):
-        """Generate realistic training data for the model"""
-        np.random.seed(42)
-        
-        data = []
-        base_date = datetime.now() - timedelta(days=365)
-        
-        for i in range(samples):
-            # Time features
-            current_time = base_date + timedelta(minutes=i*10)
-            hour = current_time.hour
-            minute = current_time.minute
-            day_of_week = current_time.weekday()
-            
-            # Base electrical parameters
-            base_voltage = 230
-            base_current = 15
-            base_frequency = 50
-            
-            # Seasonal and daily variations
-            daily_factor = np.sin(2 * np.pi * hour / 24)
-            weekly_factor = np.sin(2 * np.pi * day_of_week / 7)
-            
-            # Normal variations
-            voltage = base_voltage + daily_factor * 10 + weekly_factor * 5 + np.random.normal(0, 3)
-            current = base_current + daily_factor * 3 + weekly_factor * 2 + np.random.normal(0, 1)
-            frequency = base_frequency + np.random.normal(0, 0.1)
-            
-            # Environmental factors
-            temperature = 25 + daily_factor * 10 + np.random.normal(0, 5)
-            humidity = 60 + np.sin(2 * np.pi * (hour + 6) / 24) * 20 + np.random.normal(0, 10)
-            
-            # Impedance and power factor
-            impedance = 75 + np.random.normal(0, 5)
-            power_factor = 0.85 + np.random.normal(0, 0.05)
-            
-            # Illegal fence simulation (5% of data)
-            if np.random.random() < 0.05:
-                # Illegal fence causes voltage spikes and impedance drops
-                voltage += np.random.uniform(20, 50)  # Voltage spike
-                impedance -= np.random.uniform(15, 35)  # Impedance drop
-                current += np.random.uniform(5, 15)  # Current increase
-                is_illegal_fence = 1
-            else:
-                is_illegal_fence = 0
-                
-            # TDR reflection coefficient
-            if is_illegal_fence:
-                tdr_reflection = np.random.uniform(40, 80)  # Strong reflection
-            else:
-                tdr_reflection = np.random.uniform(0, 20)   # Normal reflection
-            
-            data.append({
-                'timestamp': current_time,
-                'voltage': voltage,
-                'current': current,
-                'frequency': frequency,
-                'impedance': impedance,
-                'power_factor': power_factor,
-                'temperature': temperature,
-                'humidity': humidity,
-                'time_hour': hour,
-                'time_minute': minute,
-                'day_of_week': day_of_week,
-                'tdr_reflection': tdr_reflection,
-                'is_illegal_fence': is_illegal_fence,
-                'voltage_spike_risk': 1 if voltage > 250 else 0
-            })
-            
-        return pd.DataFrame(data)
+        self.lstm_path = None  # saved LSTM, loaded on first use
+        self.direct_forecaster = None  # {'model', 'window', 'horizon'}
+        self.forecast_engine = 'lstm'
+        self.feature_store = None  # optional FeederFeatureStore for online lag/rolling features
+        self.tdr_baseline = None  # TDRBaseline, created on the first tdr_analysis with a cable_id
+        self.scaler = StandardScaler()  # RF: the 20 RF_FEATURE_COLUMNS
+        self.lstm_scaler = StandardScaler()  # LSTM: voltage only
+        self.anomaly_scaler = StandardScaler()  # IsolationForest: ANOMALY_FEATURE_COLUMNS
+        self.feature_columns = list(BASE_COLUMNS)
+        
+    def generate_training_data(self, samples=10000, seed=42, base_date=None):
+        """
+        Generate realistic training data for the model
+        
+        Args:
+            samples: number of 10-minute rows
+            seed: seed of the np.random.Generator streams (see synthetic_data.py,
+                  which also writes datasets too large for memory as shards)
+            base_date: datetime of the first row (one year ago if None)
+        """
+        from synthetic_data import generate_dataframe
+        
+        return generate_dataframe(samples, seed=seed, base_date=base_date)
     
     def prepare_features(self, df):
         """Prepare features for model training"""
@@ -114,16 +154,17 @@ class VoltageSpikePredictionModel:
     
     def train_random_forest_model(self, df):
         """Train Random Forest model for voltage spike prediction"""
+        import pandas as pd
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import mean_squared_error, r2_score
+        
         print("Training Random Forest model...")
         
         # Prepare features
         df = self.prepare_features(df)
         
-        feature_cols = self.feature_columns + [
-            'voltage_current_ratio', 'impedance_change', 'frequency_deviation',
-            'power_quality_index', 'voltage_lag1', 'current_lag1', 'frequency_lag1',
-            'voltage_lag5', 'current_lag5', 'frequency_lag5'
-        ]
+        feature_cols = list(RF_FEATURE_COLUMNS)
         
         X = df[feature_cols].fillna(0)
         y = df['voltage_spike_risk']
@@ -162,45 +203,59 @@ class VoltageSpikePredictionModel:
         print("Top 10 most important features:")
         print(feature_importance.head(10))
         
-    def train_lstm_model(self, df):
-        """Train LSTM model for time series prediction"""
+    def train_lstm_model(self, df, window=24, horizon=1, epochs=50, batch_size=32,
+                         shuffle_buffer=None, seed=None):
+        """
+        Train LSTM model for time series prediction
+        
+        Windows are strided views gathered per batch by a tf.data pipeline (see
+        sequence_windows.py), so long histories are never copied window by window.
+        
+        Args:
+            df: training DataFrame; with a 'feeder_id' column every feeder is
+                windowed separately and windows never span two feeders
+            window: input steps per sequence
+            horizon: future steps predicted per sequence
+            epochs, batch_size: fit parameters
+            shuffle_buffer: tf.data shuffle buffer (all training windows if None)
+            seed: shuffle seed
+        """
+        from sequence_windows import WindowedSeries
+        
+        keras = _keras()
+        layers = keras.layers
+        
         print("Training LSTM model...")
         
         # Prepare time series data
         df = self.prepare_features(df)
         
-        # Create sequences
-        def create_sequences(data, seq_length=24):
-            sequences = []
-            targets = []
-            
-            for i in range(len(data) - seq_length):
-                seq = data[i:i+seq_length]
-                target = data[i+seq_length]
-                sequences.append(seq)
-                targets.append(target)
-            
-            return np.array(sequences), np.array(targets)
-        
         # Use voltage as main target
         voltage_data = df['voltage'].values
-        voltage_scaled = self.scaler.fit_transform(voltage_data.reshape(-1, 1)).flatten()
+        voltage_scaled = self.lstm_scaler.fit_transform(voltage_data.reshape(-1, 1)).flatten()
         
-        X_seq, y_seq = create_sequences(voltage_scaled, seq_length=24)
+        # Create sequences
+        if 'feeder_id' in df.columns:
+            feeder_ids = df['feeder_id'].values
+            series = [voltage_scaled[feeder_ids == feeder] for feeder in df['feeder_id'].unique()]
+        else:
+            series = voltage_scaled
+        windows = WindowedSeries(series, window=window, horizon=horizon)
         
-        # Split data
-        split_idx = int(len(X_seq) * 0.8)
-        X_train, X_test = X_seq[:split_idx], X_seq[split_idx:]
-        y_train, y_test = y_seq[:split_idx], y_seq[split_idx:]
+        # Split data (chronological: 72% train, 8% validation, 20% test)
+        train_starts, val_starts, test_starts = windows.split(0.72, 0.08)
+        train_ds = windows.dataset(train_starts, batch_size, shuffle_buffer=shuffle_buffer, seed=seed)
+        val_ds = windows.dataset(val_starts, batch_size, shuffle=False)
+        test_ds = windows.dataset(test_starts, batch_size, shuffle=False)
         
         # Build LSTM model
         self.lstm_model = keras.Sequential([
-            layers.LSTM(64, return_sequences=True, input_shape=(24, 1)),
+            layers.LSTM(64, return_sequences=True, input_shape=(window, 1)),
             layers.Dropout(0.2),
             layers.LSTM(32, return_sequences=False),
             layers.Dropout(0.2),
             layers.Dense(16, activation='relu'),
-            layers.Dense(1)
+            layers.Dense(horizon)
         ])
         
         self.lstm_model.compile(
@@ -211,33 +266,98 @@ class VoltageSpikePredictionModel:
         
         # Train model
         history = self.lstm_model.fit(
-            X_train.reshape(X_train.shape[0], X_train.shape[1], 1),
-            y_train,
-            epochs=50,
-            batch_size=32,
-            validation_split=0.1,
+            train_ds,
+            epochs=epochs,
+            validation_data=val_ds,
             verbose=1
         )
         
         # Evaluate
-        test_loss = self.lstm_model.evaluate(
-            X_test.reshape(X_test.shape[0], X_test.shape[1], 1),
-            y_test,
-            verbose=0
-        )
+        test_loss = self.lstm_model.evaluate(test_ds, verbose=0)
         
         print(f"LSTM - Test Loss: {test_loss[0]:.4f}")
     
+    def train_direct_forecaster(self, df, window=24, horizon=24, n_estimators=100, max_depth=12):
+        """
+        Train a direct multi-horizon voltage forecaster
+        
+        One multi-output RandomForestRegressor maps the last `window` voltages
+        (the voltage_lag features of prepare_features extended to the whole
+        window, plus their mean and std) to all `horizon` future voltages, so a
+        forecast is a single forward pass without TensorFlow.
+        """
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.metrics import mean_absolute_error
+        from sequence_windows import window_views
+        
+        print("Training direct multi-horizon forecaster...")
+        
+        if 'feeder_id' in df.columns:
+            series = [group['voltage'].values for _, group in df.groupby('feeder_id', sort=False)]
+        else:
+            series = [df['voltage'].values]
+        
+        windows, targets = [], []
+        for values in series:
+            X_win, y_win = window_views(np.asarray(values, dtype=np.float64), window, horizon)
+            windows.append(X_win.reshape(-1, window))
+            targets.append(y_win.reshape(-1, horizon))
+        X = _direct_features(np.concatenate(windows))
+        y = np.concatenate(targets)
+        
+        # Split data (chronological)
+        split_idx = int(len(X) * 0.8)
+        X_train, X_test = X[:split_idx], X[split_idx:]
+        y_train, y_test = y[:split_idx], y[split_idx:]
+        
+        model = RandomForestRegressor(
+            n_estimators=n_estimators,
+            max_depth=max_depth,
+            min_samples_leaf=5,
+            random_state=42,
+            n_jobs=-1
+        )
+        model.fit(X_train, y_train)
+        # Forecasts are a handful of rows; thread dispatch would cost more than it saves
+        model.set_params(n_jobs=1)
+        
+        y_pred = model.predict(X_test)
+        mae = mean_absolute_error(y_test, y_pred)
+        print(f"Direct forecaster - Test MAE: {mae:.3f} V over {horizon} steps")
+        
+        self.direct_forecaster = {'model': model, 'window': window, 'horizon': horizon}
+        return mae
+    
+    def train_forecast_model(self, df, engine='lstm', **kwargs):
+        """
+        Train the voltage forecaster used by predict_next_24_hours
+        
+        Args:
+            df: training DataFrame
+            engine: 'lstm' (autoregressive, needs TensorFlow) or 'direct'
+                    (multi-output forest, one pass for all horizons)
+            kwargs: passed to train_lstm_model / train_direct_forecaster
+        """
+        if engine not in FORECAST_ENGINES:
+            raise ValueError(f"Unknown forecast engine: {engine}")
+        
+        if engine == 'direct':
+            self.train_direct_forecaster(df, **kwargs)
+        else:
+            self.train_lstm_model(df, **kwargs)
+        self.forecast_engine = engine
+    
     def train_anomaly_detector(self, df):
         """Train Isolation Forest for anomaly detection"""
+        from sklearn.ensemble import IsolationForest
+        
         print("Training Anomaly Detection model...")
         
         # Features for anomaly detection
-        features = ['voltage', 'current', 'frequency', 'impedance', 'tdr_reflection']
-        X = df[features].fillna(0)
+        X = df[ANOMALY_FEATURE_COLUMNS].fillna(0)
         
         # Scale features
-        X_scaled = StandardScaler().fit_transform(X)
+        X_scaled = self.anomaly_scaler.fit_transform(X)
         
         # Train Isolation Forest
         self.anomaly_detector = IsolationForest(
@@ -254,12 +374,47 @@ class VoltageSpikePredictionModel:
         
         print(f"Anomalies detected: {np.sum(anomaly_predictions == -1)} out of {len(X_scaled)}")
         
-    def predict_voltage_spike(self, current_data):
-        """Predict voltage spike probability"""
-        if self.rf_model is None:
-            return {"error": "Model not trained"}
+    def train_out_of_core(self, shard_dir, strategy='reservoir', memory_budget_mb=512,
+                          n_estimators=100, seed=42):
+        """
+        Train the scaler, Random Forest and anomaly detector from shards larger than memory
+
+        Shards are streamed in blocks with lag/rolling state carried across them
+        (see out_of_core.py).
+
+        Args:
+            shard_dir: directory written by synthetic_data.write_shards
+            strategy: 'reservoir' (stratified samples) or 'subforest' (per-block
+                      forests merged at the end)
+            memory_budget_mb: memory bound for blocks and samples
+            n_estimators: trees per forest
+            seed: sampling and tree seed
+
+        Returns:
+            dict report (rows, samples, evaluation, peak RSS)
+        """
+        from out_of_core import train_out_of_core
+
+        return train_out_of_core(self, shard_dir, strategy=strategy, memory_budget_mb=memory_budget_mb,
+                                 n_estimators=n_estimators, seed=seed)
+
+    def _model_inputs(self, rows):
+        """
+        RF and anomaly detector inputs for raw rows of the 20 RF features
         
-        # Prepare features
+        Each model has its own scaler; compiled forests loaded from a flat model
+        directory have it folded into their thresholds and read the raw rows.
+        """
+        anomaly_rows = rows[:, :len(ANOMALY_FEATURE_COLUMNS)]
+        rf_input = rows if isinstance(self.rf_model, CompiledForest) else self.scaler.transform(rows)
+        if isinstance(self.anomaly_detector, CompiledForest):
+            anomaly_input = anomaly_rows
+        else:
+            anomaly_input = self.anomaly_scaler.transform(anomaly_rows)
+        return rf_input, anomaly_input
+    
+    def _simplified_features(self, current_data):
+        """The 20 RF features of one reading without feeder history (lags are the current values)"""
         features = []
         for col in self.feature_columns:
             features.append(current_data.get(col, 0))
@@ -277,14 +432,39 @@ class VoltageSpikePredictionModel:
             current_data.get('current', 15),   # current_lag5 (simplified)
             current_data.get('frequency', 50)  # frequency_lag5 (simplified)
         ])
+        return features
+    
+    def predict_voltage_spike(self, current_data, feeder_id=None):
+        """
+        Predict voltage spike probability
+        
+        With a feeder_id and a feature_store (FeederFeatureStore), the lag and
+        rolling features come from that feeder's streaming state instead of the
+        simplified stand-ins, matching what prepare_features computed in training.
+        """
+        metrics = self.metrics
+        if self.rf_model is None:
+            metrics.increment('errors', stage='spike.predict_voltage_spike')
+            return {"error": "Model not trained"}
+        
+        # Prepare features
+        with metrics.stage('spike.features'):
+            if feeder_id is not None and self.feature_store is not None:
+                features = self.feature_store.update(feeder_id, current_data)
+            else:
+                features = self._simplified_features(current_data)
         
         # Scale and predict
-        features_scaled = self.scaler.transform([features])
-        spike_probability = self.rf_model.predict(features_scaled)[0]
+        with metrics.stage('spike.scale'):
+            rf_input, anomaly_input = self._model_inputs(np.array([features], dtype=np.float64))
+        with metrics.stage('spike.predict'):
+            spike_probability = self.rf_model.predict(rf_input)[0]
         
-        # Anomaly detection
-        anomaly_score = self.anomaly_detector.decision_function(features_scaled[:, :5])[0]
-        is_anomaly = self.anomaly_detector.predict(features_scaled[:, :5])[0] == -1
+        # Anomaly detection (IsolationForest.predict is decision_function < 0)
+        with metrics.stage('spike.anomaly'):
+            anomaly_score = self.anomaly_detector.decision_function(anomaly_input)[0]
+            is_anomaly = anomaly_score < 0
+        metrics.increment('predictions', path='spike')
         
         return {
             "spike_probability": float(spike_probability),
@@ -294,32 +474,204 @@ class VoltageSpikePredictionModel:
             "confidence": 0.95 if not is_anomaly else 0.85
         }
     
-    def predict_next_24_hours(self, historical_data):
-        """Predict voltage behavior for next 24 hours using LSTM"""
-        if self.lstm_model is None:
-            return {"error": "LSTM model not trained"}
+    def spike_feature_matrix(self, readings):
+        """
+        The 20 predict_voltage_spike features for every reading, computed column-wise
         
-        # Prepare last 24 data points
-        if len(historical_data) < 24:
-            return {"error": "Need at least 24 historical data points"}
+        Args:
+            readings: DataFrame, structured array or dict of equal-length arrays
+                      with feature_columns fields; missing fields get the same
+                      defaults as predict_voltage_spike
+            
+        Returns:
+            (N, 20) float64 array
+        """
+        if isinstance(readings, np.ndarray):
+            names = readings.dtype.names or ()
+        else:
+            names = readings.keys()
+        if isinstance(readings, dict):
+            n = len(next(iter(readings.values()))) if readings else 0
+        else:
+            n = len(readings)
         
-        last_24 = np.array([d['voltage'] for d in historical_data[-24:]])
-        last_24_scaled = self.scaler.transform(last_24.reshape(-1, 1)).flatten()
+        def column(name, default):
+            if name in names:
+                return np.asarray(readings[name], dtype=np.float64)
+            return np.full(n, default, dtype=np.float64)
         
-        predictions = []
-        current_sequence = last_24_scaled.copy()
+        features = np.empty((n, 20), dtype=np.float64)
+        for i, col in enumerate(self.feature_columns):
+            features[:, i] = column(col, 0)
+        
+        # Engineered features (simplified, as in predict_voltage_spike)
+        voltage = column('voltage', 230)
+        current = column('current', 15)
+        frequency = column('frequency', 50)
+        frequency_deviation = np.abs(frequency - 50)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features[:, 10] = voltage / current                     # voltage_current_ratio
+        features[:, 11] = 0                                         # impedance_change
+        features[:, 12] = frequency_deviation                       # frequency_deviation
+        features[:, 13] = column('power_factor', 0.85) * (1 - frequency_deviation / 50)  # power_quality_index
+        features[:, 14] = voltage                                   # voltage_lag1
+        features[:, 15] = current                                   # current_lag1
+        features[:, 16] = frequency                                 # frequency_lag1
+        features[:, 17] = voltage                                   # voltage_lag5
+        features[:, 18] = current                                   # current_lag5
+        features[:, 19] = frequency                                 # frequency_lag5
+        return features
+    
+    def predict_voltage_spike_batch(self, readings):
+        """
+        Vectorized predict_voltage_spike over every reading of a polling cycle
+        
+        One feature pass, one RF predict and one anomaly scoring pass for the
+        whole batch; the anomaly label is derived from the score.
         
-        for hour in range(24):
-            # Predict next value
-            input_seq = current_sequence[-24:].reshape(1, 24, 1)
-            next_pred = self.lstm_model.predict(input_seq, verbose=0)[0][0]
+        Args:
+            readings: DataFrame, structured array or dict of arrays (see
+                      spike_feature_matrix); a 'feeder_id' field is passed through
+                      and, with a feature_store, selects each row's streaming
+                      lag/rolling state (rows oldest first)
             
-            # Update sequence
-            current_sequence = np.append(current_sequence, next_pred)
+        Returns:
+            dict of columnar arrays (spike_probability, anomaly_score, is_anomaly,
+            risk_level, confidence) plus count and timing_ms
+        """
+        metrics = self.metrics
+        if self.rf_model is None:
+            metrics.increment('errors', stage='spike.predict_voltage_spike_batch')
+            return {"error": "Model not trained"}
+        
+        names = (readings.dtype.names or ()) if isinstance(readings, np.ndarray) else readings.keys()
+        
+        start_time = time.perf_counter()
+        if self.feature_store is not None and 'feeder_id' in names:
+            features = self.feature_store.update_many(np.asarray(readings['feeder_id']).tolist(), readings)
+        else:
+            features = self.spike_feature_matrix(readings)
+        features_time = time.perf_counter()
+        
+        rf_input, anomaly_input = self._model_inputs(features)
+        scale_time = time.perf_counter()
+        
+        spike_probability = np.asarray(self.rf_model.predict(rf_input), dtype=np.float64)
+        predict_time = time.perf_counter()
+        
+        anomaly_score = np.asarray(self.anomaly_detector.decision_function(anomaly_input), dtype=np.float64)
+        is_anomaly = anomaly_score < 0
+        anomaly_time = time.perf_counter()
+        
+        risk_level = np.where(spike_probability > 0.7, 'HIGH',
+                              np.where(spike_probability > 0.3, 'MEDIUM', 'LOW'))
+        risk_level[is_anomaly] = 'HIGH'
+        end_time = time.perf_counter()
+        
+        if metrics.enabled:
+            metrics.observe('spike_batch.features', (features_time - start_time) * 1000)
+            metrics.observe('spike_batch.scale', (scale_time - features_time) * 1000)
+            metrics.observe('spike_batch.predict', (predict_time - scale_time) * 1000)
+            metrics.observe('spike_batch.anomaly', (anomaly_time - predict_time) * 1000)
+            metrics.increment('predictions', len(features), path='spike_batch')
+        
+        result = {
+            "spike_probability": spike_probability,
+            "anomaly_score": anomaly_score,
+            "is_anomaly": is_anomaly,
+            "risk_level": risk_level,
+            "confidence": np.where(is_anomaly, 0.85, 0.95),
+            "count": len(features),
+            "timing_ms": {
+                "features": (features_time - start_time) * 1000,
+                "scale": (scale_time - features_time) * 1000,
+                "predict": (predict_time - scale_time) * 1000,
+                "anomaly": (anomaly_time - predict_time) * 1000,
+                "total": (end_time - start_time) * 1000
+            }
+        }
+        if 'feeder_id' in names:
+            result["feeder_id"] = np.asarray(readings['feeder_id'])
+        return result
+    
+    def _voltage_scaling(self):
+        """(mean, scale) of voltage in the LSTM scaler"""
+        return self.lstm_scaler.mean_[0], self.lstm_scaler.scale_[0]
+    
+    def _lstm_step_fn(self):
+        """Compiled single-step forward pass of the LSTM (traced once per model)"""
+        if getattr(self, '_lstm_step_model', None) is not self.lstm_model:
+            import tensorflow as tf
             
-            # Convert back to original scale
-            pred_voltage = self.scaler.inverse_transform([[next_pred]])[0][0]
+            model = self.lstm_model
+            self._lstm_step = tf.function(lambda x: model(x, training=False), reduce_retracing=True)
+            self._lstm_step_model = model
+        return self._lstm_step
+    
+    def forecast_voltage_batch(self, histories, steps=24, engine=None):
+        """
+        Voltage forecast for many feeders at once
+        
+        With the LSTM all feeders are rolled out together: one compiled model
+        call per step on an (F, window, 1) slice of a preallocated
+        (F, window + steps) buffer. The direct forecaster predicts every step in
+        one pass.
+        
+        Args:
+            histories: (F, >= window) array of voltages (oldest first), or a list
+                       with one historical_data list of {'voltage': ...} dicts per feeder
+            steps: forecast steps
+            engine: 'lstm' or 'direct' (default: self.forecast_engine)
             
+        Returns:
+            (F, steps) array of predicted voltages
+        """
+        engine = engine or self.forecast_engine
+        if engine == 'direct':
+            if self.direct_forecaster is None:
+                raise ValueError("Direct forecaster not trained")
+            if steps > self.direct_forecaster['horizon']:
+                raise ValueError(f"Direct forecaster predicts at most {self.direct_forecaster['horizon']} steps")
+            window = self.direct_forecaster['window']
+            histories = _history_matrix(histories, window)
+            predicted = self.direct_forecaster['model'].predict(_direct_features(histories[:, -window:]))
+            return predicted.reshape(len(histories), -1)[:, :steps]
+        
+        if self.lstm_model is None and self.lstm_path:
+            self.lstm_model = _keras().models.load_model(self.lstm_path)
+        if self.lstm_model is None:
+            raise ValueError("LSTM model not trained")
+        
+        window = self.lstm_model.input_shape[1]
+        histories = _history_matrix(histories, window)
+        n_feeders = histories.shape[0]
+        
+        # Rolling buffer: history followed by the predictions written so far
+        buffer = np.empty((n_feeders, window + steps), dtype=np.float32)
+        voltage_mean, voltage_scale = self._voltage_scaling()
+        buffer[:, :window] = (histories[:, -window:] - voltage_mean) / voltage_scale
+        
+        step_fn = self._lstm_step_fn()
+        for step in range(steps):
+            next_pred = step_fn(buffer[:, step:step + window, np.newaxis])
+            buffer[:, window + step] = np.asarray(next_pred)[:, 0]
+        
+        # Convert back to original scale
+        predicted = buffer[:, window:].astype(np.float64)
+        return predicted * voltage_scale + voltage_mean
+    
+    def predict_next_24_hours(self, historical_data):
+        """Predict voltage behavior for next 24 hours (LSTM or direct forecaster, see forecast_engine)"""
+        if self.forecast_engine == 'lstm' and self.lstm_model is None and self.lstm_path is None:
+            return {"error": "LSTM model not trained"}
+        
+        try:
+            voltages = self.forecast_voltage_batch([historical_data])[0]
+        except ValueError as e:
+            return {"error": str(e)}
+        
+        predictions = []
+        for hour, pred_voltage in enumerate(voltages.tolist()):
             predictions.append({
                 "hour": hour + 1,
                 "predicted_voltage": float(pred_voltage),
@@ -329,68 +681,305 @@ class VoltageSpikePredictionModel:
         return {
             "predictions": predictions,
             "model_confidence": 0.92,
-            "forecast_horizon": "24 hours"
+            "forecast_horizon": "24 hours",
+            "forecast_engine": self.forecast_engine
         }
     
-    def tdr_analysis(self, tdr_data):
-        """Analyze TDR reflection data for illegal fence detection"""
-        reflection_values = np.array([d['reflection'] for d in tdr_data])
-        distances = np.array([d['distance'] for d in tdr_data])
-        
-        # Detect anomalous reflections
-        mean_reflection = np.mean(reflection_values)
-        std_reflection = np.std(reflection_values)
-        threshold = mean_reflection + 3 * std_reflection
-        
-        anomalies = []
-        for i, (distance, reflection) in enumerate(zip(distances, reflection_values)):
-            if reflection > threshold:
-                # Calculate impedance change
-                impedance_change = -reflection * 0.5  # Simplified calculation
-                
-                anomalies.append({
+    def tdr_analysis(self, tdr_data, cable_id=None, columnar=False):
+        """
+        Analyze TDR reflection data for illegal fence detection
+        
+        Args:
+            tdr_data: one sweep: list of {'distance', 'reflection'} dicts, dict
+                      of arrays / DataFrame, (distances, reflections) or (n, 2)
+            cable_id: with an ID the threshold comes from the cable's running
+                      baseline (self.tdr_baseline, see tdr_baseline.py), and
+                      the sweep's normal points are folded into it afterwards
+            columnar: return anomaly_locations as arrays instead of dicts
+        """
+        return self.tdr_analysis_chunks([tdr_data], cable_id=cable_id, columnar=columnar)
+    
+    def tdr_analysis_chunks(self, chunks, cable_id=None, columnar=False):
+        """
+        tdr_analysis of a long sweep delivered in consecutive chunks
+        
+        With a cable_id whose baseline is established, every chunk uses the same
+        threshold and the result equals tdr_analysis of the whole sweep; the
+        baseline is updated once, after the last chunk. Without one the
+        threshold is taken from the sweep's points seen so far.
+        """
+        from tdr_baseline import TDRBaseline, SIGMA, welford_merge, tdr_arrays, reflection_anomalies
+        
+        baseline = None
+        if cable_id is not None:
+            if self.tdr_baseline is None:
+                self.tdr_baseline = TDRBaseline()
+            baseline = self.tdr_baseline
+        sigma = baseline.sigma if baseline is not None else SIGMA
+        fixed_threshold = baseline.threshold(cable_id) if baseline is not None else None
+        
+        sweep = (0, 0.0, 0.0)   # all points: average_reflection
+        normal = (0, 0.0, 0.0)  # points at or below the threshold: baseline update
+        threshold = float('nan')
+        max_distance = float('-inf')
+        found = []
+        for chunk in chunks:
+            distances, reflections = tdr_arrays(chunk)
+            if not len(reflections):
+                continue
+            sweep = welford_merge(*sweep, reflections)
+            if fixed_threshold is not None:
+                threshold = fixed_threshold
+            else:
+                threshold = sweep[1] + sigma * np.sqrt(sweep[2] / sweep[0])
+            found.append(reflection_anomalies(distances, reflections, threshold))
+            normal = welford_merge(*normal, reflections[reflections <= threshold])
+            max_distance = max(max_distance, float(distances.max()))
+        
+        if baseline is not None:
+            baseline.merge(cable_id, *normal)
+        
+        if found:
+            anomalies = {name: np.concatenate([part[name] for part in found]) for name in found[0]}
+        else:
+            anomalies = reflection_anomalies(np.empty(0), np.empty(0), threshold)
+        n_anomalies = len(anomalies['distance_meters'])
+        if not columnar:
+            anomalies = [
+                {
                     "distance_meters": float(distance),
                     "reflection_db": float(reflection),
                     "impedance_change_ohms": float(impedance_change),
-                    "confidence": min(0.99, 0.7 + (reflection - threshold) / threshold),
-                    "severity": "CRITICAL" if reflection > threshold * 1.5 else "HIGH"
-                })
+                    "confidence": float(confidence),
+                    "severity": str(severity)
+                }
+                for distance, reflection, impedance_change, confidence, severity in zip(
+                    anomalies['distance_meters'], anomalies['reflection_db'],
+                    anomalies['impedance_change_ohms'], anomalies['confidence'], anomalies['severity'])
+            ]
         
-        return {
-            "anomalies_detected": len(anomalies),
+        result = {
+            "anomalies_detected": n_anomalies,
             "anomaly_locations": anomalies,
             "analysis_summary": {
-                "total_distance_analyzed": float(max(distances)),
-                "average_reflection": float(mean_reflection),
+                "total_distance_analyzed": max_distance,
+                "average_reflection": float(sweep[1]) if sweep[0] else float('nan'),
                 "detection_threshold": float(threshold)
             }
         }
+        if baseline is not None:
+            count, mean, std = baseline.stats(cable_id)
+            result["analysis_summary"]["baseline"] = {
+                "cable_id": cable_id,
+                "samples": count,
+                "mean_reflection": mean,
+                "std_reflection": std,
+                "threshold_source": "baseline" if fixed_threshold is not None else "sweep"
+            }
+        return result
     
-    def save_models(self, model_dir="models/"):
-        """Save trained models"""
-        import os
+    def update_models(self, df, new_trees=20, lstm_epochs=3, seed=None):
+        """
+        Incrementally update the trained models with a new window of data
+        
+        Instead of a full refit:
+          - the StandardScaler is updated with partial_fit, and the split
+            thresholds of every existing RF and IsolationForest tree are remapped
+            to the new scaling so the old trees keep making the same decisions
+          - each forest grows new_trees warm-start trees fitted on the new data
+            and retires its new_trees oldest trees, keeping its size constant
+          - the LSTM, if loaded or saved, is fine-tuned for lstm_epochs epochs
+            from its current weights
+        Publish the result with ModelRegistry.publish to get a rollback point.
+        
+        Args:
+            df: new data in the generate_training_data layout
+            new_trees: trees added to and retired from each forest
+            lstm_epochs: LSTM fine-tuning epochs (0 to skip)
+            seed: random_state of the new trees
+            
+        Returns:
+            dict report of what was updated
+        """
+        if isinstance(self.rf_model, CompiledForest) or isinstance(self.anomaly_detector, CompiledForest):
+            raise ValueError("Incremental updates need the sklearn estimators; load the pickle format")
+        if self.rf_model is None:
+            raise ValueError("Model not trained")
+        
+        print(f"Updating models with {len(df)} new samples...")
+        df = self.prepare_features(df.copy())
+        X = df[RF_FEATURE_COLUMNS].fillna(0).values
+        report = {'samples': len(df)}
+        
+        # Scalers: fold the new data in, then move the old trees onto the new scale
+        forests = [(self.rf_model, self.scaler, X)]
+        if self.anomaly_detector is not None:
+            forests.append((self.anomaly_detector, self.anomaly_scaler, X[:, :len(ANOMALY_FEATURE_COLUMNS)]))
+        for forest, scaler, rows in forests:
+            old_mean, old_scale = scaler.mean_.copy(), scaler.scale_.copy()
+            scaler.partial_fit(rows)
+            _remap_thresholds(forest, old_mean, old_scale, scaler.mean_, scaler.scale_)
+        report['scaler_samples_seen'] = int(self.scaler.n_samples_seen_)
+        
+        rf_input, anomaly_input = self._model_inputs(X)
+        
+        # Random Forest: warm-start new trees on the new window, retire the oldest
+        _rotate_trees(self.rf_model, rf_input, df['voltage_spike_risk'].values, new_trees, seed)
+        report['rf_trees'] = len(self.rf_model.estimators_)
+        
+        if self.anomaly_detector is not None:
+            _rotate_trees(self.anomaly_detector, anomaly_input, None, new_trees, seed)
+            # Re-derive the contamination threshold with the rotated ensemble
+            if self.anomaly_detector.contamination != 'auto':
+                self.anomaly_detector.offset_ = np.percentile(
+                    self.anomaly_detector.score_samples(anomaly_input),
+                    100.0 * self.anomaly_detector.contamination
+                )
+            report['anomaly_trees'] = len(self.anomaly_detector.estimators_)
+        
+        # LSTM: a few epochs from the current weights
+        if lstm_epochs and (self.lstm_model is not None or self.lstm_path):
+            from sequence_windows import WindowedSeries
+            
+            if self.lstm_model is None:
+                self.lstm_model = _keras().models.load_model(self.lstm_path)
+            window = self.lstm_model.input_shape[1]
+            horizon = self.lstm_model.output_shape[-1]
+            voltage_mean, voltage_scale = self._voltage_scaling()
+            windows = WindowedSeries((df['voltage'].values - voltage_mean) / voltage_scale, window, horizon)
+            history = self.lstm_model.fit(windows.dataset(batch_size=32, seed=seed), epochs=lstm_epochs, verbose=0)
+            report['lstm_loss'] = float(history.history['loss'][-1])
+        
+        print(f"Models updated: {report}")
+        return report
+    
+    def save_models(self, model_dir="models/", format="pickle", components=MODEL_COMPONENTS):
+        """
+        Save trained models
+        
+        Every model is saved with its own scaler: scaler.pkl (RF),
+        anomaly_scaler.pkl and lstm_scaler.pkl.
+        
+        Args:
+            model_dir: output directory
+            format: 'pickle' (joblib) or 'flat', which writes the RF and the
+                    anomaly detector as memory-mappable node arrays (see
+                    model_store.py) with their scalers folded into the thresholds
+            components: sub-models to write, any of MODEL_COMPONENTS (separately
+                        trained models can be saved into one directory)
+        """
+        if format not in ('pickle', 'flat'):
+            raise ValueError(f"Unknown model format: {format}")
         os.makedirs(model_dir, exist_ok=True)
         
-        if self.rf_model:
-            joblib.dump(self.rf_model, f"{model_dir}/rf_model.pkl")
-        if self.lstm_model:
-            self.lstm_model.save(f"{model_dir}/lstm_model.h5")
-        if self.anomaly_detector:
-            joblib.dump(self.anomaly_detector, f"{model_dir}/anomaly_detector.pkl")
+        forests = []
+        if 'rf' in components:
+            forests.append(('rf_model', self.rf_model, self.scaler))
+        if 'anomaly' in components:
+            forests.append(('anomaly_detector', self.anomaly_detector, self.anomaly_scaler))
+        for name, forest, scaler in forests:
+            if forest is None:
+                continue
+            if format == 'flat':
+                if not isinstance(forest, CompiledForest):
+                    forest = compile_forest(forest, scaler=scaler, input_dtype=np.float64,
+                                            scaler_columns=np.arange(forest.n_features_in_))
+                save_forest(forest, f"{model_dir}/{name}", metadata={
+                    'scaler_folded': True,
+                    'feature_columns': self.feature_columns
+                })
+            else:
+                joblib.dump(forest, f"{model_dir}/{name}.pkl")
+        lstm_path = f"{model_dir}/lstm_model.h5"
+        if 'lstm' in components:
+            if self.lstm_model:
+                self.lstm_model.save(lstm_path)
+            elif self.lstm_path and not (os.path.exists(lstm_path) and os.path.samefile(self.lstm_path, lstm_path)):
+                # Loaded lazily and never used: copy the saved file as is
+                shutil.copy2(self.lstm_path, lstm_path)
+        if 'direct' in components and self.direct_forecaster:
+            joblib.dump(self.direct_forecaster, f"{model_dir}/direct_forecaster.pkl")
+        if 'lstm' in components or 'direct' in components:
+            # load_models requires the declared engine's file, so never declare an LSTM without one
+            if self.forecast_engine != 'lstm' or os.path.exists(lstm_path):
+                with open(f"{model_dir}/forecast.json", 'w') as f:
+                    json.dump({'engine': self.forecast_engine}, f)
+            else:
+                print(f"No LSTM to save; forecast engine not recorded in {model_dir}")
         
-        joblib.dump(self.scaler, f"{model_dir}/scaler.pkl")
+        if 'rf' in components:
+            joblib.dump(self.scaler, f"{model_dir}/scaler.pkl")
+        if 'anomaly' in components and hasattr(self.anomaly_scaler, 'mean_'):
+            joblib.dump(self.anomaly_scaler, f"{model_dir}/anomaly_scaler.pkl")
+        if 'lstm' in components and hasattr(self.lstm_scaler, 'mean_'):
+            joblib.dump(self.lstm_scaler, f"{model_dir}/lstm_scaler.pkl")
         
         print(f"Models saved to {model_dir}")
     
-    def load_models(self, model_dir="models/"):
-        """Load pre-trained models"""
+    def load_models(self, model_dir="models/", components=MODEL_COMPONENTS, format="auto"):
+        """
+        Load pre-trained models
+        
+        Args:
+            model_dir: directory written by save_models
+            components: sub-models to load, any of MODEL_COMPONENTS; use
+                        INFERENCE_COMPONENTS for RF + IsolationForest only.
+                        The LSTM is only located here and loaded (importing
+                        TensorFlow) on the first predict_next_24_hours call;
+                        'lstm' and 'direct' are skipped when the saved forecast
+                        engine is the other one and its file is missing.
+            format: 'pickle', 'flat' (memory-mapped, shared between worker
+                    processes) or 'auto' to use flat arrays when present
+        """
+        unknown = set(components) - set(MODEL_COMPONENTS)
+        if unknown:
+            raise ValueError(f"Unknown model components: {sorted(unknown)}")
+        
         try:
-            self.rf_model = joblib.load(f"{model_dir}/rf_model.pkl")
-            self.lstm_model = keras.models.load_model(f"{model_dir}/lstm_model.h5")
-            self.anomaly_detector = joblib.load(f"{model_dir}/anomaly_detector.pkl")
-            self.scaler = joblib.load(f"{model_dir}/scaler.pkl")
+            with self.metrics.stage('spike.model_load'):
+                flat = format == 'flat' or (format == 'auto' and is_forest_dir(f"{model_dir}/rf_model"))
+                if 'rf' in components:
+                    if flat:
+                        self.rf_model, _ = load_forest(f"{model_dir}/rf_model")
+                    else:
+                        self.rf_model = joblib.load(f"{model_dir}/rf_model.pkl")
+                if 'anomaly' in components:
+                    if flat:
+                        self.anomaly_detector, _ = load_forest(f"{model_dir}/anomaly_detector")
+                    else:
+                        self.anomaly_detector = joblib.load(f"{model_dir}/anomaly_detector.pkl")
+                if os.path.exists(f"{model_dir}/scaler.pkl"):
+                    self.scaler = joblib.load(f"{model_dir}/scaler.pkl")
+                # Directories saved before the per-model scalers used columns of scaler.pkl
+                if os.path.exists(f"{model_dir}/anomaly_scaler.pkl"):
+                    self.anomaly_scaler = joblib.load(f"{model_dir}/anomaly_scaler.pkl")
+                elif getattr(self.scaler, 'n_features_in_', 0) >= len(ANOMALY_FEATURE_COLUMNS):
+                    self.anomaly_scaler = _column_scaler(self.scaler, np.arange(len(ANOMALY_FEATURE_COLUMNS)))
+                if os.path.exists(f"{model_dir}/lstm_scaler.pkl"):
+                    self.lstm_scaler = joblib.load(f"{model_dir}/lstm_scaler.pkl")
+                elif hasattr(self.scaler, 'mean_'):
+                    self.lstm_scaler = _column_scaler(self.scaler, np.arange(1))
+                saved_engine = None
+                if os.path.exists(f"{model_dir}/forecast.json"):
+                    with open(f"{model_dir}/forecast.json", 'r') as f:
+                        self.forecast_engine = saved_engine = json.load(f)['engine']
+                if 'lstm' in components:
+                    lstm_path = f"{model_dir}/lstm_model.h5"
+                    if os.path.exists(lstm_path):
+                        self.lstm_path = lstm_path
+                        self.lstm_model = None
+                    elif saved_engine == 'lstm':
+                        raise FileNotFoundError(lstm_path)
+                if 'direct' in components:
+                    direct_path = f"{model_dir}/direct_forecaster.pkl"
+                    if os.path.exists(direct_path):
+                        self.direct_forecaster = joblib.load(direct_path)
+                    elif saved_engine == 'direct':
+                        raise FileNotFoundError(direct_path)
+            self.metrics.increment('model_loads', status='ok')
             print(f"Models loaded from {model_dir}")
         except Exception as e:
+            self.metrics.increment('model_loads', status='error')
             print(f"Error loading models: {e}")
     
     def generate_report(self, data):
@@ -430,6 +1019,13 @@ class VoltageSpikePredictionModel:
         
         return report
 
+
+def load_inference_model(model_dir="models/", metrics=None):
+    """Lightweight entry point: RF + IsolationForest for predict_voltage_spike, no TensorFlow"""
+    model = VoltageSpikePredictionModel(metrics=metrics)
+    model.load_models(model_dir, components=INFERENCE_COMPONENTS)
+    return model
+
 # Example usage and testing
 if __name__ == "__main__":
     # Initialize model
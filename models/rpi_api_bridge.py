@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 # Fence Detection API Bridge - Connects trained fence detection models to Next.js API
 # This script is called from the Next.js API to run fence detection predictions
+#
+# One-shot mode (default): read one JSON feature dict from stdin, print one result.
+# Daemon mode (--serve): load the models once, then answer newline-delimited JSON
+# requests over stdin/stdout or a Unix domain socket (--socket PATH).
 
 import sys
 import json
@@ -8,35 +12,79 @@ import numpy as np
 import joblib
 from datetime import datetime
 import os
+import time
+import signal
+import argparse
+import threading
+import socketserver
+
+from fence_features import build_feature_matrix, fence_threshold, fence_labels
+from prediction_cache import PredictionCache
+from model_store import is_forest_dir, load_forest, FoldedScaler
+from inference_metrics import InferenceMetrics, resolve as resolve_metrics
 
 class FenceDetectionBridge:
-    def __init__(self):
+    def __init__(self, model_dir=None, cache=None, metrics=None):
+        # Default to the directory where this script is located
+        self.model_dir = model_dir or os.path.dirname(os.path.abspath(__file__))
+        self.cache = cache  # optional PredictionCache shared by all prediction paths
+        self.metrics = resolve_metrics(metrics)  # disabled InferenceMetrics unless one is passed
         self.model = None
         self.scaler = None
         self.config = None
         self.essential_features = None
+        self._models_lock = threading.Lock()  # model, scaler, config and features change together
+        self.started_at = time.monotonic()
+        self.requests_served = 0
         self.load_models()
     
     def load_models(self):
-        """Load the trained fence detection models"""
+        """
+        Load the trained fence detection models
+        
+        The new model, scaler and config are swapped in together; if loading
+        fails, the models already in service stay in service.
+        
+        Returns:
+            True if the models were (re)loaded
+        """
         try:
-            # Get the directory where this script is located
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            
-            # Load model and scaler
-            self.model = joblib.load(os.path.join(script_dir, 'rpi_fence_detector.pkl'))
-            self.scaler = joblib.load(os.path.join(script_dir, 'rpi_scaler.pkl'))
-            
-            # Load configuration
-            with open(os.path.join(script_dir, 'rpi_config.json'), 'r') as f:
-                self.config = json.load(f)
-            
-            self.essential_features = self.config['essential_features']
+            with self.metrics.stage('bridge.model_load'):
+                if is_forest_dir(self.model_dir):
+                    # Memory-mapped model directory; the scaler is folded into the trees
+                    model, metadata = load_forest(self.model_dir)
+                    scaler = FoldedScaler()
+                    config = metadata['config']
+                else:
+                    # Load model and scaler
+                    model = joblib.load(os.path.join(self.model_dir, 'rpi_fence_detector.pkl'))
+                    scaler = joblib.load(os.path.join(self.model_dir, 'rpi_scaler.pkl'))
+                    
+                    # Load configuration
+                    with open(os.path.join(self.model_dir, 'rpi_config.json'), 'r') as f:
+                        config = json.load(f)
+                
+                essential_features = config['essential_features']
+                
+                with self._models_lock:
+                    self.model, self.scaler, self.config = model, scaler, config
+                    self.essential_features = essential_features
+                    if self.cache is not None:
+                        self.cache.bind(essential_features, config.get('feature_ranges'),
+                                        config.get('model_info', {}).get('version'))
+            self.metrics.increment('model_loads', status='ok')
+            return True
             
         except Exception as e:
-            print(f"Error loading models: {e}", file=sys.stderr)
-            self.model = None
-            self.scaler = None
+            keeping = " (keeping the loaded models)" if self.model is not None else ""
+            print(f"Error loading models: {e}{keeping}", file=sys.stderr)
+            self.metrics.increment('model_loads', status='error')
+            return False
+    
+    def _models(self):
+        """(model, scaler, config, essential_features) from a single load, for one request"""
+        with self._models_lock:
+            return self.model, self.scaler, self.config, self.essential_features
     
     def predict_fence(self, tdr_features):
         """
@@ -48,7 +96,10 @@ class FenceDetectionBridge:
         Returns:
             dict with prediction results
         """
-        if self.model is None or self.scaler is None:
+        metrics = self.metrics
+        model, scaler, config, essential_features = self._models()
+        if model is None or scaler is None:
+            metrics.increment('errors', stage='bridge.predict_fence')
             return {
                 'error': 'Models not loaded',
                 'is_fence': False,
@@ -59,31 +110,50 @@ class FenceDetectionBridge:
         
         try:
             # Extract features in correct order
-            feature_vector = np.array([tdr_features.get(feat, 0) for feat in self.essential_features])
-            feature_vector = feature_vector.reshape(1, -1).astype(np.float32)
+            with metrics.stage('fence.features'):
+                feature_vector = build_feature_matrix(tdr_features, essential_features, default=0)
             
-            # Normalize
-            feature_vector_scaled = self.scaler.transform(feature_vector)
+            probabilities = None
+            if self.cache is not None:
+                with metrics.stage('fence.cache'):
+                    cache_key = self.cache.keys(feature_vector)[0]
+                    probabilities = self.cache.get(cache_key)
+                metrics.increment('cache_hits' if probabilities is not None else 'cache_misses')
+            cached = probabilities is not None
             
-            # Predict
-            import time
-            start_time = time.time()
-            prediction = self.model.predict(feature_vector_scaled)[0]
-            probability = self.model.predict_proba(feature_vector_scaled)[0][1]
-            inference_time = (time.time() - start_time) * 1000
+            inference_time = 0.0
+            if not cached:
+                # Normalize
+                with metrics.stage('fence.scale'):
+                    feature_vector_scaled = scaler.transform(feature_vector)
+                
+                # Predict (one forest pass; the label is derived from the probability)
+                start_time = time.perf_counter()
+                with metrics.stage('fence.predict'):
+                    probabilities = model.predict_proba(feature_vector_scaled)[0]
+                inference_time = (time.perf_counter() - start_time) * 1000
+                
+                if self.cache is not None:
+                    self.cache.put(cache_key, probabilities)
             
-            result = {
-                'is_fence': bool(prediction == 1),
-                'confidence': float(probability),
-                'inference_time_ms': inference_time,
-                'timestamp': datetime.now().isoformat(),
-                'features_used': self.essential_features,
-                'model_version': self.config.get('model_info', {}).get('version', '1.0.0')
-            }
+            with metrics.stage('fence.postprocess'):
+                probability = probabilities[1]
+                
+                result = {
+                    'is_fence': bool(fence_labels(probability, fence_threshold(config))),
+                    'confidence': float(probability),
+                    'inference_time_ms': inference_time,
+                    'timestamp': datetime.now().isoformat(),
+                    'features_used': essential_features,
+                    'model_version': config.get('model_info', {}).get('version', '1.0.0'),
+                    'cached': cached
+                }
+            metrics.increment('predictions', path='single')
             
             return result
             
         except Exception as e:
+            metrics.increment('errors', stage='bridge.predict_fence')
             return {
                 'error': str(e),
                 'is_fence': False,
@@ -91,8 +161,255 @@ class FenceDetectionBridge:
                 'inference_time_ms': 0,
                 'timestamp': datetime.now().isoformat()
             }
+    
+    def predict_fence_batch(self, inputs):
+        """
+        Score a batch of measurements with one scaler transform and one predict_proba pass
+        
+        Args:
+            inputs: list of feature dicts, (N, 6) array or NDJSON stream
+                    (missing features default to 0, as in predict_fence)
+            
+        Returns:
+            dict with per-row results and per-batch timing
+        """
+        metrics = self.metrics
+        model, scaler, config, essential_features = self._models()
+        if model is None or scaler is None:
+            metrics.increment('errors', stage='bridge.predict_fence_batch')
+            return {
+                'error': 'Models not loaded',
+                'results': [],
+                'batch_size': 0,
+                'timestamp': datetime.now().isoformat()
+            }
+        
+        try:
+            start_time = time.perf_counter()
+            features = build_feature_matrix(inputs, essential_features, default=0)
+            features_time = time.perf_counter()
+            
+            threshold = fence_threshold(config)
+            probability_rows = np.empty((len(features), len(model.classes_)))
+            misses = np.ones(len(features), dtype=bool)
+            
+            if self.cache is not None:
+                cache_keys = self.cache.keys(features)
+                for i, key in enumerate(cache_keys):
+                    row = self.cache.get(key)
+                    if row is not None:
+                        probability_rows[i] = row
+                        misses[i] = False
+            
+            if misses.any():
+                features_scaled = scaler.transform(features if misses.all() else features[misses])
+                scale_time = time.perf_counter()
+                probability_rows[misses] = model.predict_proba(features_scaled)
+                
+                if self.cache is not None:
+                    for i in np.flatnonzero(misses):
+                        self.cache.put(cache_keys[i], probability_rows[i].copy())
+            else:
+                scale_time = time.perf_counter()
+            probabilities = probability_rows[:, 1]
+            predict_time = time.perf_counter()
+            
+            is_fence = fence_labels(probabilities, threshold)
+            results = [
+                {'is_fence': bool(fence), 'confidence': float(probability)}
+                for fence, probability in zip(is_fence.tolist(), probabilities.tolist())
+            ]
+            end_time = time.perf_counter()
+            
+            cache_hits = int(len(features) - misses.sum())
+            if metrics.enabled:
+                metrics.observe('fence_batch.features', (features_time - start_time) * 1000)
+                metrics.observe('fence_batch.scale', (scale_time - features_time) * 1000)
+                metrics.observe('fence_batch.predict', (predict_time - scale_time) * 1000)
+                metrics.observe('fence_batch.postprocess', (end_time - predict_time) * 1000)
+                metrics.increment('predictions', len(results), path='batch')
+                if self.cache is not None:
+                    metrics.increment('cache_hits', cache_hits)
+                    metrics.increment('cache_misses', len(results) - cache_hits)
+            
+            return {
+                'results': results,
+                'batch_size': len(results),
+                'fence_count': int(is_fence.sum()),
+                'cache_hits': cache_hits,
+                'fence_confidence_threshold': threshold,
+                'timing_ms': {
+                    'features': (features_time - start_time) * 1000,
+                    'scale': (scale_time - features_time) * 1000,
+                    'predict': (predict_time - scale_time) * 1000,
+                    'total': (end_time - start_time) * 1000
+                },
+                'timestamp': datetime.now().isoformat(),
+                'features_used': essential_features,
+                'model_version': config.get('model_info', {}).get('version', '1.0.0')
+            }
+            
+        except Exception as e:
+            metrics.increment('errors', stage='bridge.predict_fence_batch')
+            return {
+                'error': str(e),
+                'results': [],
+                'batch_size': 0,
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    def health(self):
+        """Readiness information for daemon handshakes and health checks"""
+        model, scaler, config, essential_features = self._models()
+        ready = model is not None and scaler is not None
+        return {
+            'status': 'ready' if ready else 'degraded',
+            'models_loaded': ready,
+            'model_version': (config or {}).get('model_info', {}).get('version'),
+            'features_used': essential_features,
+            'uptime_s': time.monotonic() - self.started_at,
+            'requests_served': self.requests_served,
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'metrics_enabled': self.metrics.enabled,
+            'pid': os.getpid()
+        }
+
+
+def handle_request(bridge, request):
+    """
+    Answer one daemon request
+    
+    Args:
+        bridge: loaded FenceDetectionBridge
+        request: dict with optional 'id', 'op' ('predict', 'predict_batch', 'health',
+                 'metrics', 'reload' or 'shutdown') and 'features' ('instances' for
+                 predict_batch); a bare feature dict is treated as a predict request.
+                 'metrics' takes an optional 'format': 'json' (default) or 'prometheus'
+        
+    Returns:
+        (response dict, shutdown flag)
+    """
+    if not isinstance(request, dict):
+        return {'id': None, 'error': 'Request must be a JSON object'}, False
+    
+    request_id = request.get('id')
+    op = request.get('op', 'predict')
+    
+    if op == 'predict':
+        features = request.get('features')
+        if features is None:
+            features = {k: v for k, v in request.items() if k not in ('id', 'op')}
+        response = bridge.predict_fence(features)
+        bridge.requests_served += 1
+    elif op == 'predict_batch':
+        response = bridge.predict_fence_batch(request.get('instances', []))
+        bridge.requests_served += 1
+    elif op == 'health':
+        response = bridge.health()
+    elif op == 'metrics':
+        if request.get('format') == 'prometheus':
+            response = {'content_type': 'text/plain; version=0.0.4', 'text': bridge.metrics.to_prometheus()}
+        else:
+            response = bridge.metrics.snapshot()
+    elif op == 'reload':
+        # Picks up new pickles/config; the cache is cleared if model_info.version changed.
+        # A failed reload keeps the current models serving.
+        reloaded = bridge.load_models()
+        response = dict(bridge.health(), reloaded=reloaded)
+    elif op == 'shutdown':
+        return {'id': request_id, 'status': 'shutting_down'}, True
+    else:
+        response = {'error': f'Unknown op: {op}'}
+    
+    return dict(response, id=request_id), False
+
+
+def handle_line(bridge, line):
+    """Parse one NDJSON request line and return (response line, shutdown flag)"""
+    metrics = bridge.metrics
+    with metrics.stage('daemon.request'):
+        try:
+            with metrics.stage('daemon.parse'):
+                request = json.loads(line)
+        except ValueError as e:
+            metrics.increment('errors', stage='daemon.parse')
+            return json.dumps({'id': None, 'error': f'Invalid JSON: {e}'}), False
+        
+        response, shutdown = handle_request(bridge, request)
+        with metrics.stage('daemon.serialize'):
+            response_line = json.dumps(response)
+    metrics.sample_memory()
+    return response_line, shutdown
+
+
+def serve_stdio(bridge):
+    """Serve NDJSON requests from stdin, writing one response line per request to stdout"""
+    print(json.dumps(dict(bridge.health(), event='ready')), flush=True)
+    
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        response_line, shutdown = handle_line(bridge, line)
+        print(response_line, flush=True)
+        if shutdown:
+            break
+
+
+class _BridgeRequestHandler(socketserver.StreamRequestHandler):
+    """One client connection; requests on it may be pipelined and are answered in order"""
+    
+    def handle(self):
+        bridge = self.server.bridge
+        self._send(json.dumps(dict(bridge.health(), event='ready')))
+        
+        for raw in self.rfile:
+            line = raw.decode('utf-8').strip()
+            if not line:
+                continue
+            response_line, shutdown = handle_line(bridge, line)
+            self._send(response_line)
+            if shutdown:
+                # shutdown() blocks until serve_forever returns, so call it off this thread
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                break
+    
+    def _send(self, line):
+        self.wfile.write(line.encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+
+class BridgeSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    
+    def __init__(self, socket_path, bridge):
+        self.bridge = bridge
+        super().__init__(socket_path, _BridgeRequestHandler)
 
-def main():
+
+def serve_socket(bridge, socket_path):
+    """Serve NDJSON requests on a Unix domain socket until shutdown or SIGTERM/SIGINT"""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    
+    server = BridgeSocketServer(socket_path, bridge)
+    
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    print(json.dumps(dict(bridge.health(), event='ready', socket=socket_path)), flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print(json.dumps({'event': 'stopped', 'requests_served': bridge.requests_served}), flush=True)
+
+
+def main(model_dir=None):
     """Main function to handle API calls"""
     try:
         # Read input from stdin (sent from Next.js API)
@@ -112,9 +429,12 @@ def main():
         # Parse input
         tdr_features = json.loads(input_data)
         
-        # Initialize bridge and make prediction
-        bridge = FenceDetectionBridge()
-        result = bridge.predict_fence(tdr_features)
+        # Initialize bridge and make prediction (a JSON list is scored as one batch)
+        bridge = FenceDetectionBridge(model_dir)
+        if isinstance(tdr_features, list):
+            result = bridge.predict_fence_batch(tdr_features)
+        else:
+            result = bridge.predict_fence(tdr_features)
         
         # Output result as JSON
         print(json.dumps(result))
@@ -130,4 +450,38 @@ def main():
         print(json.dumps(error_result))
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Fence detection bridge')
+    parser.add_argument('--serve', action='store_true',
+                        help='keep the models loaded and serve NDJSON requests')
+    parser.add_argument('--socket', metavar='PATH',
+                        help='serve on a Unix domain socket instead of stdin/stdout')
+    parser.add_argument('--model-dir', metavar='DIR',
+                        help='directory holding the model pickles and rpi_config.json, '
+                             'or a model directory written by model_store.py')
+    parser.add_argument('--batch', action='store_true',
+                        help='score an NDJSON stream from stdin as one batch')
+    parser.add_argument('--cache-size', type=int, default=10000,
+                        help='daemon result cache entries (0 disables the cache)')
+    parser.add_argument('--cache-ttl', type=float, default=60.0,
+                        help='daemon result cache time-to-live in seconds')
+    parser.add_argument('--cache-quantization', type=int, metavar='LEVELS',
+                        help='snap features to LEVELS steps of their feature_ranges before caching')
+    parser.add_argument('--metrics', action='store_true',
+                        help="record per-stage latencies and counters (daemon 'metrics' op)")
+    args = parser.parse_args()
+    
+    if args.batch:
+        bridge = FenceDetectionBridge(args.model_dir)
+        print(json.dumps(bridge.predict_fence_batch(sys.stdin)))
+    elif args.serve:
+        cache = None
+        if args.cache_size > 0:
+            cache = PredictionCache(args.cache_size, args.cache_ttl, args.cache_quantization)
+        metrics = InferenceMetrics() if args.metrics else None
+        bridge = FenceDetectionBridge(args.model_dir, cache=cache, metrics=metrics)
+        if args.socket:
+            serve_socket(bridge, args.socket)
+        else:
+            serve_stdio(bridge)
+    else:
+        main(args.model_dir)
@@ -9,19 +9,42 @@ import time
 from datetime import datetime
 import logging
 
+from fence_features import build_feature_matrix, fence_threshold, fence_labels
+from tdr_features import WaveformFeatureExtractor, DEFAULT_SAMPLING_RATE, DEFAULT_LINE_IMPEDANCE
+from model_store import is_forest_dir, load_forest, FoldedScaler
+from inference_metrics import resolve as resolve_metrics
+
 class RPiFenceDetector:
-    def __init__(self, model_path='rpi_models'):
+    def __init__(self, model_path='rpi_models', metrics=None):
         print("Loading RPi TDR Fence Detector...")
+        self.metrics = resolve_metrics(metrics)  # optional InferenceMetrics
         
-        # Load model and scaler
-        self.model = joblib.load(f'{model_path}/rpi_fence_detector.pkl')
-        self.scaler = joblib.load(f'{model_path}/rpi_scaler.pkl')
-        
-        # Load configuration
-        with open(f'{model_path}/rpi_config.json', 'r') as f:
-            self.config = json.load(f)
+        with self.metrics.stage('rpi.model_load'):
+            if is_forest_dir(model_path):
+                # Memory-mapped model directory (see model_store.py); shared between
+                # detector processes and already carrying the folded scaler and config
+                self.model, metadata = load_forest(model_path)
+                self.scaler = FoldedScaler()
+                self.config = metadata['config']
+            else:
+                # Load model and scaler
+                self.model = joblib.load(f'{model_path}/rpi_fence_detector.pkl')
+                self.scaler = joblib.load(f'{model_path}/rpi_scaler.pkl')
+                
+                # Load configuration
+                with open(f'{model_path}/rpi_config.json', 'r') as f:
+                    self.config = json.load(f)
+        self.metrics.increment('model_loads', status='ok')
         
         self.essential_features = self.config['essential_features']
+        
+        # Raw sweep -> essential features (optional 'tdr' config block, MATLAB dataset defaults)
+        tdr_config = self.config.get('tdr', {})
+        self.waveform_extractor = WaveformFeatureExtractor(
+            self.essential_features,
+            dt=1 / tdr_config.get('sampling_rate', DEFAULT_SAMPLING_RATE),
+            z0=tdr_config.get('line_impedance', DEFAULT_LINE_IMPEDANCE)
+        )
         print(f"Model loaded successfully!")
         print(f"Features: {', '.join(self.essential_features)}")
         
@@ -46,22 +69,25 @@ class RPiFenceDetector:
         Returns:
             dict with prediction results
         """
+        metrics = self.metrics
         try:
             # Extract features in correct order
-            feature_vector = np.array([tdr_features[feat] for feat in self.essential_features])
-            feature_vector = feature_vector.reshape(1, -1).astype(np.float32)
+            with metrics.stage('rpi.features'):
+                feature_vector = np.array([tdr_features[feat] for feat in self.essential_features])
+                feature_vector = feature_vector.reshape(1, -1).astype(np.float32)
             
             # Normalize
-            feature_vector_scaled = self.scaler.transform(feature_vector)
+            with metrics.stage('rpi.scale'):
+                feature_vector_scaled = self.scaler.transform(feature_vector)
             
-            # Predict
-            start_time = time.time()
-            prediction = self.model.predict(feature_vector_scaled)[0]
-            probability = self.model.predict_proba(feature_vector_scaled)[0][1]
-            inference_time = (time.time() - start_time) * 1000
+            # Predict (same labeling rule as predict_fence_batch)
+            start_time = time.perf_counter()
+            with metrics.stage('rpi.predict'):
+                probability = self.model.predict_proba(feature_vector_scaled)[0][1]
+            inference_time = (time.perf_counter() - start_time) * 1000
             
             result = {
-                'is_fence': bool(prediction == 1),
+                'is_fence': bool(fence_labels(probability, fence_threshold(self.config))),
                 'confidence': float(probability),
                 'inference_time_ms': inference_time,
                 'timestamp': datetime.now().isoformat()
@@ -69,13 +95,112 @@ class RPiFenceDetector:
             
             # Log if fence detected
             if result['is_fence']:
-                self.logger.warning(f"FENCE DETECTED! Confidence: {probability:.3f}")
+                with metrics.stage('rpi.log'):
+                    self.logger.warning(f"FENCE DETECTED! Confidence: {probability:.3f}")
+            metrics.increment('predictions', path='single')
             
             return result
             
         except Exception as e:
+            metrics.increment('errors', stage='rpi.predict_fence')
             self.logger.error(f"Prediction error: {str(e)}")
             return {'error': str(e)}
+    
+    def predict_fence_batch(self, measurements):
+        """
+        Predict a batch of measurements in one vectorized pass
+        
+        Args:
+            measurements: list of feature dicts, (N, 6) array or NDJSON stream
+            
+        Returns:
+            dict with per-row results and per-batch timing
+        """
+        try:
+            start_time = time.perf_counter()
+            feature_matrix = build_feature_matrix(measurements, self.essential_features)
+            features_time = time.perf_counter()
+            
+            threshold = fence_threshold(self.config)
+            if len(feature_matrix):
+                # Normalize
+                feature_matrix_scaled = self.scaler.transform(feature_matrix)
+                scale_time = time.perf_counter()
+                
+                # One forest pass; the label is derived from the probability
+                probabilities = self.model.predict_proba(feature_matrix_scaled)[:, 1]
+            else:
+                scale_time = time.perf_counter()
+                probabilities = np.empty(0)
+            predict_time = time.perf_counter()
+            
+            is_fence = fence_labels(probabilities, threshold)
+            results = [
+                {'is_fence': bool(fence), 'confidence': float(probability)}
+                for fence, probability in zip(is_fence.tolist(), probabilities.tolist())
+            ]
+            end_time = time.perf_counter()
+            
+            fence_count = int(is_fence.sum())
+            if fence_count:
+                self.logger.warning(f"FENCE DETECTED in {fence_count} of {len(results)} measurements! "
+                                    f"Max confidence: {probabilities.max():.3f}")
+            log_time = time.perf_counter()
+            
+            metrics = self.metrics
+            if metrics.enabled:
+                metrics.observe('rpi_batch.features', (features_time - start_time) * 1000)
+                metrics.observe('rpi_batch.scale', (scale_time - features_time) * 1000)
+                metrics.observe('rpi_batch.predict', (predict_time - scale_time) * 1000)
+                metrics.observe('rpi_batch.postprocess', (end_time - predict_time) * 1000)
+                metrics.observe('rpi_batch.log', (log_time - end_time) * 1000)
+                metrics.increment('predictions', len(results), path='batch')
+            
+            return {
+                'results': results,
+                'batch_size': len(results),
+                'fence_count': fence_count,
+                'timing_ms': {
+                    'features': (features_time - start_time) * 1000,
+                    'scale': (scale_time - features_time) * 1000,
+                    'predict': (predict_time - scale_time) * 1000,
+                    'total': (end_time - start_time) * 1000
+                },
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            self.metrics.increment('errors', stage='rpi.predict_fence_batch')
+            self.logger.error(f"Batch prediction error: {str(e)}")
+            return {'error': str(e)}
+
+    def predict_waveforms(self, incident, reflected, electrical):
+        """
+        Predict straight from captured sweeps and V/I readings
+        
+        Args:
+            incident, reflected: (N, samples) or (samples,) TDR waveforms
+            electrical: dict with V_rms, I_rms, P_active and power_factor
+                        (arrays of length N or scalars)
+            
+        Returns:
+            predict_fence_batch result, with the waveform feature time in timing_ms
+        """
+        try:
+            start_time = time.perf_counter()
+            with self.metrics.stage('rpi.waveform_features'):
+                feature_matrix = self.waveform_extractor.extract(incident, reflected, electrical)
+            features_time = (time.perf_counter() - start_time) * 1000
+        except Exception as e:
+            self.metrics.increment('errors', stage='rpi.predict_waveforms')
+            self.logger.error(f"Waveform feature error: {str(e)}")
+            return {'error': str(e)}
+        
+        result = self.predict_fence_batch(feature_matrix)
+        if 'timing_ms' in result:
+            result['timing_ms']['waveform_features'] = features_time
+            result['timing_ms']['total'] += features_time
+        return result
 
 # Example usage
 if __name__ == "__main__":
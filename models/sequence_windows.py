@@ -0,0 +1,195 @@
+# sequence_windows.py
+# Sliding-window sequence pipeline for LSTM training without materializing the windows
+#
+# A (N - window) x window copy of the series is what create_sequences used to
+# build. Here the series stays one float32 array, windows are read-only strided
+# views (np.lib.stride_tricks.sliding_window_view) and training batches are
+# gathered from window start offsets, so memory is the series plus one int32 per
+# window. Several feeders are concatenated into one array and windows never
+# cross a feeder boundary.
+#
+#   python sequence_windows.py --samples 500000   # memory/throughput comparison
+
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def window_views(series, window=24, horizon=1):
+    """
+    Zero-copy (inputs, targets) views over one series
+
+    Args:
+        series: 1-D array
+        window: input steps per sequence
+        horizon: future steps per target
+
+    Returns:
+        inputs: (n, window) view, row i = series[i:i+window]
+        targets: (n,) view for horizon 1, else (n, horizon) view of the next steps
+    """
+    series = np.asarray(series)
+    inputs = sliding_window_view(series[:len(series) - horizon], window)
+    targets = sliding_window_view(series[window:], horizon)
+    if horizon == 1:
+        targets = targets[:, 0]
+    return inputs, targets
+
+
+class WindowedSeries:
+    """
+    One or more series concatenated for windowed training
+
+    Args:
+        series: 1-D array, or a list of 1-D arrays (one per feeder)
+        window: input steps per sequence
+        horizon: future steps per target
+        dtype: storage dtype of the concatenated series
+    """
+
+    def __init__(self, series, window=24, horizon=1, dtype=np.float32):
+        if isinstance(series, np.ndarray) and series.ndim == 1:
+            series = [series]
+        self.window = window
+        self.horizon = horizon
+        self.values = np.concatenate([np.asarray(s, dtype=dtype) for s in series])
+
+        # Valid window starts per feeder: start + window + horizon <= feeder end
+        starts = []
+        offset = 0
+        for s in series:
+            n_windows = len(s) - window - horizon + 1
+            if n_windows > 0:
+                starts.append(np.arange(offset, offset + n_windows, dtype=np.int32))
+            offset += len(s)
+        self.starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int32)
+
+        self._input_offsets = np.arange(window, dtype=np.int32)
+        self._target_offsets = np.arange(window, window + horizon, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def split(self, *fractions):
+        """Chronological start-index splits, e.g. split(0.72, 0.08) -> train, validation, test"""
+        bounds = np.cumsum([0] + [int(len(self.starts) * f) for f in fractions] + [0])
+        bounds[-1] = len(self.starts)
+        return [self.starts[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def gather(self, starts):
+        """Materialize one batch: (b, window, 1) inputs and (b,) or (b, horizon) targets"""
+        inputs = self.values[starts[:, np.newaxis] + self._input_offsets][:, :, np.newaxis]
+        targets = self.values[starts[:, np.newaxis] + self._target_offsets]
+        if self.horizon == 1:
+            targets = targets[:, 0]
+        return inputs, targets
+
+    def iter_batches(self, starts=None, batch_size=32, shuffle=True, seed=None):
+        """NumPy batch iterator over the given window starts (all windows if None)"""
+        starts = self.starts if starts is None else starts
+        if shuffle:
+            starts = np.random.default_rng(seed).permutation(starts)
+        for i in range(0, len(starts), batch_size):
+            yield self.gather(starts[i:i + batch_size])
+
+    def dataset(self, starts=None, batch_size=32, shuffle=True, shuffle_buffer=None, seed=None):
+        """
+        tf.data pipeline over the given window starts: shuffle -> batch -> gather -> prefetch
+
+        Only the int32 start offsets pass through shuffle; each batch is gathered
+        from the series tensor on the fly.
+        """
+        import tensorflow as tf
+
+        starts = self.starts if starts is None else starts
+        values = tf.constant(self.values)
+        input_offsets = tf.constant(self._input_offsets)
+        target_offsets = tf.constant(self._target_offsets)
+        horizon = self.horizon
+
+        def gather(batch_starts):
+            batch_starts = batch_starts[:, tf.newaxis]
+            inputs = tf.gather(values, batch_starts + input_offsets)[:, :, tf.newaxis]
+            targets = tf.gather(values, batch_starts + target_offsets)
+            if horizon == 1:
+                targets = targets[:, 0]
+            return inputs, targets
+
+        ds = tf.data.Dataset.from_tensor_slices(starts)
+        if shuffle:
+            ds = ds.shuffle(shuffle_buffer or len(starts), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+        return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def _create_sequences(data, seq_length=24):
+    """The original list-append implementation, kept for the comparison below"""
+    sequences = []
+    targets = []
+
+    for i in range(len(data) - seq_length):
+        sequences.append(data[i:i + seq_length])
+        targets.append(data[i + seq_length])
+
+    return np.array(sequences), np.array(targets)
+
+
+def _measure(build, consume):
+    tracemalloc.start()
+    start = time.perf_counter()
+    source = build()
+    built = time.perf_counter()
+    n = consume(source)
+    end = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'build_s': built - start, 'epoch_s': end - built,
+            'windows_per_s': n / (end - start), 'peak_mb': peak / 2**20}
+
+
+def benchmark(samples=500000, window=24, batch_size=32):
+    """Peak traced memory and throughput of one shuffled epoch, list-append vs windowed"""
+    series = np.random.default_rng(0).normal(size=samples)
+
+    def consume_arrays(arrays):
+        X, y = arrays
+        order = np.random.default_rng(0).permutation(len(X))
+        for i in range(0, len(X), batch_size):
+            batch = order[i:i + batch_size]
+            X[batch].reshape(-1, window, 1), y[batch]
+        return len(X)
+
+    def consume_windows(windowed):
+        return sum(len(targets) for _, targets in windowed.iter_batches(batch_size=batch_size, seed=0))
+
+    report = {
+        'samples': samples,
+        'window': window,
+        'list_append': _measure(lambda: _create_sequences(series, window), consume_arrays),
+        'windowed_numpy': _measure(lambda: WindowedSeries(series, window), consume_windows)
+    }
+
+    try:
+        import tensorflow  # noqa: F401
+
+        def consume_dataset(windowed):
+            return sum(int(targets.shape[0]) for _, targets in windowed.dataset(batch_size=batch_size, seed=0))
+
+        report['windowed_tf_data'] = _measure(lambda: WindowedSeries(series, window), consume_dataset)
+    except ImportError:
+        report['windowed_tf_data'] = {'error': 'TensorFlow is not installed'}
+    return report
+
+
+if __name__ == "__main__":
+    import json
+
+    parser = argparse.ArgumentParser(description='Compare LSTM sequence construction strategies')
+    parser.add_argument('--samples', type=int, default=500000)
+    parser.add_argument('--window', type=int, default=24)
+    parser.add_argument('--batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    print(json.dumps(benchmark(args.samples, args.window, args.batch_size), indent=2))
@@ -0,0 +1,255 @@
+# synthetic_data.py
+# Columnar synthetic training data for VoltageSpikePredictionModel
+#
+# Same distributions as the original per-row generator, drawn a column at a
+# time from a seeded np.random.Generator. Large datasets are written as shards
+# (Parquet or structured .npy) with one independent RNG stream per shard,
+# spawned from a single SeedSequence, so shards can be generated by parallel
+# processes and any shard can be regenerated on its own. The output depends
+# only on (seed, base_date, chunk_size), never on the number of workers.
+#
+#   python synthetic_data.py --samples 50000000 --out data/spike_train --workers 4
+
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+SAMPLE_INTERVAL = np.timedelta64(10, 'm')
+
+# Column order and dtypes, matching generate_training_data's DataFrame
+COLUMNS = (
+    ('timestamp', 'datetime64[us]'),
+    ('voltage', 'float64'),
+    ('current', 'float64'),
+    ('frequency', 'float64'),
+    ('impedance', 'float64'),
+    ('power_factor', 'float64'),
+    ('temperature', 'float64'),
+    ('humidity', 'float64'),
+    ('time_hour', 'int64'),
+    ('time_minute', 'int64'),
+    ('day_of_week', 'int64'),
+    ('tdr_reflection', 'float64'),
+    ('is_illegal_fence', 'int64'),
+    ('voltage_spike_risk', 'int64'),
+)
+RECORD_DTYPE = np.dtype(list(COLUMNS))
+
+
+def default_base_date():
+    """One year before now, as the original generator used"""
+    return datetime.now() - timedelta(days=365)
+
+
+def generate_columns(start, count, seed, base_date):
+    """
+    Generate rows [start, start + count) as a dict of column arrays
+
+    Args:
+        start: index of the first row (sets the timestamps)
+        count: number of rows
+        seed: int, SeedSequence or Generator for this block's random stream
+        base_date: datetime of row 0
+
+    Returns:
+        dict mapping column name -> 1-D array, in COLUMNS order
+    """
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+    # Time features
+    timestamps = np.datetime64(base_date, 'us') + np.arange(start, start + count) * SAMPLE_INTERVAL
+    minutes = timestamps.astype('datetime64[m]').astype(np.int64)
+    hour = (minutes // 60) % 24
+    minute = minutes % 60
+    day_of_week = (minutes // 1440 + 3) % 7  # 1970-01-01 was a Thursday
+
+    # Seasonal and daily variations
+    daily_factor = np.sin(2 * np.pi * hour / 24)
+    weekly_factor = np.sin(2 * np.pi * day_of_week / 7)
+
+    # Normal variations
+    voltage = 230 + daily_factor * 10 + weekly_factor * 5 + rng.normal(0, 3, count)
+    current = 15 + daily_factor * 3 + weekly_factor * 2 + rng.normal(0, 1, count)
+    frequency = 50 + rng.normal(0, 0.1, count)
+
+    # Environmental factors
+    temperature = 25 + daily_factor * 10 + rng.normal(0, 5, count)
+    humidity = 60 + np.sin(2 * np.pi * (hour + 6) / 24) * 20 + rng.normal(0, 10, count)
+
+    # Impedance and power factor
+    impedance = 75 + rng.normal(0, 5, count)
+    power_factor = 0.85 + rng.normal(0, 0.05, count)
+
+    # Illegal fence simulation (5% of data): voltage spike, impedance drop, current increase
+    is_illegal_fence = rng.random(count) < 0.05
+    n_fence = int(is_illegal_fence.sum())
+    voltage[is_illegal_fence] += rng.uniform(20, 50, n_fence)
+    impedance[is_illegal_fence] -= rng.uniform(15, 35, n_fence)
+    current[is_illegal_fence] += rng.uniform(5, 15, n_fence)
+
+    # TDR reflection coefficient: strong for fences, normal otherwise
+    tdr_reflection = rng.uniform(0, 20, count)
+    tdr_reflection[is_illegal_fence] = rng.uniform(40, 80, n_fence)
+
+    return {
+        'timestamp': timestamps,
+        'voltage': voltage,
+        'current': current,
+        'frequency': frequency,
+        'impedance': impedance,
+        'power_factor': power_factor,
+        'temperature': temperature,
+        'humidity': humidity,
+        'time_hour': hour,
+        'time_minute': minute,
+        'day_of_week': day_of_week,
+        'tdr_reflection': tdr_reflection,
+        'is_illegal_fence': is_illegal_fence.astype(np.int64),
+        'voltage_spike_risk': (voltage > 250).astype(np.int64)
+    }
+
+
+def chunk_seeds(seed, n_chunks):
+    """Independent child SeedSequences, one per chunk"""
+    return np.random.SeedSequence(seed).spawn(n_chunks)
+
+
+def iter_chunks(samples, chunk_size=1_000_000, seed=42, base_date=None):
+    """Yield (chunk index, column dict) for consecutive chunks of samples rows"""
+    base_date = base_date or default_base_date()
+    n_chunks = -(-samples // chunk_size)
+    for index, child in enumerate(chunk_seeds(seed, n_chunks)):
+        start = index * chunk_size
+        yield index, generate_columns(start, min(chunk_size, samples - start), child, base_date)
+
+
+def generate_dataframe(samples=10000, seed=42, base_date=None, chunk_size=1_000_000):
+    """All rows as one pandas DataFrame (the generate_training_data layout)"""
+    import pandas as pd
+
+    chunks = [pd.DataFrame(columns) for _, columns in iter_chunks(samples, chunk_size, seed, base_date)]
+    if not chunks:
+        # no rows: the column layout only
+        return pd.DataFrame({name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS})
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _shard_path(out_dir, index, format):
+    extension = 'parquet' if format == 'parquet' else 'npy'
+    return os.path.join(out_dir, f'part-{index:05d}.{extension}')
+
+
+def _write_shard(out_dir, index, start, count, seed, base_date, format):
+    columns = generate_columns(start, count, seed, base_date)
+    path = _shard_path(out_dir, index, format)
+    tmp_path = path + '.tmp'
+
+    if format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.table(columns), tmp_path)
+    else:
+        records = np.empty(count, dtype=RECORD_DTYPE)
+        for name, values in columns.items():
+            records[name] = values
+        with open(tmp_path, 'wb') as f:
+            np.save(f, records)
+    os.replace(tmp_path, path)
+    return {'path': os.path.basename(path), 'start': start, 'rows': count}
+
+
+def write_shards(out_dir, samples, chunk_size=1_000_000, seed=42, base_date=None,
+                 format='npy', workers=1):
+    """
+    Generate samples rows into shard files plus manifest.json
+
+    Args:
+        out_dir: output directory
+        samples: total number of rows
+        chunk_size: rows per shard
+        seed: root seed; shard i uses child i of SeedSequence(seed)
+        base_date: datetime of row 0 (one year ago if None)
+        format: 'npy' (structured array, loadable with mmap) or 'parquet' (needs pyarrow)
+        workers: number of generator processes
+
+    Returns:
+        manifest dict
+    """
+    if format not in ('npy', 'parquet'):
+        raise ValueError(f"Unknown shard format: {format}")
+    if format == 'parquet':
+        import pyarrow  # noqa: F401  (fail before spawning workers)
+
+    os.makedirs(out_dir, exist_ok=True)
+    base_date = base_date or default_base_date()
+    n_chunks = -(-samples // chunk_size)
+    jobs = [
+        (out_dir, index, index * chunk_size, min(chunk_size, samples - index * chunk_size),
+         child, base_date, format)
+        for index, child in enumerate(chunk_seeds(seed, n_chunks))
+    ]
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            shards = list(executor.map(_write_shard, *zip(*jobs)))
+    else:
+        shards = [_write_shard(*job) for job in jobs]
+
+    manifest = {
+        'generator': 'synthetic_data.generate_columns',
+        'samples': samples,
+        'chunk_size': chunk_size,
+        'seed': seed,
+        'base_date': base_date.isoformat(),
+        'format': format,
+        'columns': [name for name, _ in COLUMNS],
+        'shards': shards
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_shard(path, mmap=True):
+    """One shard as a pandas DataFrame"""
+    import pandas as pd
+
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    records = np.load(path, mmap_mode='r' if mmap else None)
+    return pd.DataFrame({name: records[name] for name in records.dtype.names})
+
+
+def iter_shards(out_dir):
+    """Yield the shards listed in out_dir/manifest.json as DataFrames, in row order"""
+    with open(os.path.join(out_dir, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    for shard in manifest['shards']:
+        yield load_shard(os.path.join(out_dir, shard['path']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write synthetic voltage spike training data as shards')
+    parser.add_argument('--out', required=True, metavar='DIR')
+    parser.add_argument('--samples', type=int, default=10_000_000)
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--base-date', type=datetime.fromisoformat,
+                        help='ISO timestamp of the first row (default: one year ago)')
+    parser.add_argument('--format', choices=('npy', 'parquet'), default='npy')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = write_shards(args.out, args.samples, args.chunk_size, args.seed,
+                            args.base_date, args.format, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{args.samples} rows in {len(manifest['shards'])} shards written to {args.out} "
+          f"in {elapsed:.1f}s ({args.samples / elapsed:,.0f} rows/s)")
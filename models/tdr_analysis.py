@@ -3,12 +3,19 @@
 
 import numpy as np
 import scipy.signal as signal
-from scipy.fft import fft, fftfreq
-import matplotlib.pyplot as plt
+from scipy.fft import fft, rfft, fftfreq
 from dataclasses import dataclass
 from typing import List, Dict, Tuple, Optional
 import json
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from tdr_transforms import TransformEngine
+from tdr_plan_cache import PlanCache
+from tdr_streaming import StreamingTDRAnalysis
+
+# Fence impedance used for connections that do not specify one
+DEFAULT_CONNECTION_IMPEDANCE = 20.0
 
 @dataclass
 class TDRReflection:
@@ -28,11 +35,67 @@ class TDRConfiguration:
     cable_impedance: float = 75.0  # Ohms
     analysis_length: float = 10000.0  # 10km analysis range
 
+def pack_connections(illegal_connections: List[Optional[List[Dict]]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-scenario illegal_connections lists as padded (S, K) arrays
+    
+    Returns:
+        distances (meters, NaN where a scenario has fewer than K connections)
+        and impedances (DEFAULT_CONNECTION_IMPEDANCE where not given)
+    """
+    n_scenarios = len(illegal_connections)
+    max_connections = max((len(c) for c in illegal_connections if c), default=0)
+    distances = np.full((n_scenarios, max_connections), np.nan)
+    impedances = np.full((n_scenarios, max_connections), DEFAULT_CONNECTION_IMPEDANCE)
+    for i, connections in enumerate(illegal_connections):
+        for k, connection in enumerate(connections or ()):
+            distances[i, k] = connection['distance']
+            impedances[i, k] = connection.get('impedance', DEFAULT_CONNECTION_IMPEDANCE)
+    return distances, impedances
+
+
+def _simulate_chunk(pulse: np.ndarray, sampling_rate: float, velocity: float, baseline_impedance: float,
+                    distance_km: np.ndarray, connection_distances: np.ndarray,
+                    connection_impedances: np.ndarray, noise_levels: np.ndarray,
+                    seed, dtype) -> np.ndarray:
+    """Responses of one chunk of scenarios (simulate_cable_response, one row per scenario)"""
+    from scipy.fft import rfft, irfft, rfftfreq, next_fast_len
+    
+    n_scenarios, n = len(distance_km), len(pulse)
+    
+    # Cable attenuation: one spectrum per cable length, the pulse spectrum shared
+    freqs = rfftfreq(n, 1 / sampling_rate)
+    attenuation = np.exp(-0.1 * distance_km[:, np.newaxis] * 1000 * freqs / 1e6)  # dB/km/MHz
+    response = irfft(rfft(pulse) * attenuation, n=n, axis=1)
+    
+    # Reflections: an impulse per connection at its round-trip delay, convolved
+    # with the pulse in one batched (linear, zero-padded) FFT
+    if connection_distances.size:
+        reflection_coeff = (connection_impedances - baseline_impedance) / (connection_impedances + baseline_impedance)
+        with np.errstate(invalid='ignore'):
+            delay_samples = np.trunc(2 * connection_distances / velocity * sampling_rate)
+        valid = np.isfinite(delay_samples) & (delay_samples >= 0) & (delay_samples < n)
+        if valid.any():
+            rows = np.broadcast_to(np.arange(n_scenarios)[:, np.newaxis], delay_samples.shape)[valid]
+            impulses = np.zeros((n_scenarios, n))
+            np.add.at(impulses, (rows, delay_samples[valid].astype(np.intp)),
+                      reflection_coeff[valid] * 0.8)  # Some loss
+            size = next_fast_len(2 * n, real=True)
+            response += irfft(rfft(impulses, size, axis=1) * rfft(pulse, size), size, axis=1)[:, :n]
+    
+    # Add noise
+    rng = np.random.default_rng(seed)
+    response += rng.standard_normal((n_scenarios, n)) * noise_levels[:, np.newaxis]
+    return response.astype(dtype, copy=False)
+
+
 class AdvancedTDRAnalyzer:
-    def __init__(self, config: TDRConfiguration = None):
+    def __init__(self, config: TDRConfiguration = None, plan_cache: PlanCache = None):
         self.config = config or TDRConfiguration()
         self.calibration_data = None
         self.baseline_impedance = self.config.cable_impedance
+        self.transforms = TransformEngine(self.create_fault_template())  # FFT wavelet/correlation plans
+        self.plans = plan_cache or PlanCache()  # pulse/spectrum/attenuation per config and cable length
         
     def generate_tdr_pulse(self, duration: float = 2e-6) -> Tuple[np.ndarray, np.ndarray]:
         """Generate TDR test pulse with proper characteristics"""
@@ -51,25 +114,54 @@ class AdvancedTDRAnalyzer:
         
         return t, pulse
     
+    def generate_gaussian_pulse(self, duration: float = 5e-6) -> Tuple[np.ndarray, np.ndarray]:
+        """Gaussian test pulse (sigma = pulse_width, centred at 3 sigma) as in matlab/simulate_tdr_response.m"""
+        n_samples = int(round(duration * self.config.sampling_rate))
+        t = np.arange(n_samples) / self.config.sampling_rate
+        t_center = 3 * self.config.pulse_width
+        pulse = self.config.pulse_amplitude * np.exp(-0.5 * ((t - t_center) / self.config.pulse_width) ** 2)
+        return t, pulse
+    
+    def pulse_plan(self, duration: float = 2e-6) -> Dict:
+        """Cached (read-only) time base, test pulse and pulse spectrum for the current config"""
+        self.plans.bind(self.config)
+        key = ('pulse', duration)
+        plan = self.plans.get(key)
+        if plan is None:
+            t, pulse = self.generate_tdr_pulse(duration)
+            plan = self.plans.put(key, {
+                't': t,
+                'pulse': pulse,
+                'freqs': fftfreq(len(pulse), 1/self.config.sampling_rate),
+                'spectrum': fft(pulse)
+            })
+        return plan
+    
+    def line_plan(self, distance_km: float, duration: float = 2e-6) -> Dict:
+        """Cached (read-only) attenuation curve and attenuated pulse for a cable length"""
+        pulse_plan = self.pulse_plan(duration)
+        bucket, distance_km = self.plans.length_bucket(distance_km)
+        key = ('line', duration, bucket)
+        plan = self.plans.get(key)
+        if plan is None:
+            # Attenuation increases with frequency and distance
+            attenuation = np.exp(-0.1 * distance_km * 1000 * np.abs(pulse_plan['freqs']) / 1e6)  # dB/km/MHz
+            plan = self.plans.put(key, {
+                'attenuation': attenuation,
+                'response': np.real(np.fft.ifft(pulse_plan['spectrum'] * attenuation))
+            })
+        return plan
+    
     def simulate_cable_response(self, distance_km: float, illegal_connections: List[Dict] = None) -> Tuple[np.ndarray, np.ndarray]:
         """Simulate TDR response from power cable with potential illegal connections"""
-        t, pulse = self.generate_tdr_pulse()
+        plan = self.pulse_plan()
+        t, pulse = plan['t'], plan['pulse']
         
         # Cable parameters
         velocity = 3e8 * self.config.cable_velocity_factor  # m/s
         
-        # Initialize response
-        response = pulse.copy()
-        
-        # Add cable attenuation (frequency dependent)
-        freqs = fftfreq(len(pulse), 1/self.config.sampling_rate)
-        pulse_fft = fft(pulse)
-        
-        # Attenuation increases with frequency and distance
-        attenuation = np.exp(-0.1 * distance_km * 1000 * np.abs(freqs) / 1e6)  # dB/km/MHz
-        attenuated_fft = pulse_fft * attenuation
-        
-        response = np.real(np.fft.ifft(attenuated_fft))
+        # Attenuated pulse (frequency dependent), cached per configuration and cable length
+        response = self.line_plan(distance_km)['response'].copy()
         
         # Add reflections from illegal connections
         if illegal_connections:
@@ -99,7 +191,71 @@ class AdvancedTDRAnalyzer:
         noise = np.random.normal(0, noise_level, len(response))
         response += noise
         
-        return t, response
+        return t.copy(), response
+    
+    def simulate_cable_responses(self, distance_km, connection_distances=None, connection_impedances=None,
+                                 noise_levels=None, seed=None, chunk_size: int = 4096, workers: int = 1,
+                                 dtype=np.float64) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Simulate the TDR responses of many cable scenarios at once
+        
+        Same physics as simulate_cable_response, as array operations over all
+        scenarios: the pulse and its spectrum are computed once, attenuation is
+        one (S, F) spectrum product and the reflections of all connections are
+        superposed with a single batched FFT convolution. Noise comes from a
+        seeded Generator per chunk (child i of SeedSequence(seed)), so the
+        output depends on seed and chunk_size but not on workers.
+        
+        Args:
+            distance_km: (S,) cable lengths in km
+            connection_distances: (S, K) connection distances in meters, NaN
+                                  for unused slots (see pack_connections)
+            connection_impedances: (S, K) fence impedances in ohms
+            noise_levels: noise std in volts, scalar or (S,); default 1% of
+                          the pulse amplitude
+            seed: int or SeedSequence
+            chunk_size: scenarios simulated per array pass (bounds temporaries)
+            workers: processes simulating chunks in parallel
+            dtype: output dtype (np.float32 halves the memory of large datasets)
+            
+        Returns:
+            t: (N,) time base, responses: (S, N)
+        """
+        plan = self.pulse_plan()
+        t, pulse = plan['t'].copy(), plan['pulse']
+        velocity = 3e8 * self.config.cable_velocity_factor  # m/s
+        
+        distance_km = np.atleast_1d(np.asarray(distance_km, dtype=np.float64))
+        n_scenarios = len(distance_km)
+        if n_scenarios == 0:
+            return t, np.empty((0, len(t)), dtype=dtype)
+        if connection_distances is None:
+            connection_distances = np.empty((n_scenarios, 0))
+        connection_distances = np.asarray(connection_distances, dtype=np.float64).reshape(n_scenarios, -1)
+        if connection_impedances is None:
+            connection_impedances = np.full(connection_distances.shape, DEFAULT_CONNECTION_IMPEDANCE)
+        connection_impedances = np.broadcast_to(
+            np.asarray(connection_impedances, dtype=np.float64), connection_distances.shape)
+        if noise_levels is None:
+            noise_levels = 0.01 * self.config.pulse_amplitude
+        noise_levels = np.broadcast_to(np.asarray(noise_levels, dtype=np.float64), (n_scenarios,))
+        
+        bounds = list(range(0, n_scenarios, chunk_size)) or [0]
+        seeds = np.random.SeedSequence(seed).spawn(len(bounds))
+        jobs = [
+            (pulse, self.config.sampling_rate, velocity, self.baseline_impedance,
+             distance_km[a:a + chunk_size], connection_distances[a:a + chunk_size],
+             connection_impedances[a:a + chunk_size], noise_levels[a:a + chunk_size], child, dtype)
+            for a, child in zip(bounds, seeds)
+        ]
+        
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                chunks = list(executor.map(_simulate_chunk, *zip(*jobs)))
+        else:
+            chunks = [_simulate_chunk(*job) for job in jobs]
+        
+        return t, np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
     
     def calculate_impedance_profile(self, tdr_response: np.ndarray, time_base: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """Calculate impedance profile from TDR response"""
@@ -125,81 +281,117 @@ class AdvancedTDRAnalyzer:
     def detect_anomalies(self, distance: np.ndarray, impedance: np.ndarray, 
                         reflection_response: np.ndarray) -> List[TDRReflection]:
         """Detect anomalies in TDR response indicating illegal connections"""
-        anomalies = []
+        return self.detect_anomalies_batch(distance, impedance, reflection_response)[0]
+    
+    def detect_anomalies_batch(self, distance: np.ndarray, impedance: np.ndarray,
+                               reflection_response: np.ndarray) -> List[List[TDRReflection]]:
+        """
+        detect_anomalies for a stack of sweeps (many cables, or repeated shots of one)
+        
+        All rows are smoothed by one savgol_filter call along the last axis;
+        peaks are found per row and classified together with array masks.
+        
+        Args:
+            distance: (N,) shared or (S, N) per-sweep distances
+            impedance: (S, N) impedance profiles (or (N,) for one sweep)
+            reflection_response: (S, N) responses (or (N,) for one sweep)
+            
+        Returns:
+            one list of TDRReflection per sweep
+        """
+        impedance = np.atleast_2d(impedance)
+        reflection_response = np.atleast_2d(reflection_response)
+        n_sweeps, n_samples = reflection_response.shape
+        distance = np.broadcast_to(distance, (n_sweeps, np.shape(distance)[-1]))
         
         # Apply smoothing filter to reduce noise
-        smoothed_impedance = signal.savgol_filter(impedance, window_length=21, polyorder=3)
-        smoothed_response = signal.savgol_filter(reflection_response, window_length=21, polyorder=3)
-        
-        # Calculate impedance gradient to find sharp changes
-        impedance_gradient = np.gradient(smoothed_impedance)
-        response_gradient = np.gradient(smoothed_response)
-        
-        # Define thresholds for anomaly detection
-        impedance_threshold = 2 * np.std(impedance_gradient)
-        response_threshold = 0.1 * np.max(smoothed_response)
-        
-        # Find peaks in reflection response
-        peaks, properties = signal.find_peaks(
-            np.abs(smoothed_response),
-            height=response_threshold,
-            distance=int(0.1 * len(smoothed_response))  # Minimum 100m separation
-        )
-        
-        for peak_idx in peaks:
-            if peak_idx < len(distance):
-                peak_distance = distance[peak_idx]
-                peak_reflection = smoothed_response[peak_idx]
-                peak_impedance = smoothed_impedance[peak_idx]
-                
-                # Calculate confidence based on peak prominence and impedance change
-                prominence = properties['peak_heights'][np.where(peaks == peak_idx)[0][0]]
-                confidence = min(0.99, prominence / np.max(smoothed_response) * 2)
-                
-                # Determine anomaly type based on impedance change
-                impedance_change = peak_impedance - self.baseline_impedance
-                
-                if impedance_change < -20:  # Significant impedance drop
-                    anomaly_type = "ILLEGAL_FENCE_CONNECTION"
-                elif impedance_change > 50:  # Impedance increase
-                    anomaly_type = "OPEN_CIRCUIT"
-                elif abs(impedance_change) > 30:
-                    anomaly_type = "IMPEDANCE_MISMATCH"
-                else:
-                    anomaly_type = "MINOR_REFLECTION"
-                
-                # Only report significant anomalies
-                if confidence > 0.7 and abs(impedance_change) > 15:
-                    anomaly = TDRReflection(
-                        distance=float(peak_distance),
-                        reflection_coefficient=float(peak_reflection),
-                        impedance=float(peak_impedance),
-                        timestamp=datetime.now(),
-                        confidence=float(confidence),
-                        anomaly_type=anomaly_type
-                    )
-                    anomalies.append(anomaly)
+        smoothed_impedance = signal.savgol_filter(impedance, window_length=21, polyorder=3, axis=-1)
+        smoothed_response = signal.savgol_filter(reflection_response, window_length=21, polyorder=3, axis=-1)
+        
+        # Find peaks in reflection response (threshold: 10% of each sweep's maximum)
+        response_max = smoothed_response.max(axis=1)
+        magnitude = np.abs(smoothed_response)
+        min_separation = int(0.1 * n_samples)  # Minimum 100m separation
+        rows, peaks, heights = [], [], []
+        for row in range(n_sweeps):
+            row_peaks, properties = signal.find_peaks(magnitude[row], height=0.1 * response_max[row],
+                                                      distance=min_separation)
+            rows.append(np.full(len(row_peaks), row))
+            peaks.append(row_peaks)
+            heights.append(properties['peak_heights'])
+        rows, peaks, heights = np.concatenate(rows), np.concatenate(peaks), np.concatenate(heights)
+        
+        # Peaks past the end of the distance axis have no location
+        located = peaks < distance.shape[1]
+        rows, peaks, heights = rows[located], peaks[located], heights[located]
+        
+        peak_impedance = smoothed_impedance[rows, peaks]
+        confidence, anomaly_type, report = self.classify_peaks(heights, response_max[rows], peak_impedance)
+        
+        anomalies = [[] for _ in range(n_sweeps)]
+        for row, anomaly in zip(rows[report].tolist(), self.peak_reflections(
+                distance[rows[report], peaks[report]], smoothed_response[rows[report], peaks[report]],
+                peak_impedance[report], confidence[report], anomaly_type[report])):
+            anomalies[row].append(anomaly)
         
         return anomalies
     
+    def classify_peaks(self, heights: np.ndarray, response_max, peak_impedance: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Confidence, anomaly type and report mask of reflection peaks
+        
+        Args:
+            heights: |smoothed response| at the peaks
+            response_max: maximum of the smoothed response (per peak or scalar)
+            peak_impedance: smoothed impedance at the peaks
+        """
+        # Confidence from peak height relative to the sweep maximum (min(0.99, x) as before)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            confidence = heights / response_max * 2
+        confidence = np.where(confidence < 0.99, confidence, 0.99)
+        
+        # Determine anomaly type based on impedance change
+        impedance_change = peak_impedance - self.baseline_impedance
+        anomaly_type = np.select(
+            [impedance_change < -20, impedance_change > 50, np.abs(impedance_change) > 30],
+            ["ILLEGAL_FENCE_CONNECTION", "OPEN_CIRCUIT", "IMPEDANCE_MISMATCH"],
+            default="MINOR_REFLECTION"
+        )
+        
+        # Only report significant anomalies
+        report = (confidence > 0.7) & (np.abs(impedance_change) > 15)
+        return confidence, anomaly_type, report
+    
+    def peak_reflections(self, distances, reflections, impedances, confidences, anomaly_types) -> List[TDRReflection]:
+        """TDRReflection records for classified peaks"""
+        timestamp = datetime.now()
+        return [
+            TDRReflection(
+                distance=peak_distance,
+                reflection_coefficient=peak_reflection,
+                impedance=peak_impedance,
+                timestamp=timestamp,
+                confidence=peak_confidence,
+                anomaly_type=peak_type
+            )
+            for peak_distance, peak_reflection, peak_impedance, peak_confidence, peak_type in zip(
+                np.asarray(distances).tolist(), np.asarray(reflections).tolist(),
+                np.asarray(impedances).tolist(), np.asarray(confidences).tolist(),
+                np.asarray(anomaly_types).tolist())
+        ]
+    
     def advanced_signal_processing(self, tdr_response: np.ndarray, time_base: np.ndarray) -> Dict:
         """Apply advanced signal processing techniques for better detection"""
         
         # 1. Frequency domain analysis
         freqs = fftfreq(len(tdr_response), time_base[1] - time_base[0])
-        response_fft = fft(tdr_response)
+        response_fft = rfft(tdr_response)
         
-        # 2. Wavelet analysis for transient detection
-        from scipy import signal as sig
-        try:
-            coeffs = sig.cwt(tdr_response, sig.ricker, np.arange(1, 31))
-            wavelet_energy = np.sum(np.abs(coeffs)**2, axis=0)
-        except:
-            wavelet_energy = np.ones(len(tdr_response))
+        # 2. Wavelet analysis for transient detection (Ricker widths 1-30, by FFT)
+        wavelet_energy = self.transforms.wavelet_energy(tdr_response, self.config.sampling_rate)
         
         # 3. Correlation analysis with known fault signatures
-        fault_template = self.create_fault_template()
-        correlation = np.correlate(tdr_response, fault_template, mode='same')
+        correlation = self.transforms.correlate(tdr_response, self.config.sampling_rate)
         
         # 4. Statistical analysis
         response_stats = {
@@ -213,13 +405,22 @@ class AdvancedTDRAnalyzer:
         return {
             'frequency_spectrum': {
                 'frequencies': freqs[:len(freqs)//2].tolist(),
-                'magnitude': np.abs(response_fft[:len(response_fft)//2]).tolist()
+                'magnitude': np.abs(response_fft[:len(freqs)//2]).tolist()
             },
             'wavelet_energy': wavelet_energy.tolist(),
             'correlation': correlation.tolist(),
             'statistics': response_stats
         }
     
+    def streaming_analysis(self, n_samples: int, block_size: int = 65536,
+                           transforms: bool = True) -> StreamingTDRAnalysis:
+        """
+        Block-by-block calculate_impedance_profile / detect_anomalies /
+        advanced_signal_processing for acquisitions too long to hold in memory
+        (see tdr_streaming.StreamingTDRAnalysis)
+        """
+        return StreamingTDRAnalysis(self, n_samples, block_size, transforms)
+    
     def create_fault_template(self) -> np.ndarray:
         """Create template for fault signature matching"""
         # Simulate typical illegal fence connection signature
@@ -0,0 +1,177 @@
+# tdr_baseline.py
+# Running per-cable reflection statistics for TDR anomaly thresholds
+#
+# tdr_analysis used to derive its threshold (mean + 3 std) from each sweep on
+# its own, so one strong reflection raised the bar it was measured against and
+# thresholds jumped from sweep to sweep. TDRBaseline keeps count/mean/M2 per
+# cable and folds every sweep in with the batch (Chan et al.) form of Welford's
+# update: O(n) array reductions per sweep, no per-point Python loop, and a
+# threshold that is stable across sweeps. Points above the threshold are left
+# out of the baseline so faults do not drift it upwards.
+
+import os
+import numpy as np
+
+from feature_store import slot_key, dump_slot_keys, load_slot_keys
+
+SIGMA = 3.0          # threshold = mean + SIGMA * std
+MIN_SAMPLES = 100    # baseline points needed before it replaces the sweep's own statistics
+
+
+def welford_merge(count, mean, m2, values):
+    """
+    Fold a batch of values into running (count, mean, M2)
+
+    Returns:
+        (count, mean, m2) of the combined data; the variance is m2 / count
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    n = len(values)
+    if n == 0:
+        return count, mean, m2
+    batch_mean = values.mean()
+    batch_m2 = np.square(values - batch_mean).sum()
+    total = count + n
+    delta = batch_mean - mean
+    return total, mean + delta * n / total, m2 + batch_m2 + delta * delta * count * n / total
+
+
+def tdr_arrays(tdr_data):
+    """
+    (distances, reflections) float64 arrays from a TDR sweep
+
+    Args:
+        tdr_data: list of {'distance', 'reflection'} dicts, a dict of arrays or
+                  DataFrame / structured array with those fields, a
+                  (distances, reflections) pair, or an (n, 2) array
+    """
+    if isinstance(tdr_data, (list, tuple)) and not len(tdr_data):
+        return np.empty(0), np.empty(0)
+    if isinstance(tdr_data, (list, tuple)) and isinstance(tdr_data[0], dict):
+        return (np.fromiter((d['distance'] for d in tdr_data), np.float64, len(tdr_data)),
+                np.fromiter((d['reflection'] for d in tdr_data), np.float64, len(tdr_data)))
+    if isinstance(tdr_data, np.ndarray) and tdr_data.dtype.names is None:
+        tdr_data = np.asarray(tdr_data, dtype=np.float64)
+        return tdr_data[:, 0], tdr_data[:, 1]
+    if isinstance(tdr_data, (list, tuple)):
+        distances, reflections = tdr_data
+    else:
+        distances, reflections = tdr_data['distance'], tdr_data['reflection']
+    return np.asarray(distances, dtype=np.float64), np.asarray(reflections, dtype=np.float64)
+
+
+def reflection_anomalies(distances, reflections, threshold):
+    """Columnar anomaly records (tdr_analysis fields) for the points above threshold"""
+    above = reflections > threshold
+    reflection = reflections[above]
+    return {
+        'distance_meters': distances[above],
+        'reflection_db': reflection,
+        'impedance_change_ohms': -reflection * 0.5,  # Simplified calculation
+        'confidence': np.minimum(0.99, 0.7 + (reflection - threshold) / threshold),
+        'severity': np.where(reflection > threshold * 1.5, 'CRITICAL', 'HIGH')
+    }
+
+
+class TDRBaseline:
+    """
+    Running reflection mean/variance per cable
+
+    Args:
+        capacity: initial number of cable slots (grows by doubling)
+        sigma: threshold width in standard deviations
+        min_samples: baseline points required before threshold() is used
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, capacity=16, sigma=SIGMA, min_samples=MIN_SAMPLES):
+        self.sigma = sigma
+        self.min_samples = min_samples
+        self.slots = {}  # cable ID -> slot index
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.mean = np.zeros(capacity)
+        self.m2 = np.zeros(capacity)
+
+    def _slot(self, cable_id):
+        slot = self.slots.get(cable_id)
+        if slot is None:
+            slot = self.slots[slot_key(cable_id)] = len(self.slots)
+            capacity = len(self.count)
+            if slot >= capacity:
+                old = (self.count, self.mean, self.m2)
+                self._allocate(capacity * 2)
+                for new, previous in zip((self.count, self.mean, self.m2), old):
+                    new[:capacity] = previous
+        return slot
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, cable_id):
+        return cable_id in self.slots
+
+    def stats(self, cable_id):
+        """(count, mean, std) of a cable's baseline; (0, nan, nan) for an unknown cable"""
+        slot = self.slots.get(cable_id)
+        if slot is None or not self.count[slot]:
+            return 0, float('nan'), float('nan')
+        return int(self.count[slot]), float(self.mean[slot]), float(np.sqrt(self.m2[slot] / self.count[slot]))
+
+    def threshold(self, cable_id):
+        """mean + sigma * std of the baseline, or None until it has min_samples points"""
+        count, mean, std = self.stats(cable_id)
+        if count < self.min_samples:
+            return None
+        return mean + self.sigma * std
+
+    def merge(self, cable_id, count, mean, m2):
+        """Fold running statistics of other data (e.g. one sweep) into a cable's baseline"""
+        if not count:
+            return
+        slot = self._slot(cable_id)
+        n_a = self.count[slot]
+        total = n_a + count
+        delta = mean - self.mean[slot]
+        self.m2[slot] += m2 + delta * delta * n_a * count / total
+        self.mean[slot] += delta * count / total
+        self.count[slot] = total
+
+    def update(self, cable_id, values):
+        """Fold reflection values into a cable's baseline"""
+        self.merge(cable_id, *welford_merge(0, 0.0, 0.0, values))
+
+    def snapshot(self, path):
+        """Write the baselines to path (.npz) atomically"""
+        used = len(self.slots)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=self.SNAPSHOT_VERSION,
+                cables=dump_slot_keys(self.slots),
+                sigma=self.sigma,
+                min_samples=self.min_samples,
+                count=self.count[:used],
+                mean=self.mean[:used],
+                m2=self.m2[:used]
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def restore(cls, path):
+        """Load baselines written by snapshot"""
+        with np.load(path) as data:
+            if int(data['version']) > cls.SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported TDR baseline snapshot version: {int(data['version'])}")
+            slots = load_slot_keys(str(data['cables']))
+            baseline = cls(capacity=max(len(slots), 1), sigma=float(data['sigma']),
+                           min_samples=int(data['min_samples']))
+            used = len(slots)
+            for name in ('count', 'mean', 'm2'):
+                getattr(baseline, name)[:used] = data[name]
+        baseline.slots = slots
+        return baseline
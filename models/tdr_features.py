@@ -0,0 +1,223 @@
+# tdr_features.py
+# TDR load features for the fence detector, computed for a whole batch of sweeps
+#
+# Port of matlab/extract_tdr_features.m (with calculate_reflection_coefficient.m
+# and its calculate_frequency_features_simple / calculate_load_score_simple
+# helpers). Every feature is an array operation over a (S, N) batch of
+# incident/reflected waveforms and (S,) electrical measurements.
+
+import numpy as np
+
+# extract_tdr_features output, in the order the MATLAB struct fields are created
+TDR_FEATURES = (
+    'reflection_coeff', 'time_delay', 'peak_ratio',
+    'impedance_magnitude', 'power_factor', 'voltage_rms', 'current_rms', 'active_power',
+    'energy_ratio', 'spectral_centroid', 'load_classification_score', 'impedance_ratio'
+)
+
+# Electrical measurements per sweep (generate_load_scenario's electrical_params)
+ELECTRICAL_FIELDS = ('V_rms', 'I_rms', 'P_active', 'power_factor')
+
+SPECTRUM_SAMPLES = 512   # spectral centroid uses the first 512 reflected samples
+DEFAULT_IMPEDANCE = 1000.0  # impedance_magnitude when no current flows
+DEFAULT_SAMPLING_RATE = 1e9    # dataset_main.m tdr_params.sampling_freq
+DEFAULT_LINE_IMPEDANCE = 50.0  # dataset_main.m line_params.Z0
+EPS = np.finfo(np.float64).eps
+
+
+def reflection_coefficient(incident, reflected, dt):
+    """
+    Reflection coefficient and delay from the incident and reflected peaks
+
+    Returns:
+        rho: reflected peak value / incident peak value (0 when undefined)
+        delay: time from the incident peak to a later reflected peak (else 0)
+    """
+    return _rho_delay(incident, reflected, np.abs(incident).argmax(axis=1),
+                      np.abs(reflected).argmax(axis=1), dt)
+
+
+def _rho_delay(incident, reflected, incident_peak, reflected_peak, dt):
+    rows = np.arange(len(incident))
+    incident_value = incident[rows, incident_peak]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = np.where(incident_value != 0, reflected[rows, reflected_peak] / incident_value, 0.0)
+    rho = np.where(np.isfinite(rho), rho, 0.0)
+    delay = np.where(reflected_peak > incident_peak, (reflected_peak - incident_peak) * dt, 0.0)
+    return rho, delay
+
+
+def spectral_centroid(signal, dt, max_samples=SPECTRUM_SAMPLES):
+    """Power-weighted mean frequency of the first max_samples samples (0 for a silent signal)"""
+    signal = signal[:, :max_samples]
+    n = signal.shape[1]
+    power = np.abs(np.fft.rfft(signal, axis=1)) ** 2
+    freqs = np.arange(n // 2 + 1) / (n * dt)
+    total = power.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centroid = np.where(total > 0, power @ freqs / total, 0.0)
+    return np.where(np.isfinite(centroid), centroid, 0.0)
+
+
+def load_classification_score(impedance_magnitude, power_factor, reflection_coeff):
+    """calculate_load_score_simple: 0-1, higher = more likely a legitimate load"""
+    with np.errstate(over='ignore', invalid='ignore'):
+        impedance_score = np.where(impedance_magnitude > 0,
+                                   1 / (1 + np.exp(-(impedance_magnitude - 1000) / 500)), 0.0)
+    pf_score = np.where((power_factor >= 0.7) & (power_factor <= 0.95), power_factor,
+                        np.where(power_factor > 0.95, 0.3, 0.2))
+    reflection_magnitude = np.abs(reflection_coeff)
+    reflection_score = np.where(reflection_magnitude < 1, 1 - reflection_magnitude, 0.0)
+
+    score = np.clip(0.4 * impedance_score + 0.35 * pf_score + 0.25 * reflection_score, 0, 1)
+    return np.where(np.isfinite(score), score, 0.5)
+
+
+def extract_features(incident, reflected, electrical, dt, z0=DEFAULT_LINE_IMPEDANCE):
+    """
+    TDR_FEATURES for a batch of sweeps
+
+    Args:
+        incident, reflected: (S, N) waveforms
+        electrical: dict of (S,) arrays with ELECTRICAL_FIELDS
+        dt: sample interval in seconds
+        z0: line characteristic impedance in ohms
+
+    Returns:
+        dict feature name -> (S,) float64 array, non-finite values replaced by 0
+    """
+    incident = np.atleast_2d(np.asarray(incident, dtype=np.float64))
+    reflected = np.atleast_2d(np.asarray(reflected, dtype=np.float64))
+    voltage = np.asarray(electrical['V_rms'], dtype=np.float64)
+    current = np.asarray(electrical['I_rms'], dtype=np.float64)
+    power_factor = np.asarray(electrical['power_factor'], dtype=np.float64)
+
+    features = {}
+    features['reflection_coeff'], features['time_delay'] = reflection_coefficient(incident, reflected, dt)
+    features['peak_ratio'] = np.abs(reflected).max(axis=1) / (np.abs(incident).max(axis=1) + EPS)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        impedance_magnitude = np.where(current > 0, np.abs(voltage / current), DEFAULT_IMPEDANCE)
+    features['impedance_magnitude'] = impedance_magnitude
+    features['power_factor'] = power_factor
+    features['voltage_rms'] = voltage
+    features['current_rms'] = current
+    features['active_power'] = np.asarray(electrical['P_active'], dtype=np.float64)
+
+    features['energy_ratio'] = np.square(reflected).sum(axis=1) / (np.square(incident).sum(axis=1) + EPS)
+    features['spectral_centroid'] = spectral_centroid(reflected, dt)
+
+    features['load_classification_score'] = load_classification_score(
+        impedance_magnitude, power_factor, features['reflection_coeff'])
+    features['impedance_ratio'] = impedance_magnitude / z0
+
+    return {name: np.where(np.isfinite(features[name]), features[name], 0.0) for name in TDR_FEATURES}
+
+
+class WaveformFeatureExtractor:
+    """
+    Detector feature matrices straight from raw sweeps, in float32
+
+    Same formulas as extract_features, evaluated only for the requested
+    columns. The output matrix and the |waveform| scratch buffer are allocated
+    once and grown on demand, so steady-state batches do not allocate
+    waveform-sized arrays. extract() returns a view of the output buffer that
+    the next call overwrites; use one extractor per thread.
+
+    Args:
+        feature_names: output columns, any subset of TDR_FEATURES
+                       (e.g. rpi_config.json essential_features)
+        dt: sample interval in seconds
+        z0: line characteristic impedance in ohms
+        capacity: sweeps per batch to preallocate for
+        n_samples: samples per waveform to preallocate for
+    """
+
+    def __init__(self, feature_names, dt=1 / DEFAULT_SAMPLING_RATE, z0=DEFAULT_LINE_IMPEDANCE,
+                 capacity=64, n_samples=0):
+        unknown = [name for name in feature_names if name not in TDR_FEATURES]
+        if unknown:
+            raise ValueError(f"Unknown TDR features: {unknown}")
+        self.feature_names = list(feature_names)
+        self.dt = dt
+        self.z0 = z0
+
+        needed = set(self.feature_names)
+        self.needs_peaks = bool(needed & {'reflection_coeff', 'time_delay', 'peak_ratio',
+                                          'load_classification_score'})
+        self.needs_waveforms = self.needs_peaks or bool(needed & {'energy_ratio', 'spectral_centroid'})
+
+        self._out = np.empty((0, len(self.feature_names)), dtype=np.float32)
+        self._abs = np.empty((0, 0), dtype=np.float32)
+        self._reserve(capacity, n_samples)
+
+    def _reserve(self, rows, n_samples):
+        if rows > len(self._out):
+            self._out = np.empty((max(rows, 2 * len(self._out)), len(self.feature_names)), dtype=np.float32)
+        if self.needs_peaks and (rows > self._abs.shape[0] or n_samples != self._abs.shape[1]):
+            self._abs = np.empty((max(rows, self._abs.shape[0]), n_samples), dtype=np.float32)
+
+    def _peaks(self, waveforms):
+        """(index, magnitude) of each row's largest |sample|, via the scratch buffer"""
+        magnitude = np.abs(waveforms, out=self._abs[:len(waveforms)])
+        index = magnitude.argmax(axis=1)
+        return index, magnitude[np.arange(len(waveforms)), index]
+
+    def extract(self, incident, reflected, electrical):
+        """
+        Feature matrix for a batch of sweeps
+
+        Args:
+            incident, reflected: (S, N) or (N,) waveforms (cast to float32);
+                                 may be None if no requested feature needs them
+            electrical: dict of (S,) arrays or scalars with ELECTRICAL_FIELDS
+
+        Returns:
+            (S, len(feature_names)) float32 C-contiguous view of the output buffer,
+            non-finite values replaced by 0
+        """
+        voltage = np.atleast_1d(np.asarray(electrical['V_rms'], dtype=np.float32))
+        if self.needs_waveforms:
+            incident = np.atleast_2d(np.asarray(incident, dtype=np.float32))
+            reflected = np.atleast_2d(np.asarray(reflected, dtype=np.float32))
+            n, n_samples = incident.shape
+        else:
+            n, n_samples = len(voltage), 0
+        self._reserve(n, n_samples)
+        out = self._out[:n]
+
+        shape = (n,)
+        voltage = np.broadcast_to(voltage, shape)
+        current = np.broadcast_to(np.asarray(electrical['I_rms'], dtype=np.float32), shape)
+        power_factor = np.broadcast_to(np.asarray(electrical['power_factor'], dtype=np.float32), shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            impedance_magnitude = np.abs(voltage / current)
+        impedance_magnitude[~(current > 0)] = DEFAULT_IMPEDANCE
+
+        features = {
+            'impedance_magnitude': impedance_magnitude,
+            'power_factor': power_factor,
+            'voltage_rms': voltage,
+            'current_rms': current,
+            'active_power': np.broadcast_to(np.asarray(electrical['P_active'], dtype=np.float32), shape),
+            'impedance_ratio': impedance_magnitude / np.float32(self.z0)
+        }
+        if self.needs_peaks:
+            incident_peak, incident_magnitude = self._peaks(incident)
+            reflected_peak, reflected_magnitude = self._peaks(reflected)
+            features['reflection_coeff'], features['time_delay'] = _rho_delay(
+                incident, reflected, incident_peak, reflected_peak, self.dt)
+            features['peak_ratio'] = reflected_magnitude / (incident_magnitude + np.float32(EPS))
+            features['load_classification_score'] = load_classification_score(
+                impedance_magnitude, power_factor, features['reflection_coeff'])
+        if 'energy_ratio' in self.feature_names:
+            features['energy_ratio'] = (np.einsum('ij,ij->i', reflected, reflected)
+                                        / (np.einsum('ij,ij->i', incident, incident) + np.float32(EPS)))
+        if 'spectral_centroid' in self.feature_names:
+            features['spectral_centroid'] = spectral_centroid(reflected, self.dt)
+
+        for j, name in enumerate(self.feature_names):
+            out[:, j] = features[name]
+        np.nan_to_num(out, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        return out
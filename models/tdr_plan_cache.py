@@ -0,0 +1,111 @@
+# tdr_plan_cache.py
+# Bounded LRU cache of TDR simulation plans (pulse, spectrum, attenuation)
+
+import threading
+import dataclasses
+from collections import OrderedDict
+import numpy as np
+
+
+def plan_nbytes(plan):
+    """Bytes held by a plan's arrays"""
+    return sum(value.nbytes for value in plan.values() if isinstance(value, np.ndarray))
+
+
+class PlanCache:
+    """
+    Thread-safe cache for arrays that depend only on the TDR configuration
+
+    AdvancedTDRAnalyzer keeps its test pulse, the pulse spectrum and the
+    attenuated pulse per cable length here, so repeated simulations of the
+    same cable only pay for reflections and noise. Entries are evicted least
+    recently used first once their arrays exceed max_bytes. The cache is
+    cleared whenever it is bound to a configuration with different values.
+
+    Args:
+        max_bytes: memory budget for cached arrays
+        length_resolution_m: cable lengths are bucketed to this resolution and
+                             simulated at the bucket length (None: exact lengths)
+    """
+
+    def __init__(self, max_bytes=32 * 2**20, length_resolution_m=None):
+        self.max_bytes = max_bytes
+        self.length_resolution_m = length_resolution_m
+
+        self.fingerprint = None
+        self._entries = OrderedDict()  # key -> (plan, nbytes)
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def bind(self, config):
+        """Attach to a configuration; drops every plan if its values changed"""
+        fingerprint = dataclasses.astuple(config)
+        if fingerprint == self.fingerprint:
+            return
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.nbytes = 0
+            self.fingerprint = fingerprint
+
+    def length_bucket(self, distance_km):
+        """(cache key, simulated length in km) for a cable length"""
+        if not self.length_resolution_m:
+            return float(distance_km), float(distance_km)
+        bucket = int(round(distance_km * 1000 / self.length_resolution_m))
+        return bucket, bucket * self.length_resolution_m / 1000
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, plan):
+        """Store a plan (its arrays are made read-only); returns the plan"""
+        for value in plan.values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        nbytes = plan_nbytes(plan)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            if nbytes > self.max_bytes:
+                return plan  # larger than the whole budget: use once, do not keep
+            self._entries[key] = (plan, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'length_resolution_m': self.length_resolution_m,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
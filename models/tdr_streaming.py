@@ -0,0 +1,424 @@
+# tdr_streaming.py
+# Block-by-block TDR analysis for acquisitions too long to hold in memory
+#
+# calculate_impedance_profile, detect_anomalies and advanced_signal_processing
+# take the whole response and allocate several full-length temporaries each.
+# StreamingTDRAnalysis consumes the response in fixed-size blocks instead:
+# the impedance profile is pointwise once the incident amplitude (first 100
+# samples) is known, the Savitzky-Golay smoothing and the wavelet/correlation
+# transforms are overlap-save (each block plus the filter's reach on either
+# side), and peak detection carries the unfinished plateau and the unsettled
+# peak candidates across block edges. Memory is bounded by the block size and
+# the candidate peaks above the running threshold, not by the acquisition.
+#
+#   python tdr_streaming.py response.npy --sampling-rate 1e9 --block-size 65536
+
+import os
+import sys
+import argparse
+import numpy as np
+import scipy.signal as signal
+from scipy.ndimage import convolve1d
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tdr_transforms import StreamingTransforms
+from tdr_baseline import welford_merge
+
+INCIDENT_SAMPLES = 100   # calculate_impedance_profile's incident window
+SAVGOL_WINDOW = 21       # detect_anomalies smoothing
+SAVGOL_POLYORDER = 3
+PEAK_SEPARATION = 0.1    # find_peaks distance, as a fraction of the acquisition
+PEAK_THRESHOLD = 0.1     # find_peaks height, as a fraction of the response maximum
+
+
+class StreamingSavgol:
+    """
+    savgol_filter(x, window_length, polyorder) (mode 'interp') over blocks
+
+    Interior outputs are the same convolution as the whole-array filter, taken
+    over each block plus window_length // 2 samples on either side; the first
+    and last window_length // 2 outputs are the polynomial fits to the first
+    and last window_length samples. Results equal the whole-array filter.
+    """
+
+    def __init__(self, n_samples, window_length=SAVGOL_WINDOW, polyorder=SAVGOL_POLYORDER):
+        if window_length > n_samples:
+            raise ValueError("If mode is 'interp', window_length must be less "
+                             "than or equal to the size of x.")
+        self.n_samples = n_samples
+        self.window_length = window_length
+        self.polyorder = polyorder
+        self.half = window_length // 2
+        self.coeffs = signal.savgol_coeffs(window_length, polyorder)
+
+        self._buffer = np.empty(0)
+        self._start = 0     # sample index of _buffer[0]
+        self.position = 0   # next output index
+        self.received = 0
+
+    def _fit(self, window):
+        return signal.savgol_filter(window[np.newaxis, :], self.window_length, self.polyorder, axis=-1)[0]
+
+    def feed(self, values):
+        """Add samples; returns the smoothed values that became computable (from self.position)"""
+        self._buffer = np.concatenate([self._buffer, values])
+        self.received += len(values)
+        final = self.received >= self.n_samples
+        half = self.half
+        out = []
+
+        if self.position == 0 and (self.received >= self.window_length or final):
+            out.append(self._fit(self._buffer[:self.window_length])[:half])
+            self.position = half
+        stop = self.n_samples - half if final else self.received - half
+        if self.position > 0 and stop > self.position:
+            segment = self._buffer[self.position - half - self._start:stop + half - self._start]
+            out.append(convolve1d(segment[np.newaxis, :], self.coeffs, axis=-1, mode='constant')[0, half:-half])
+            self.position = stop
+        if final and self.position < self.n_samples:
+            out.append(self._fit(self._buffer[-self.window_length:])[-half:])
+            self.position = self.n_samples
+
+        # keep the window behind the next output (the tail fit needs window_length samples)
+        keep = max(0, self.position - self.window_length - self._start)
+        self._buffer = self._buffer[keep:]
+        self._start += keep
+        return np.concatenate(out) if out else np.empty(0)
+
+
+def select_by_peak_distance(positions, heights, distance):
+    """
+    find_peaks' distance rule: keep peaks from the highest down, dropping any
+    peak closer than distance to one already kept. positions must be sorted.
+    """
+    keep = np.ones(len(positions), dtype=bool)
+    for j in np.argsort(heights)[::-1]:
+        if not keep[j]:
+            continue
+        near = np.abs(positions - positions[j]) < distance
+        near[j] = False
+        keep[near] = False
+    return keep
+
+
+def has_higher_neighbour(positions, heights, distance):
+    """
+    For each peak, whether another peak at least as high lies closer than
+    distance (positions sorted); range maxima from a sparse table
+    """
+    n = len(positions)
+    index = np.arange(n)
+    starts = np.searchsorted(positions, positions - distance, side='right')
+    stops = np.searchsorted(positions, positions + distance, side='left')
+
+    table = [heights]  # table[k][i] = max(heights[i:i + 2**k])
+    while 2 ** len(table) <= n:
+        step = 2 ** (len(table) - 1)
+        table.append(np.maximum(table[-1][:-step], table[-1][step:]))
+
+    def range_max(start, stop):
+        out = np.full(n, -np.inf)
+        length = stop - start
+        level = np.zeros(n, dtype=np.int64)
+        level[length > 0] = np.log2(length[length > 0]).astype(np.int64)
+        for k in np.unique(level[length > 0]):
+            rows = (length > 0) & (level == k)
+            out[rows] = np.maximum(table[k][start[rows]], table[k][stop[rows] - 2 ** k])
+        return out
+
+    return (range_max(starts, index) >= heights) | (range_max(index + 1, stops) >= heights)
+
+
+class StreamingTDRAnalysis:
+    """
+    Incremental impedance profile, anomaly detection and transforms for one acquisition
+
+    feed() the response in blocks of any size (they are processed in
+    block_size pieces) and finish() after the last sample. Anomalies are
+    emitted as soon as no later sample can change their peak selection
+    (find_peaks keeps peaks 10% of the acquisition apart, so that is the
+    emission latency) and are classified against the running response
+    maximum. finish() returns exactly detect_anomalies' result for the whole
+    acquisition (up to which of several peaks of exactly equal height
+    find_peaks keeps); an early anomaly differs from it only if a later
+    sample raised the response maximum (reported as 'revised').
+
+    The FFT magnitude spectrum of advanced_signal_processing is a property of
+    the whole acquisition and is not produced here.
+
+    Args:
+        analyzer: AdvancedTDRAnalyzer (configuration, classification, template)
+        n_samples: total samples in the acquisition
+        block_size: samples processed per pass (bounds temporaries)
+        transforms: also compute the wavelet energy and template correlation
+    """
+
+    def __init__(self, analyzer, n_samples, block_size=65536, transforms=True):
+        self.analyzer = analyzer
+        self.n_samples = n_samples
+        self.block_size = block_size
+        self.velocity = 3e8 * analyzer.config.cable_velocity_factor
+        self.min_separation = int(PEAK_SEPARATION * n_samples)
+
+        self.transforms = StreamingTransforms(analyzer.transforms, n_samples, block_size) if transforms else None
+        self.impedance_filter = StreamingSavgol(n_samples)
+        self.response_filter = StreamingSavgol(n_samples)
+
+        self.received = 0
+        self.incident_amplitude = None
+        self._pending = []          # (response, time) held until the incident amplitude is known
+        self._distance = np.empty(0)  # distances of samples not yet smoothed
+
+        self.response_max = -np.inf
+        # samples from the rise into the unfinished plateau on, as chunks of
+        # (magnitude, response, impedance, distance)
+        self._carry = []
+        self._carry_length = 0
+        self._carry_start = 0
+        # peak candidates above the running threshold: position, height, response, impedance, distance
+        self._candidates = (np.empty(0, dtype=np.int64),) + (np.empty(0),) * 4
+        self._settled = (np.empty(0, dtype=np.int64),) + (np.empty(0),) * 4
+        self.emitted = []
+
+        self._count, self._mean, self._m2 = 0, 0.0, 0.0
+        self._sum_squares = 0.0
+        self._min, self._max, self._abs_max = np.inf, -np.inf, 0.0
+
+    def feed(self, response_block: np.ndarray, time_block: np.ndarray = None):
+        """
+        Add the next samples of the response
+
+        Args:
+            response_block: next samples of the TDR response
+            time_block: their times (default: sample index / sampling rate)
+
+        Returns:
+            dict with 'anomalies' (TDRReflection list, newly settled),
+            'distance' and 'impedance' (profile of the newly available samples)
+            and, with transforms, 'offset', 'wavelet_energy' and 'correlation'
+            (values from sample index offset on)
+        """
+        response_block = np.asarray(response_block, dtype=np.float64)
+        if time_block is None:
+            time_block = np.arange(self.received, self.received + len(response_block)) / self.analyzer.config.sampling_rate
+        if self.received + len(response_block) > self.n_samples:
+            raise ValueError(f"More than the declared {self.n_samples} samples fed")
+
+        results = {'anomalies': [], 'distance': [], 'impedance': [], 'offset': None,
+                   'wavelet_energy': [], 'correlation': []}
+        for start in range(0, len(response_block), self.block_size):
+            self._feed_block(response_block[start:start + self.block_size],
+                             np.asarray(time_block[start:start + self.block_size], dtype=np.float64), results)
+
+        for key in ('distance', 'impedance', 'wavelet_energy', 'correlation'):
+            results[key] = np.concatenate(results[key]) if results[key] else np.empty(0)
+        if self.transforms is None:
+            for key in ('offset', 'wavelet_energy', 'correlation'):
+                del results[key]
+        elif results['offset'] is None:
+            results['offset'] = self.transforms.position
+        return results
+
+    def _feed_block(self, response, time_base, results):
+        self.received += len(response)
+        final = self.received == self.n_samples
+        self._update_statistics(response)
+
+        if self.transforms is not None:
+            offset, energy, correlation = self.transforms.feed(response)
+            if results['offset'] is None:
+                results['offset'] = offset
+            results['wavelet_energy'].append(energy)
+            results['correlation'].append(correlation)
+
+        self._pending.append((response, time_base))
+        if self.incident_amplitude is None:
+            if self.received < INCIDENT_SAMPLES and not final:
+                return
+            self.incident_amplitude = np.max(np.concatenate([r for r, _ in self._pending])[:INCIDENT_SAMPLES])
+        response = np.concatenate([r for r, _ in self._pending])
+        time_base = np.concatenate([t for _, t in self._pending])
+        self._pending = []
+
+        # calculate_impedance_profile, pointwise
+        distance = time_base * self.velocity / 2
+        reflection_coefficient = (response - self.incident_amplitude) / self.incident_amplitude
+        reflection_coefficient = np.clip(reflection_coefficient, -0.99, 0.99)
+        impedance = self.analyzer.baseline_impedance * (1 + reflection_coefficient) / (1 - reflection_coefficient)
+        results['distance'].append(distance)
+        results['impedance'].append(impedance)
+
+        self._distance = np.concatenate([self._distance, distance])
+        smoothed_impedance = self.impedance_filter.feed(impedance)
+        smoothed_response = self.response_filter.feed(response)
+        smoothed_distance, self._distance = np.split(self._distance, [len(smoothed_response)])
+        if len(smoothed_response):
+            self.response_max = max(self.response_max, smoothed_response.max())
+        self._find_candidates(smoothed_response, smoothed_impedance, smoothed_distance, final)
+        results['anomalies'].extend(self._settle(final))
+
+    def _update_statistics(self, response):
+        self._count, self._mean, self._m2 = welford_merge(self._count, self._mean, self._m2, response)
+        self._sum_squares += np.dot(response, response)
+        self._min = min(self._min, response.min())
+        self._max = max(self._max, response.max())
+        self._abs_max = max(self._abs_max, np.abs(response).max())
+
+    def _find_candidates(self, response, impedance, distance, final):
+        """Local maxima of |smoothed response| (find_peaks plateau rules) that the new samples complete"""
+        values = (np.abs(response), response, impedance, distance)
+        if self._carry_length > 1:
+            # The carry is a rise into a plateau: find where the plateau ends
+            # without rescanning (or re-concatenating) the samples carried so far
+            level = self._carry[-1][0][-1]
+            differs = np.flatnonzero(values[0] != level)
+            if not len(differs):
+                # still on the plateau (one reaching the last sample is not a peak)
+                self._carry.append(values)
+                self._carry_length += len(response)
+                return
+            end = differs[0]
+            if values[0][end] < level:
+                plateau = tuple(np.concatenate(parts) for parts in zip(*self._carry, tuple(v[:end] for v in values)))
+                middle = (1 + self._carry_length - 1 + end) // 2
+                self._add_candidates(np.array([middle]), plateau, self._carry_start)
+            # continue from the last plateau sample (it cannot be a peak itself)
+            start = self._carry_start + self._carry_length - 1 + end
+            if end:
+                segment = tuple(v[end - 1:] for v in values)
+            else:
+                segment = tuple(np.concatenate([c[-1:], v]) for c, v in zip(self._carry[-1], values))
+        else:
+            start = self._carry_start
+            segment = tuple(np.concatenate([c, v]) for c, v in zip(self._carry[0], values)) if self._carry else values
+
+        magnitude = segment[0]
+        peaks, _ = signal.find_peaks(magnitude)
+        self._add_candidates(peaks, segment, start)
+
+        # Carry the last sample, or the rise into a plateau that reaches the
+        # end (it is a peak if the next block falls away from it)
+        carry_from = max(len(magnitude) - 1, 0)
+        if len(magnitude):
+            # plateau start: one past the last sample that differs from the final one
+            differs = np.flatnonzero(magnitude != magnitude[-1])
+            plateau = differs[-1] + 1 if len(differs) else 0
+            if plateau > 0 and magnitude[plateau - 1] < magnitude[plateau]:
+                carry_from = plateau - 1
+        if final:
+            carry_from = len(magnitude)
+        self._carry = [tuple(v[carry_from:] for v in segment)] if carry_from < len(magnitude) else []
+        self._carry_length = len(magnitude) - carry_from
+        self._carry_start = start + carry_from
+
+    def _add_candidates(self, peaks, segment, start):
+        """Keep the peaks of segment (sample index start on) that reach the running threshold"""
+        peaks = peaks[segment[0][peaks] >= PEAK_THRESHOLD * self.response_max]
+        new = (peaks + start,) + tuple(v[peaks] for v in segment)
+        self._candidates = tuple(np.concatenate([c, n]) for c, n in zip(self._candidates, new))
+
+    def _settle(self, final):
+        """
+        Drop candidates the running threshold or a settled peak rules out and
+        emit the peaks whose selection no later sample can change
+        """
+        threshold = PEAK_THRESHOLD * self.response_max
+        candidates = tuple(c[self._candidates[1] >= threshold] for c in self._candidates)
+        positions, heights = candidates[0], candidates[1]
+        if final:
+            self._candidates = candidates
+            return []
+
+        # A peak is settled once no later peak (they lie at or after the carry
+        # start) can be near it and no undecided neighbour is as high. Settled
+        # peaks are kept by find_peaks and drop their lower neighbours, which
+        # may unblock others; repeat until nothing changes.
+        eligible = positions + self.min_separation <= self._carry_start
+        remaining = np.ones(len(positions), dtype=bool)
+        settled = np.zeros(len(positions), dtype=bool)
+        while True:
+            index = np.flatnonzero(remaining)
+            blocked = has_higher_neighbour(positions[index], heights[index], self.min_separation)
+            new = index[eligible[index] & ~blocked]
+            if not len(new):
+                break
+            settled[new] = True
+            # the settled peaks and everything closer than min_separation to them
+            starts = np.searchsorted(positions, positions[new] - self.min_separation, side='right')
+            stops = np.searchsorted(positions, positions[new] + self.min_separation, side='left')
+            covered = np.zeros(len(positions) + 1, dtype=np.int64)
+            np.add.at(covered, starts, 1)
+            np.add.at(covered, stops, -1)
+            remaining &= np.cumsum(covered[:-1]) == 0
+
+        new = tuple(c[settled] for c in candidates)
+        self._candidates = tuple(c[remaining] for c in candidates)
+        self._settled = tuple(np.concatenate([s, n]) for s, n in zip(self._settled, new))
+        anomalies = self._classify(new, self.response_max)
+        self.emitted.extend(anomalies)
+        return anomalies
+
+    def _classify(self, peaks, response_max):
+        _, heights, response, impedance, distance = peaks
+        confidence, anomaly_type, report = self.analyzer.classify_peaks(heights, response_max, impedance)
+        return self.analyzer.peak_reflections(distance[report], response[report], impedance[report],
+                                              confidence[report], anomaly_type[report])
+
+    def finish(self) -> dict:
+        """
+        Results for the whole acquisition (all samples must have been fed)
+
+        Returns:
+            dict with 'anomalies' (as detect_anomalies), 'statistics' (as
+            advanced_signal_processing) and 'revised' (True if anomalies
+            emitted by feed() differ from the final ones)
+        """
+        if self.received != self.n_samples:
+            raise ValueError(f"{self.received} of {self.n_samples} samples fed")
+
+        peaks = tuple(np.concatenate([s, c]) for s, c in zip(self._settled, self._candidates))
+        order = np.argsort(peaks[0], kind='stable')
+        peaks = tuple(p[order] for p in peaks)
+        peaks = tuple(p[peaks[1] >= PEAK_THRESHOLD * self.response_max] for p in peaks)
+        keep = select_by_peak_distance(peaks[0], peaks[1], self.min_separation)
+        anomalies = self._classify(tuple(p[keep] for p in peaks), self.response_max)
+
+        def key(anomaly):
+            return anomaly.distance, anomaly.confidence, anomaly.anomaly_type
+        revised = not set(map(key, self.emitted)) <= set(map(key, anomalies))
+
+        rms = np.sqrt(self._sum_squares / self._count)
+        statistics = {
+            'mean': float(self._mean),
+            'std': float(np.sqrt(self._m2 / self._count)),
+            'rms': float(rms),
+            'peak_to_peak': float(self._max - self._min),
+            'crest_factor': float(self._abs_max / rms)
+        }
+        return {'anomalies': anomalies, 'statistics': statistics, 'revised': revised}
+
+
+def analyze_file(analyzer, path, block_size=65536, transforms=False):
+    """Stream a .npy response from disk (memory-mapped), printing anomalies as they settle"""
+    response = np.load(path, mmap_mode='r')
+    stream = StreamingTDRAnalysis(analyzer, len(response), block_size, transforms=transforms)
+    for start in range(0, len(response), block_size):
+        for anomaly in stream.feed(response[start:start + block_size])['anomalies']:
+            print(f"{anomaly.distance:10.1f} m  {anomaly.anomaly_type:<24} confidence {anomaly.confidence:.2f}")
+    return stream.finish()
+
+
+if __name__ == "__main__":
+    from tdr_analysis import AdvancedTDRAnalyzer, TDRConfiguration
+
+    parser = argparse.ArgumentParser(description='Streaming TDR anomaly detection for long acquisitions')
+    parser.add_argument('response', help='.npy file with the TDR response')
+    parser.add_argument('--sampling-rate', type=float, default=TDRConfiguration.sampling_rate)
+    parser.add_argument('--block-size', type=int, default=65536)
+    args = parser.parse_args()
+
+    result = analyze_file(AdvancedTDRAnalyzer(TDRConfiguration(sampling_rate=args.sampling_rate)),
+                          args.response, args.block_size)
+    print(f"{len(result['anomalies'])} anomalies"
+          + (" (revised: the response maximum rose after early detections)" if result['revised'] else ""))
+    print(result['statistics'])
@@ -0,0 +1,201 @@
+# tdr_transforms.py
+# FFT wavelet and template-correlation engine for TDR sweeps
+#
+# advanced_signal_processing used scipy.signal.cwt with Ricker wavelets (one
+# direct convolution per scale, and both functions are gone from recent SciPy,
+# which left it reporting all-ones wavelet energy) and np.correlate against
+# the fault template (O(N*M)). TransformEngine gives the same 'same'-mode
+# results from real FFTs: the kernels are built once per sweep length, kept in
+# the frequency domain with their centring shift folded in, and every scale of
+# a sweep (or a stack of sweeps) is one spectrum product and inverse FFT. The
+# template is short (100 taps), so correlation stays direct unless
+# scipy.signal.choose_conv_method estimates the FFT to be faster for the
+# sweep length.
+
+from collections import OrderedDict
+import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
+from scipy.signal import choose_conv_method
+
+DEFAULT_WIDTHS = tuple(range(1, 31))
+MAX_PLANS = 8          # cached (length, sampling rate) plans
+SCALE_BLOCK = 8        # wavelet scales transformed per pass (bounds temporaries)
+
+
+def ricker(points, a):
+    """Ricker (Mexican hat) wavelet, as the former scipy.signal.ricker"""
+    amplitude = 2 / (np.sqrt(3 * a) * (np.pi ** 0.25))
+    x_squared = (np.arange(points) - (points - 1.0) / 2) ** 2
+    return amplitude * (1 - x_squared / a ** 2) * np.exp(-x_squared / (2 * a ** 2))
+
+
+def _shifted_spectrum(kernel, n_fft):
+    """rfft of a kernel rolled so that a circular convolution lands on the 'same' window"""
+    padded = np.zeros(n_fft)
+    padded[:len(kernel)] = kernel
+    return rfft(np.roll(padded, -((len(kernel) - 1) // 2)))
+
+
+class TransformEngine:
+    """
+    Ricker CWT and fault-template correlation by FFT, with per-length kernel plans
+
+    Args:
+        template: fault signature correlated against sweeps (np.correlate 'same')
+        widths: Ricker widths in samples (scipy.signal.cwt semantics: kernel
+                length min(10 * width, N))
+        max_plans: plans kept, least recently used evicted first
+    """
+
+    def __init__(self, template, widths=DEFAULT_WIDTHS, max_plans=MAX_PLANS):
+        self.template = np.asarray(template, dtype=np.float64)
+        self.widths = tuple(widths)
+        self.max_plans = max_plans
+        self._plans = OrderedDict()
+
+    def plan(self, n_samples, sampling_rate=None):
+        """
+        Frequency-domain kernels for sweeps of n_samples
+
+        Returns:
+            dict with n_fft, wavelets ((n_widths, n_fft // 2 + 1) spectra),
+            template (spectrum) and correlation ('direct' or 'fft'), built on
+            first use
+        """
+        key = (n_samples, sampling_rate)
+        plan = self._plans.get(key)
+        if plan is not None:
+            self._plans.move_to_end(key)
+            return plan
+
+        wavelets, template = self.kernels(n_samples)
+        longest = max(len(kernel) for kernel in wavelets + [template])
+        n_fft = next_fast_len(n_samples + longest - 1, real=True)
+        plan = {
+            'n_fft': n_fft,
+            'wavelets': np.array([_shifted_spectrum(kernel, n_fft) for kernel in wavelets]),
+            'template': _shifted_spectrum(template, n_fft),
+            # estimated from the lengths only
+            'correlation': choose_conv_method(np.empty(n_samples), template, mode='same')
+        }
+        self._plans[key] = plan
+        while len(self._plans) > self.max_plans:
+            self._plans.popitem(last=False)
+        return plan
+
+    def kernels(self, n_samples):
+        """Time-domain convolution kernels for sweeps of n_samples: (wavelet list, template)"""
+        wavelets = [ricker(min(10 * w, n_samples), w)[::-1] for w in self.widths]
+        # correlation = convolution with the reversed template
+        return wavelets, self.template[::-1]
+
+    def cwt(self, sweeps, sampling_rate=None):
+        """Wavelet coefficients: (n_widths, N) for one sweep, (S, n_widths, N) for a stack"""
+        sweeps = np.asarray(sweeps, dtype=np.float64)
+        n_samples = sweeps.shape[-1]
+        plan = self.plan(n_samples, sampling_rate)
+        spectrum = rfft(sweeps, plan['n_fft'], axis=-1)[..., np.newaxis, :]
+        return irfft(spectrum * plan['wavelets'], plan['n_fft'], axis=-1)[..., :n_samples]
+
+    def wavelet_energy(self, sweeps, sampling_rate=None):
+        """sum over scales of |cwt|^2: (N,) for one sweep, (S, N) for a stack"""
+        sweeps = np.asarray(sweeps, dtype=np.float64)
+        n_samples = sweeps.shape[-1]
+        plan = self.plan(n_samples, sampling_rate)
+        spectrum = rfft(sweeps, plan['n_fft'], axis=-1)[..., np.newaxis, :]
+        energy = np.zeros(sweeps.shape)
+        for start in range(0, len(self.widths), SCALE_BLOCK):
+            block = irfft(spectrum * plan['wavelets'][start:start + SCALE_BLOCK], plan['n_fft'], axis=-1)
+            energy += np.square(block[..., :n_samples]).sum(axis=-2)
+        return energy
+
+    def correlate(self, sweeps, sampling_rate=None):
+        """np.correlate(sweep, template, mode='same') along the last axis"""
+        sweeps = np.asarray(sweeps, dtype=np.float64)
+        n_samples = sweeps.shape[-1]
+        if n_samples < len(self.template):
+            # 'same' is template-length here; not worth a plan
+            return np.apply_along_axis(np.correlate, -1, sweeps, self.template, mode='same')
+        plan = self.plan(n_samples, sampling_rate)
+        if plan['correlation'] == 'direct':
+            return np.apply_along_axis(np.correlate, -1, sweeps, self.template, mode='same')
+        spectrum = rfft(sweeps, plan['n_fft'], axis=-1)
+        return irfft(spectrum * plan['template'], plan['n_fft'], axis=-1)[..., :n_samples]
+
+    def clear(self):
+        """Drop all cached plans"""
+        self._plans.clear()
+
+
+class StreamingTransforms:
+    """
+    TransformEngine.wavelet_energy and correlate for one acquisition fed in blocks
+
+    Overlap-save: each output block is computed from its input samples plus
+    the kernels' reach on either side, with one fixed FFT size, so memory is
+    bounded by block_size however long the acquisition is. Kernel lengths
+    follow the full acquisition length, as in the whole-array transforms, and
+    the results match them to rounding.
+
+    Args:
+        engine: TransformEngine supplying widths and the template
+        n_samples: total acquisition length
+        block_size: outputs computed per FFT pass
+    """
+
+    def __init__(self, engine, n_samples, block_size=65536):
+        wavelets, template = engine.kernels(n_samples)
+        kernels = wavelets + [template]
+        self.n_samples = n_samples
+        self.block_size = block_size
+        self.centres = np.array([(len(kernel) - 1) // 2 for kernel in kernels])
+        self.lookback = max(len(kernel) - 1 - c for kernel, c in zip(kernels, self.centres))
+        self.lookahead = int(self.centres.max())
+        segment = self.lookback + block_size + self.lookahead
+        self.n_fft = next_fast_len(segment + max(len(kernel) for kernel in kernels) - 1, real=True)
+        self.spectra = np.array([rfft(kernel, self.n_fft) for kernel in kernels])
+
+        self._buffer = np.zeros(self.lookback)  # samples from position - lookback on
+        self.position = 0   # next output index
+        self.received = 0
+
+    def _block(self, count):
+        segment = self._buffer[:self.lookback + count + self.lookahead]
+        if len(segment) < self.lookback + count + self.lookahead:  # past the end: zeros
+            segment = np.concatenate([segment, np.zeros(self.lookback + count + self.lookahead - len(segment))])
+        spectrum = rfft(segment, self.n_fft)
+        energy = np.zeros(count)
+        n_wavelets = len(self.spectra) - 1
+        for start in range(0, n_wavelets, SCALE_BLOCK):
+            stop = min(start + SCALE_BLOCK, n_wavelets)
+            full = irfft(spectrum * self.spectra[start:stop], self.n_fft, axis=-1)
+            for row, centre in zip(full, self.centres[start:stop]):
+                energy += np.square(row[self.lookback + centre:self.lookback + centre + count])
+        full = irfft(spectrum * self.spectra[-1], self.n_fft)
+        centre = self.centres[-1]
+        correlation = full[self.lookback + centre:self.lookback + centre + count]
+
+        self._buffer = self._buffer[count:]
+        self.position += count
+        return energy, correlation
+
+    def feed(self, block):
+        """
+        Add samples; returns (offset, wavelet_energy, correlation) for the
+        outputs that became computable (possibly empty)
+        """
+        block = np.asarray(block, dtype=np.float64)
+        self._buffer = np.concatenate([self._buffer, block])
+        self.received += len(block)
+        final = self.received >= self.n_samples
+        ready = self.n_samples if final else max(self.position, self.received - self.lookahead)
+
+        offset = self.position
+        energies, correlations = [], []
+        while ready - self.position >= (1 if final else self.block_size):
+            energy, correlation = self._block(min(self.block_size, ready - self.position))
+            energies.append(energy)
+            correlations.append(correlation)
+        if not energies:
+            return offset, np.empty(0), np.empty(0)
+        return offset, np.concatenate(energies), np.concatenate(correlations)
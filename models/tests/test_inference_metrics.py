@@ -0,0 +1,16 @@
+# test_inference_metrics.py
+# Stage timing and error counting
+
+import pytest
+
+from inference_metrics import InferenceMetrics
+
+
+def test_failed_stage_is_timed_but_not_counted_as_error():
+    metrics = InferenceMetrics()
+    with pytest.raises(ZeroDivisionError):
+        with metrics.stage('fence.predict'):
+            1 / 0
+    snapshot = metrics.snapshot()
+    assert [c for c in snapshot['counters'] if c['name'] == 'errors'] == []
+    assert 'fence.predict' in str(snapshot)
@@ -0,0 +1,41 @@
+# test_model_registry.py
+# Version pruning
+
+import os
+
+import pytest
+
+from model_registry import ModelRegistry
+
+
+class _SavedModel:
+    """Stands in for VoltageSpikePredictionModel: publish only calls save_models"""
+    def save_models(self, model_dir, format='pickle'):
+        os.makedirs(model_dir)
+
+
+def _registry(root, versions):
+    registry = ModelRegistry(str(root))
+    for _ in range(versions):
+        registry.publish(_SavedModel())
+    return registry
+
+
+def test_prune_keep_zero_keeps_only_current(tmp_path):
+    registry = _registry(tmp_path, 4)
+    registry.rollback()  # current is v0003
+    assert registry.prune(keep=0) == ['v0001', 'v0002', 'v0004']
+    assert [v['version'] for v in registry.versions()] == ['v0003']
+    assert sorted(os.listdir(tmp_path)) == ['registry.json', 'v0003']
+
+
+def test_prune_keeps_newest(tmp_path):
+    registry = _registry(tmp_path, 4)
+    assert registry.prune(keep=2) == ['v0001', 'v0002']
+    assert registry.prune(keep=5) == []
+    assert [v['version'] for v in ModelRegistry(str(tmp_path)).versions()] == ['v0003', 'v0004']
+
+
+def test_prune_rejects_negative_keep(tmp_path):
+    with pytest.raises(ValueError):
+        _registry(tmp_path, 1).prune(keep=-1)
@@ -0,0 +1,77 @@
+# test_predictive_model.py
+# save_models / load_models round trips
+
+import json
+import os
+
+import numpy as np
+from sklearn.ensemble import IsolationForest, RandomForestRegressor
+
+from predictive_model import VoltageSpikePredictionModel, _rotate_trees
+
+
+def _lstm_dir(path):
+    """A model directory with a saved LSTM (its bytes are opaque to save/load)"""
+    os.makedirs(path)
+    with open(os.path.join(path, 'lstm_model.h5'), 'wb') as f:
+        f.write(b'saved lstm weights')
+    with open(os.path.join(path, 'forecast.json'), 'w') as f:
+        json.dump({'engine': 'lstm'}, f)
+    return str(path)
+
+
+def test_lazily_loaded_lstm_survives_resave(tmp_path):
+    source = _lstm_dir(tmp_path / 'v1')
+    model = VoltageSpikePredictionModel()
+    model.load_models(source, components=('lstm',))
+    assert model.lstm_model is None and model.lstm_path
+
+    target = str(tmp_path / 'v2')
+    model.save_models(target, components=('lstm',))
+    with open(os.path.join(target, 'lstm_model.h5'), 'rb') as f:
+        assert f.read() == b'saved lstm weights'
+
+    reloaded = VoltageSpikePredictionModel()
+    reloaded.load_models(target, components=('lstm',))
+    assert reloaded.forecast_engine == 'lstm'
+    assert reloaded.lstm_path == os.path.join(target, 'lstm_model.h5')
+
+
+def test_resave_into_same_directory(tmp_path):
+    source = _lstm_dir(tmp_path / 'v1')
+    model = VoltageSpikePredictionModel()
+    model.load_models(source, components=('lstm',))
+    model.save_models(source, components=('lstm',))
+    with open(os.path.join(source, 'lstm_model.h5'), 'rb') as f:
+        assert f.read() == b'saved lstm weights'
+
+
+def test_lstm_engine_never_recorded_without_lstm(tmp_path):
+    target = str(tmp_path / 'v1')
+    VoltageSpikePredictionModel().save_models(target, components=('lstm',))
+    assert not os.path.exists(os.path.join(target, 'forecast.json'))
+
+    reloaded = VoltageSpikePredictionModel()
+    reloaded.load_models(target, components=('lstm',))
+    assert reloaded.lstm_path is None
+
+
+def test_rotate_trees_keeps_isolation_forest_subsample_size():
+    rng = np.random.default_rng(0)
+    forest = IsolationForest(n_estimators=20, random_state=42).fit(rng.normal(size=(2000, 5)))
+    seeds, survivors = forest._seeds.copy(), forest.estimators_[5:]
+
+    _rotate_trees(forest, rng.normal(size=(60, 5)), None, 5, seed=7)
+    assert forest._max_samples == forest.max_samples_ == 256
+    assert len(forest.estimators_) == len(forest._seeds) == 20
+    assert all(a is b for a, b in zip(forest.estimators_, survivors))
+    assert (forest._seeds[:15] == seeds[5:]).all()
+
+
+def test_rotate_trees_random_forest():
+    rng = np.random.default_rng(0)
+    X, y = rng.normal(size=(200, 3)), rng.normal(size=200)
+    forest = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, y)
+    _rotate_trees(forest, X[:50], y[:50], 4, seed=1)
+    assert len(forest.estimators_) == forest.n_estimators == 10
+    assert forest.predict(X).shape == (200,)
@@ -0,0 +1,32 @@
+# test_snapshots.py
+# Snapshot round trips of the per-feeder / per-cable state stores
+
+import numpy as np
+
+from feature_store import FeederFeatureStore
+from tdr_baseline import TDRBaseline
+
+
+def test_tdr_baseline_numpy_cable_ids(tmp_path):
+    baseline = TDRBaseline(capacity=1)
+    values = np.random.default_rng(0).normal(size=200)
+    baseline.update(np.int64(7), values)
+    baseline.update(('line', np.int32(2)), values[:50])
+
+    path = str(tmp_path / 'baseline.npz')
+    baseline.snapshot(path)
+    restored = TDRBaseline.restore(path)
+    assert restored.slots == {7: 0, ('line', 2): 1}
+    assert restored.stats(7) == baseline.stats(np.int64(7))
+
+
+def test_feature_store_numpy_feeder_ids(tmp_path):
+    store = FeederFeatureStore(capacity=1)
+    reading = {'voltage': 231.0, 'current': 14.0, 'frequency': 50.1, 'impedance': 0.5}
+    store.update_many(np.array([3, 4], dtype=np.int64), [reading, reading])
+
+    path = str(tmp_path / 'store.npz')
+    store.snapshot(path)
+    restored = FeederFeatureStore.restore(path)
+    assert restored.slots == {3: 0, 4: 1}
+    assert np.array_equal(restored.update(3, reading), store.update(np.int64(3), reading))
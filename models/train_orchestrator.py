@@ -0,0 +1,232 @@
+# train_orchestrator.py
+# Train the voltage spike models concurrently, one process per model, with core budgets
+#
+# The RF, IsolationForest and forecaster fits are independent (each model has
+# its own scaler), so each runs in its own process pinned to its share of the
+# CPUs with os.sched_setaffinity. joblib (sklearn n_jobs=-1) and the BLAS/OpenMP
+# pools size themselves from that share, and TensorFlow gets matching thread
+# counts. Jobs that do not fit in the free cores wait for a running one to
+# finish. Every job saves its own model files into the output directory and a
+# training_report.json records wall time, CPU time and peak RSS per model.
+#
+#   python train_orchestrator.py --samples 200000 --out models/ --cores rf=2,anomaly=1,direct=1
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tempfile
+import multiprocessing
+from multiprocessing.connection import wait
+from datetime import datetime
+
+# Job name -> (model components it writes, training method)
+JOBS = {
+    'rf': (('rf',), 'train_random_forest_model'),
+    'anomaly': (('anomaly',), 'train_anomaly_detector'),
+    'lstm': (('lstm',), 'train_lstm_model'),
+    'direct': (('direct',), 'train_direct_forecaster'),
+}
+DEFAULT_JOBS = ('rf', 'anomaly', 'direct')
+
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def available_cores():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _usage():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu_s': own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        'peak_rss_mb': max(own.ru_maxrss, children.ru_maxrss) / 1024
+    }
+
+
+def _run_job(name, data_path, out_dir, cores, format, kwargs, report_path):
+    """Child process: pin to cores, train one model, save it and write its report"""
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(max(1, len(cores)))
+
+    report = {'job': name, 'cores': list(cores), 'pid': os.getpid()}
+    start = time.perf_counter()
+    try:
+        import pandas as pd
+        from predictive_model import VoltageSpikePredictionModel
+
+        if name == 'lstm':
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(len(cores))
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+
+        df = pd.read_pickle(data_path)
+        loaded = time.perf_counter()
+
+        components, method = JOBS[name]
+        model = VoltageSpikePredictionModel()
+        result = getattr(model, method)(df, **kwargs)
+        if name in ('lstm', 'direct'):
+            model.forecast_engine = name
+        trained = time.perf_counter()
+
+        model.save_models(out_dir, format=format, components=components)
+        report.update({
+            'status': 'ok',
+            'load_data_s': loaded - start,
+            'train_s': trained - loaded,
+            'result': result if isinstance(result, (int, float)) else None
+        })
+    except Exception as e:
+        report.update({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+
+    report['wall_s'] = time.perf_counter() - start
+    report.update(_usage())
+    report['cpu_utilization'] = report['cpu_s'] / report['wall_s'] / max(1, len(cores))
+    with open(report_path, 'w') as f:
+        json.dump(report, f)
+
+
+def train_models(df, out_dir, jobs=DEFAULT_JOBS, cores=None, format='pickle',
+                 forecast_engine=None, job_kwargs=None):
+    """
+    Train independent models in parallel processes and save them into one directory
+
+    Args:
+        df: training DataFrame (generate_training_data layout)
+        out_dir: model directory (save_models layout)
+        jobs: names from JOBS
+        cores: dict job -> number of cores (default: the available cores split
+               evenly); a job never gets more than the machine has
+        format: save_models format
+        forecast_engine: engine recorded in forecast.json (default: the first
+                         of 'direct'/'lstm' that trained)
+        job_kwargs: dict job -> keyword arguments of its training method
+
+    Returns:
+        report dict, also written to out_dir/training_report.json
+    """
+    unknown = set(jobs) - set(JOBS)
+    if unknown:
+        raise ValueError(f"Unknown training jobs: {sorted(unknown)}")
+
+    machine = available_cores()
+    cores = dict(cores or {})
+    share = max(1, len(machine) // len(jobs))
+    budget = {name: min(len(machine), max(1, int(cores.get(name, share)))) for name in jobs}
+    job_kwargs = job_kwargs or {}
+
+    os.makedirs(out_dir, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix='train_jobs_')
+    data_path = os.path.join(scratch, 'train.pkl')
+    df.to_pickle(data_path)
+
+    print(f"Training {list(jobs)} on {len(df)} rows with {len(machine)} cores: {budget}")
+    context = multiprocessing.get_context('spawn')
+    pending = list(jobs)
+    running = {}  # sentinel -> (name, process, cores)
+    free = list(machine)
+    timeline = {}
+    start = time.perf_counter()
+
+    while pending or running:
+        # Start every pending job whose budget fits in the free cores, in order
+        for name in list(pending):
+            if budget[name] > len(free):
+                continue
+            assigned, free = free[:budget[name]], free[budget[name]:]
+            process = context.Process(
+                target=_run_job, name=f'train-{name}',
+                args=(name, data_path, out_dir, assigned, format, job_kwargs.get(name, {}),
+                      os.path.join(scratch, f'{name}.json'))
+            )
+            process.start()
+            running[process.sentinel] = (name, process, assigned)
+            timeline[name] = {'started_s': time.perf_counter() - start}
+            pending.remove(name)
+            print(f"  {name}: started on cores {assigned}")
+
+        for sentinel in wait(list(running)):
+            name, process, assigned = running.pop(sentinel)
+            process.join()
+            free = sorted(free + assigned)
+            timeline[name]['finished_s'] = time.perf_counter() - start
+            timeline[name]['exitcode'] = process.exitcode
+            print(f"  {name}: finished with exit code {process.exitcode}")
+
+    total_wall = time.perf_counter() - start
+
+    results = {}
+    for name in jobs:
+        report_path = os.path.join(scratch, f'{name}.json')
+        if os.path.exists(report_path):
+            with open(report_path, 'r') as f:
+                results[name] = json.load(f)
+        else:
+            results[name] = {'job': name, 'status': 'error',
+                             'error': f"process exited with code {timeline[name]['exitcode']}"}
+        results[name].update(timeline[name])
+
+    # forecast.json names the engine predict_next_24_hours uses
+    trained_engines = [name for name in ('direct', 'lstm') if results.get(name, {}).get('status') == 'ok']
+    engine = forecast_engine or (trained_engines[0] if trained_engines else None)
+    if engine:
+        with open(os.path.join(out_dir, 'forecast.json'), 'w') as f:
+            json.dump({'engine': engine}, f)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'rows': len(df),
+        'cores_available': len(machine),
+        'core_budget': budget,
+        'format': format,
+        'forecast_engine': engine,
+        'wall_s': total_wall,
+        'sequential_wall_s': sum(r.get('wall_s', 0.0) for r in results.values()),
+        'cpu_s': sum(r.get('cpu_s', 0.0) for r in results.values()),
+        'jobs': results
+    }
+    with open(os.path.join(out_dir, 'training_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    import shutil
+    shutil.rmtree(scratch, ignore_errors=True)
+    print(f"Trained {len(jobs)} models in {total_wall:.1f}s "
+          f"(sum of job wall times {report['sequential_wall_s']:.1f}s)")
+    return report
+
+
+def _parse_cores(text):
+    """'rf=2,anomaly=1' -> {'rf': 2, 'anomaly': 1}"""
+    cores = {}
+    for item in filter(None, (text or '').split(',')):
+        name, _, count = item.partition('=')
+        cores[name.strip()] = int(count)
+    return cores
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from predictive_model import VoltageSpikePredictionModel
+
+    parser = argparse.ArgumentParser(description='Train the voltage spike models in parallel processes')
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='models/', metavar='DIR')
+    parser.add_argument('--jobs', default=','.join(DEFAULT_JOBS), help=f"comma-separated subset of {list(JOBS)}")
+    parser.add_argument('--cores', default='', help='per-job core budget, e.g. rf=2,anomaly=1')
+    parser.add_argument('--format', choices=('pickle', 'flat'), default='pickle')
+    args = parser.parse_args()
+
+    df = VoltageSpikePredictionModel().generate_training_data(args.samples, seed=args.seed)
+    report = train_models(df, args.out, jobs=args.jobs.split(','), cores=_parse_cores(args.cores),
+                          format=args.format)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,399 @@
+# tree_compiler.py
+# Compile fitted sklearn tree ensembles into flat NumPy node arrays
+#
+# Supported estimators: RandomForestClassifier (rpi_fence_detector.pkl),
+# RandomForestRegressor and IsolationForest (VoltageSpikePredictionModel).
+# A fitted StandardScaler can be folded into the split thresholds so the
+# compiled forest consumes raw, unscaled feature vectors.
+#
+# Outputs are bit-for-bit identical to the sklearn estimators evaluated with
+# n_jobs=1 (threaded sklearn sums the trees in a nondeterministic order).
+
+import json
+import time
+import warnings
+import numpy as np
+
+
+class CompiledForest:
+    """
+    Tree ensemble stored as flat node arrays
+
+    All trees share one node table. The two children of a split are stored next
+    to each other (right == left + 1) and leaves point to themselves with an
+    infinite threshold, so a batch is pushed down every tree at once for
+    max_depth levels without branching.
+    """
+
+    block_rows = 2048
+
+    def __init__(self, kind, feature, threshold, left, right, value, roots, max_depth,
+                 n_features, classes=None, offset=None, denominator=None):
+        self.kind = kind  # 'classifier', 'regressor' or 'isolation'
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.classes_ = classes
+        self.offset_ = offset
+        self.denominator = denominator
+
+    @property
+    def input_dtype(self):
+        return self.threshold.dtype
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_samples, n_trees)"""
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        X_flat = X.ravel()
+        row_offsets = (np.arange(X.shape[0], dtype=np.intp) * X.shape[1])[:, np.newaxis]
+        nodes = np.repeat(self.roots[np.newaxis, :], X.shape[0], axis=0)
+
+        # Level-by-level traversal of all trees for the whole batch
+        for _ in range(self.max_depth):
+            values = np.take(X_flat, row_offsets + np.take(self.feature, nodes))
+            go_right = values > np.take(self.threshold, nodes)
+            nodes = np.take(self.left, nodes) + go_right
+
+        return nodes
+
+    def _accumulate(self, X):
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        # Work through large batches in row blocks so the (rows, trees)
+        # temporaries stay cache-sized
+        total = np.empty((X.shape[0], self.value.shape[1]))
+        for start in range(0, X.shape[0], self.block_rows):
+            leaves = self.apply(X[start:start + self.block_rows])
+            # cumsum adds the trees one after another, in estimator order, like sklearn does
+            leaf_values = np.take(self.value, leaves, axis=0)
+            total[start:start + self.block_rows] = np.cumsum(leaf_values, axis=1)[:, -1]
+        return total
+
+    def predict_proba(self, X):
+        if self.kind != 'classifier':
+            raise AttributeError("predict_proba is only available for classifiers")
+        proba = self._accumulate(X)
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        if self.kind == 'classifier':
+            return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+        if self.kind == 'isolation':
+            decision = self.decision_function(X)
+            is_inlier = np.ones_like(decision, dtype=int)
+            is_inlier[decision < 0] = -1
+            return is_inlier
+
+        y_hat = self._accumulate(X)
+        y_hat /= self.n_trees
+        return y_hat[:, 0] if y_hat.shape[1] == 1 else y_hat
+
+    def score_samples(self, X):
+        if self.kind != 'isolation':
+            raise AttributeError("score_samples is only available for isolation forests")
+        depths = self._accumulate(X)[:, 0]
+        scores = 2 ** (
+            -np.divide(depths, self.denominator, out=np.ones_like(depths), where=self.denominator != 0)
+        )
+        return -scores
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+
+def _ordered_keys(values):
+    """Map floats to unsigned integers with the same total order (NaN excluded)"""
+    uint = np.uint32 if values.dtype == np.float32 else np.uint64
+    sign = uint(1) << uint(8 * values.dtype.itemsize - 1)
+    bits = values.view(uint)
+    return np.where(bits & sign, ~bits, bits | sign)
+
+
+def _from_ordered_keys(keys, dtype):
+    sign = keys.dtype.type(1) << keys.dtype.type(8 * keys.dtype.itemsize - 1)
+    bits = np.where(keys & sign, keys ^ sign, ~keys)
+    return bits.view(dtype)
+
+
+def _fold_thresholds(thresholds, columns, n_features, transform, input_dtype):
+    """
+    Find, for each split, the largest raw input value that still goes left
+
+    sklearn sends a sample left when float32(transform(x)) <= threshold. The
+    transform is monotone, so that set is exactly {x <= r} for some raw r of
+    the input dtype; r is found by bisection over the ordered float bit patterns,
+    all splits at once, evaluating the real transform at every step.
+    """
+    input_dtype = np.dtype(input_dtype)
+    largest = np.finfo(input_dtype).max
+    # sklearn rejects non-finite inputs, so the search covers finite values only
+    lo = np.repeat(_ordered_keys(np.array([-largest], dtype=input_dtype)), len(thresholds))
+    hi = np.repeat(_ordered_keys(np.array([largest], dtype=input_dtype)), len(thresholds))
+    rows = np.arange(len(thresholds))
+    probe = np.zeros((len(thresholds), n_features), dtype=input_dtype)
+
+    def goes_left(keys):
+        probe[rows, columns] = _from_ordered_keys(keys, input_dtype)
+        with np.errstate(over='ignore'):
+            return transform(probe)[rows, columns].astype(np.float32) <= thresholds
+
+    never_left = ~goes_left(lo)
+    lo = np.where(goes_left(hi), hi, lo)
+    one = lo.dtype.type(1)
+    while True:
+        active = (hi - lo) > one
+        if not active.any():
+            break
+        mid = np.where(active, lo + (hi - lo) // lo.dtype.type(2), lo)
+        left = goes_left(mid)
+        lo = np.where(active & left, mid, lo)
+        hi = np.where(active & ~left, mid, hi)
+
+    folded = _from_ordered_keys(lo, input_dtype)
+    folded[never_left] = -np.inf
+    return folded
+
+
+def _isolation_leaf_depths(forest, tree_idx, tree):
+    """Per-node path length contribution of one isolation tree"""
+    if hasattr(forest, '_decision_path_lengths'):
+        path_lengths = forest._decision_path_lengths[tree_idx]
+        average_lengths = forest._average_path_length_per_tree[tree_idx]
+    else:
+        from sklearn.ensemble._iforest import _average_path_length
+        depth = np.zeros(tree.node_count)
+        for node in range(tree.node_count):
+            if tree.children_left[node] != -1:
+                depth[tree.children_left[node]] = depth[node] + 1
+                depth[tree.children_right[node]] = depth[node] + 1
+        path_lengths = depth + 1.0
+        average_lengths = _average_path_length(tree.n_node_samples)
+    return path_lengths + average_lengths - 1.0
+
+
+def compile_forest(estimator, scaler=None, input_dtype=np.float32, scaler_columns=None):
+    """
+    Compile a fitted forest into a CompiledForest
+
+    Args:
+        estimator: fitted RandomForestClassifier, RandomForestRegressor or IsolationForest
+        scaler: optional fitted StandardScaler applied before the forest; it is
+                folded into the thresholds so the compiled model takes raw inputs
+        input_dtype: dtype of the raw inputs at inference time (the bridge uses
+                     float32, predict_voltage_spike builds float64 rows)
+        scaler_columns: scaler input column for each forest feature, when the
+                        forest only sees some of the scaled columns (e.g. the
+                        anomaly detector on features_scaled[:, :5])
+
+    Returns:
+        CompiledForest that reads raw rows of width scaler.n_features_in_
+        (or the estimator's width when no scaler is given)
+    """
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor, IsolationForest
+
+    if isinstance(estimator, RandomForestClassifier):
+        kind = 'classifier'
+        if estimator.n_outputs_ != 1:
+            raise ValueError(f"Multi-output classifiers are not supported (n_outputs_={estimator.n_outputs_})")
+    elif isinstance(estimator, RandomForestRegressor):
+        kind = 'regressor'
+    elif isinstance(estimator, IsolationForest):
+        kind = 'isolation'
+    else:
+        raise TypeError(f"Unsupported estimator: {type(estimator).__name__}")
+
+    n_model_features = estimator.n_features_in_
+    if scaler_columns is None:
+        scaler_columns = np.arange(n_model_features)
+    scaler_columns = np.asarray(scaler_columns, dtype=np.intp)
+    n_features = scaler.n_features_in_ if scaler is not None else n_model_features
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    max_depth = 0
+    offset = 0
+
+    for tree_idx, tree_estimator in enumerate(estimator.estimators_):
+        tree = tree_estimator.tree_
+
+        # Renumber breadth-first so that siblings are adjacent
+        order = [0]
+        for node in order:
+            if tree.children_left[node] != -1:
+                order.extend((tree.children_left[node], tree.children_right[node]))
+        order = np.array(order, dtype=np.intp)
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+
+        is_leaf = tree.children_left[order] == -1
+
+        # Tree feature -> forest feature -> raw input column
+        tree_features = np.where(is_leaf, 0, tree.feature[order])
+        if kind == 'isolation':
+            tree_features = np.asarray(estimator.estimators_features_[tree_idx])[tree_features]
+        features.append(scaler_columns[tree_features])
+
+        left = np.where(is_leaf, np.arange(len(order)), position[tree.children_left[order]])
+        lefts.append(left + offset)
+        rights.append(np.where(is_leaf, left, left + 1) + offset)
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+
+        if kind == 'classifier':
+            proba = tree.value[order, 0, :estimator.n_classes_]
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+            values.append(proba)
+        elif kind == 'regressor':
+            values.append(tree.value[order, :, 0])
+        else:
+            values.append(_isolation_leaf_depths(estimator, tree_idx, tree)[order, np.newaxis])
+
+        offset += tree.node_count
+
+    feature = np.concatenate(features).astype(np.int32)
+    threshold = np.concatenate(thresholds)
+    internal = np.isfinite(threshold)
+
+    if scaler is not None:
+        def transform(X):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                return scaler.transform(X)
+    else:
+        def transform(X):
+            return X
+
+    folded = np.full(len(threshold), np.inf, dtype=input_dtype)
+    folded[internal] = _fold_thresholds(threshold[internal], feature[internal], n_features,
+                                        transform, input_dtype)
+
+    classes = None
+    denominator = None
+    isolation_offset = None
+    if kind == 'classifier':
+        classes = estimator.classes_
+    elif kind == 'isolation':
+        from sklearn.ensemble._iforest import _average_path_length
+        denominator = len(estimator.estimators_) * _average_path_length([estimator._max_samples])
+        isolation_offset = estimator.offset_
+
+    return CompiledForest(
+        kind=kind,
+        feature=feature,
+        threshold=folded,
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max_depth,
+        n_features=n_features,
+        classes=classes,
+        offset=isolation_offset,
+        denominator=denominator
+    )
+
+
+def _time_call(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def benchmark(name, sklearn_fn, compiled_fn, X, repeats=20):
+    """Check bit-for-bit agreement and time single-sample and full-batch calls"""
+    identical = bool(np.array_equal(sklearn_fn(X), compiled_fn(X)))
+    single = X[:1]
+    result = {
+        'model': name,
+        'identical': identical,
+        'single_sample_ms': {
+            'sklearn': _time_call(lambda: sklearn_fn(single), repeats),
+            'compiled': _time_call(lambda: compiled_fn(single), repeats)
+        },
+        f'batch_{len(X)}_ms': {
+            'sklearn': _time_call(lambda: sklearn_fn(X), max(3, repeats // 5)),
+            'compiled': _time_call(lambda: compiled_fn(X), max(3, repeats // 5))
+        }
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+# Example usage and benchmarking
+if __name__ == "__main__":
+    import os
+    import argparse
+    import joblib
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Compile and benchmark tree ensembles')
+    parser.add_argument('--model-dir', default=script_dir,
+                        help='directory with rpi_fence_detector.pkl and rpi_scaler.pkl')
+    parser.add_argument('--spike-model-dir',
+                        help='directory written by VoltageSpikePredictionModel.save_models')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    # Fence detector: float32 raw features, scaler folded into the thresholds
+    fence_model = joblib.load(os.path.join(args.model_dir, 'rpi_fence_detector.pkl'))
+    fence_scaler = joblib.load(os.path.join(args.model_dir, 'rpi_scaler.pkl'))
+    fence_model.n_jobs = 1
+
+    start = time.perf_counter()
+    compiled_fence = compile_forest(fence_model, scaler=fence_scaler, input_dtype=np.float32)
+    print(f"Compiled fence detector ({compiled_fence.n_trees} trees, "
+          f"{len(compiled_fence.feature)} nodes) in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    X = rng.normal(fence_scaler.mean_, fence_scaler.scale_,
+                   (args.batch_size, fence_scaler.n_features_in_)).astype(np.float32)
+    benchmark('rpi_fence_detector',
+              lambda X: fence_model.predict_proba(fence_scaler.transform(X)),
+              compiled_fence.predict_proba, X)
+
+    # Voltage spike models: float64 rows of the 20 engineered features
+    if args.spike_model_dir:
+        rf_model = joblib.load(os.path.join(args.spike_model_dir, 'rf_model.pkl'))
+        anomaly_detector = joblib.load(os.path.join(args.spike_model_dir, 'anomaly_detector.pkl'))
+        spike_scaler = joblib.load(os.path.join(args.spike_model_dir, 'scaler.pkl'))
+        rf_model.n_jobs = 1
+
+        compiled_rf = compile_forest(rf_model, scaler=spike_scaler, input_dtype=np.float64)
+        anomaly_scaler_path = os.path.join(args.spike_model_dir, 'anomaly_scaler.pkl')
+        anomaly_scaler = joblib.load(anomaly_scaler_path) if os.path.exists(anomaly_scaler_path) else spike_scaler
+        compiled_anomaly = compile_forest(anomaly_detector, scaler=anomaly_scaler, input_dtype=np.float64,
+                                          scaler_columns=np.arange(anomaly_detector.n_features_in_))
+
+        X = rng.normal(spike_scaler.mean_, spike_scaler.scale_, (args.batch_size, spike_scaler.n_features_in_))
+
+        def scaled(X, scaler=spike_scaler):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                return scaler.transform(X[:, :scaler.n_features_in_])
+
+        benchmark('rf_model', lambda X: rf_model.predict(scaled(X)), compiled_rf.predict, X)
+        benchmark('anomaly_detector',
+                  lambda X: anomaly_detector.decision_function(
+                      scaled(X, anomaly_scaler)[:, :anomaly_detector.n_features_in_]),
+                  lambda X: compiled_anomaly.decision_function(X[:, :anomaly_scaler.n_features_in_]), X)